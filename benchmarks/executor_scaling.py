@@ -0,0 +1,71 @@
+"""Matching throughput of the generation executor backends as the number of workers grows.
+
+Usage (from the repository root):
+
+    python -m benchmarks.executor_scaling
+    python -m benchmarks.executor_scaling --proteins 20000 --peptides 50000 --workers 1 2 4 8 --backends processes cluster
+
+Every backend matches the same synthetic peptide batches with the generation worker function. The
+cluster backend runs against local stand-in worker servers (tools.executors.LocalCluster). Speedup is
+relative to the serial backend; on n free cores a backend scales well when it is close to n.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from ptmdatabase.tools.executors import LocalCluster, make_executor
+from ptmdatabase.tools.generation import BATCHES_PER_WORKER, PEPTIDE_BATCH_SIZE, process_peptide_batch
+from ptmdatabase.tools.proteome import load_proteome
+from benchmarks.synthetic import synthetic_proteome, synthetic_peptides, write_proteome
+
+def matching_time(backend, workers, tasks, addresses=None, authkey=None):
+    with make_executor(backend, workers, addresses, authkey) as executor:
+        start = time.perf_counter()
+        for _ in executor.imap(process_peptide_batch, tasks, executor.workers * BATCHES_PER_WORKER):
+            pass
+        return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure matching throughput per executor backend and worker count.")
+    parser.add_argument('--proteins', type=int, default=5000, help="Number of synthetic proteins.")
+    parser.add_argument('--peptides', type=int, default=20000, help="Number of modified peptides.")
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4], help="Worker counts to measure.")
+    parser.add_argument('--backends', nargs='*', default=['threads', 'processes', 'cluster'], help="Backends to measure.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    uniprot_sequences = synthetic_proteome(args.proteins, seed=args.seed)
+    peptides = synthetic_peptides(uniprot_sequences, args.peptides, seed=args.seed, ptm_mix={'Phosphorylation': 1.0})
+    with tempfile.TemporaryDirectory() as workdir:
+        fasta_file = os.path.join(workdir, 'proteome.fasta')
+        write_proteome(fasta_file, uniprot_sequences)
+        proteome = load_proteome(fasta_file)
+        tasks = [('Phosphorylation', peptides[i:i + PEPTIDE_BATCH_SIZE], proteome) for i in range(0, len(peptides), PEPTIDE_BATCH_SIZE)]
+
+        serial = matching_time('serial', 1, tasks)
+        results = [{'backend': 'serial', 'workers': 1, 'seconds': serial, 'peptides_per_s': len(peptides) / serial, 'speedup': 1.0}]
+        for backend in args.backends:
+            for workers in args.workers:
+                if backend == 'cluster':
+                    with LocalCluster(workers) as cluster:
+                        seconds = matching_time(backend, workers, tasks, cluster.addresses, cluster.authkey)
+                else:
+                    seconds = matching_time(backend, workers, tasks)
+                results.append({'backend': backend, 'workers': workers, 'seconds': seconds,
+                                'peptides_per_s': len(peptides) / seconds, 'speedup': serial / seconds})
+
+    print(f"{len(peptides)} peptides, {args.proteins} proteins, {os.cpu_count()} CPUs")
+    for row in results:
+        print(f"{row['backend']:<10} {row['workers']:>3} workers  {row['seconds']:8.2f} s  "
+              f"{row['peptides_per_s']:10.0f} peptides/s  speedup {row['speedup']:.2f}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
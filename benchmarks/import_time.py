@@ -0,0 +1,97 @@
+"""Cold-start benchmark: module import times and process-pool worker spawn time.
+
+Usage (from the repository root):
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --workers 8 --repeat 5 --output import_times.json
+
+Every import is measured in a fresh interpreter so nothing is cached in sys.modules. Worker spawn time
+is the time for a 'spawn' pool to start and import the generation engine in every worker, which is
+what a generation run pays before matching starts.
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENGINE_MODULES = [
+    'ptmdatabase.tools.database_tools',
+    'ptmdatabase.tools.generation',
+    'ptmdatabase.tools.generation_jobs',
+    'ptmdatabase.tools.matrix_tools',
+    'ptmdatabase.tools.proteome',
+    'ptmdatabase.library',
+]
+
+# Heavy third-party modules; an engine module that pulls one in at import time shows up here
+HEAVY_MODULES = ['Bio', 'pandas', 'matplotlib', 'matplotlib_venn', 'tqdm', 'streamlit']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+def cold_import(module, repo_root):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=repo_root, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(output[0]), output[1].split(',') if len(output) > 1 else []
+
+def import_in_worker(module):
+    start = time.perf_counter()
+    importlib.import_module(module)
+    return time.perf_counter() - start
+
+# Wall time for a spawn pool to come up and import the module in every worker
+def worker_spawn_time(module, workers):
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with context.Pool(workers) as pool:
+        worker_imports = pool.map(import_in_worker, [module] * workers, chunksize=1)
+    return time.perf_counter() - start, max(worker_imports)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import and pool worker spawn times.")
+    parser.add_argument('--modules', nargs='*', default=ENGINE_MODULES, help="Modules to import.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (the median is reported).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Pool size for the spawn measurement.")
+    parser.add_argument('--worker-module', default='ptmdatabase.tools.generation', help="Module imported by every pool worker.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    results = {'imports': [], 'worker_spawn': None}
+    for module in args.modules:
+        runs = [cold_import(module, repo_root) for _ in range(args.repeat)]
+        seconds = statistics.median(elapsed for elapsed, _ in runs)
+        heavy = runs[-1][1]
+        results['imports'].append({'module': module, 'import_s': seconds, 'heavy_modules_loaded': heavy})
+        print(f"{module:<40} {seconds * 1000:8.1f} ms  heavy: {', '.join(heavy) or '-'}")
+
+    spawns = [worker_spawn_time(args.worker_module, args.workers) for _ in range(args.repeat)]
+    results['worker_spawn'] = {
+        'module': args.worker_module,
+        'workers': args.workers,
+        'pool_start_s': statistics.median(total for total, _ in spawns),
+        'slowest_worker_import_s': statistics.median(worker for _, worker in spawns),
+    }
+    print(f"Spawn pool of {args.workers} importing {args.worker_module}: "
+          f"{results['worker_spawn']['pool_start_s'] * 1000:.1f} ms "
+          f"(slowest worker import {results['worker_spawn']['slowest_worker_import_s'] * 1000:.1f} ms)")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
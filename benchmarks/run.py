@@ -0,0 +1,171 @@
+"""Offline performance benchmarks for the generation pipeline and the Matrix_analysis aggregation.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --preset small
+    python -m benchmarks.run --proteins 20000 --peptides 50000 --shared-rate 0.2 --save-baseline
+    python -m benchmarks.run --preset medium --baseline benchmarks/baselines.json --tolerance 0.25
+
+Every stage is timed on deterministic synthetic data and compared against the stored baseline for
+the same scenario; the command exits with status 1 when a stage is slower than baseline * (1 + tolerance),
+and with status 2 when the scenario or one of its stages has no baseline (record one with
+--save-baseline). benchmarks/baselines.json holds baselines for the small and medium presets; they are
+wall times of one machine, so re-record them with --save-baseline on the machine that runs the check.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from ptmdatabase.tools.database_tools import load_uniprot_sequences, write_fasta
+from ptmdatabase.tools.generation import build_worker_args
+from ptmdatabase.tools.matrix_tools import aggregate_matrix_file
+from ptmdatabase.tools.proteome import load_proteome
+from ptmdatabase.tools.run_report import RunReport, report_table
+from benchmarks.synthetic import (
+    DEFAULT_PTM_MIX,
+    synthetic_proteome,
+    synthetic_peptides,
+    write_proteome,
+    write_peptide_list,
+    write_psm_table,
+)
+
+PRESETS = {
+    'small': {'proteins': 1000, 'peptides': 1000},
+    'medium': {'proteins': 20000, 'peptides': 10000},
+    'large': {'proteins': 100000, 'peptides': 1000000},
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+def parse_ptm_mix(text):
+    if not text:
+        return dict(DEFAULT_PTM_MIX)
+    ptm_mix = {}
+    for item in text.split(','):
+        name, weight = item.split('=')
+        ptm_mix[name.strip()] = float(weight)
+    return ptm_mix
+
+def scenario_name(args):
+    return f"proteins={args.proteins},peptides={args.peptides},shared={args.shared_rate},seed={args.seed},mix={args.ptm_mix or 'default'}"
+
+def run_benchmark(args, workdir):
+    ptm_mix = parse_ptm_mix(args.ptm_mix)
+    uniprot_sequences = synthetic_proteome(args.proteins, seed=args.seed)
+    peptides = synthetic_peptides(uniprot_sequences, args.peptides, seed=args.seed, shared_rate=args.shared_rate, ptm_mix=ptm_mix)
+
+    fasta_file = os.path.join(workdir, 'proteome.fasta')
+    peptide_file = os.path.join(workdir, 'peptides.tsv')
+    psm_file = os.path.join(workdir, 'psm.tsv')
+    output_file = os.path.join(workdir, 'generated.fasta')
+    write_proteome(fasta_file, uniprot_sequences)
+    write_peptide_list(peptide_file, peptides)
+    write_psm_table(psm_file, peptides, uniprot_sequences, seed=args.seed)
+
+    report = RunReport(scenario_name(args), {'ptm_mix': ptm_mix})
+    with report.stage('load_uniprot_sequences') as record:
+        record['items'] = len(load_uniprot_sequences(fasta_file))
+    # Generation runs on the memory-mapped proteome (first call builds its sidecar files)
+    with report.stage('load_proteome') as record:
+        uniprot_sequences = load_proteome(fasta_file)
+        record['items'] = len(uniprot_sequences)
+
+    # Matching runs in-process on the same worker functions the generation pool uses
+    ptm_entries, inferred_protein_ids = [], set()
+    for ptm_type in ptm_mix:
+        stage = 'generate_ptm_entries_glyco' if 'Glycosylation' in ptm_type else 'generate_ptm_entries'
+        worker, worker_args = build_worker_args(ptm_type, [peptides], uniprot_sequences)
+        with report.stage(f"{stage}[{ptm_type}]", items=len(peptides)):
+            entries, _, inferred_ids = worker(worker_args[0])
+        ptm_entries.extend(entries)
+        inferred_protein_ids.update(inferred_ids)
+
+    with report.stage('write_fasta', items=len(ptm_entries)) as record:
+        record['output_stats'] = write_fasta(output_file, uniprot_sequences, ptm_entries, inferred_protein_ids, True)
+    with report.stage('matrix_aggregation') as record:
+        aggregate = aggregate_matrix_file(psm_file, {}, {})
+        record['items'] = len(aggregate['sites'])
+    return report.to_dict()
+
+# A stage regresses when it is slower than baseline * (1 + tolerance) by more than min_delta seconds,
+# so sub-millisecond stages do not flag on timer noise. Returns the regressions and the stages that
+# have no baseline.
+def compare_to_baseline(report, baseline, tolerance, min_delta=0.05):
+    regressions, missing = [], []
+    for stage in report['stages']:
+        reference = baseline.get(stage['stage'])
+        if reference is None:
+            missing.append(stage['stage'])
+            continue
+        ratio = stage['wall_time_s'] / reference if reference > 0 else 1.0
+        stage['baseline_wall_time_s'] = reference
+        stage['ratio'] = ratio
+        if ratio > 1 + tolerance and stage['wall_time_s'] - reference > min_delta:
+            regressions.append((stage['stage'], reference, stage['wall_time_s'], ratio))
+    return regressions, missing
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PTM database pipeline on synthetic data.")
+    parser.add_argument('--preset', choices=sorted(PRESETS), help="Predefined proteome/peptide sizes.")
+    parser.add_argument('--proteins', type=int, default=1000, help="Number of synthetic proteins (1k-100k).")
+    parser.add_argument('--peptides', type=int, default=1000, help="Number of modified peptides (1k-1M).")
+    parser.add_argument('--shared-rate', type=float, default=0.1, help="Fraction of peptides planted in a second protein.")
+    parser.add_argument('--ptm-mix', default='', help="Comma-separated PTM weights, e.g. 'Phosphorylation=0.8,Acetylation=0.2'.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Directory for the generated inputs/outputs (default: a temporary directory).")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline for the scenario.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before a stage is flagged.")
+    parser.add_argument('--min-delta', type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds.")
+    parser.add_argument('--output', help="Write the full JSON report to this file.")
+    args = parser.parse_args(argv)
+    if args.preset:
+        args.proteins = PRESETS[args.preset]['proteins']
+        args.peptides = PRESETS[args.preset]['peptides']
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = run_benchmark(args, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = run_benchmark(args, workdir)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    scenario = scenario_name(args)
+    regressions, missing = compare_to_baseline(report, baselines.get(scenario, {}), args.tolerance, args.min_delta)
+
+    print(f"Scenario: {scenario}")
+    for row in report_table(report):
+        print('  '.join(f"{key}: {value}" for key, value in row.items()))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        baselines[scenario] = {stage['stage']: stage['wall_time_s'] for stage in report['stages']}
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        for stage, reference, current, ratio in regressions:
+            print(f"REGRESSION {stage}: {current:.3f}s vs baseline {reference:.3f}s ({ratio:.2f}x)")
+        return 1
+    if missing:
+        if scenario not in baselines:
+            print(f"NO BASELINE for this scenario in {args.baseline}; nothing was checked. Record one with --save-baseline.")
+        else:
+            print(f"NO BASELINE for stages {', '.join(missing)} in {args.baseline}; they were not checked. Re-record with --save-baseline.")
+        return 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
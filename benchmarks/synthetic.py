@@ -0,0 +1,130 @@
+import random
+
+# Deterministic synthetic inputs for the benchmarks: a UniProt-style proteome and modified-peptide
+# lists drawn from it. The same seed and sizes always produce byte-identical files.
+
+# Approximate human proteome residue frequencies (%)
+RESIDUE_FREQUENCIES = {
+    'A': 7.0, 'R': 5.6, 'N': 3.6, 'D': 4.7, 'C': 2.3, 'Q': 4.8, 'E': 7.1, 'G': 6.6, 'H': 2.6, 'I': 4.3,
+    'L': 9.9, 'K': 5.7, 'M': 2.1, 'F': 3.7, 'P': 6.3, 'S': 8.3, 'T': 5.4, 'W': 1.2, 'Y': 2.7, 'V': 6.0,
+}
+
+# Residues and annotations used for each PTM type, in the notation the matrix files use
+PTM_ANNOTATIONS = {
+    'Phosphorylation': ('STY', '79.9663'),
+    'Acetylation': ('K', '42.0106'),
+    'Ubiquitination': ('K', '114.0429'),
+    'N-linked Glycosylation': ('N', 'H5N4F1'),
+    'O-linked Glycosylation': ('ST', 'H1N1'),
+}
+
+DEFAULT_PTM_MIX = {'Phosphorylation': 0.7, 'Acetylation': 0.1, 'Ubiquitination': 0.1, 'N-linked Glycosylation': 0.05, 'O-linked Glycosylation': 0.05}
+
+def random_sequence(rng, length):
+    residues = list(RESIDUE_FREQUENCIES)
+    weights = list(RESIDUE_FREQUENCIES.values())
+    return 'M' + ''.join(rng.choices(residues, weights=weights, k=length - 1))
+
+def synthetic_proteome(n_proteins, seed=0, min_length=100, max_length=1000):
+    rng = random.Random(f"proteome:{seed}")
+    uniprot_sequences = {}
+    for i in range(1, n_proteins + 1):
+        protein_id = f"S{i:07d}"
+        header = f"sp|{protein_id}|SYN{i}_HUMAN Synthetic protein {i} OS=Homo sapiens OX=9606 GN=SYN{i} PE=1 SV=1"
+        uniprot_sequences[protein_id] = {'header': header, 'sequence': random_sequence(rng, rng.randint(min_length, max_length))}
+    return uniprot_sequences
+
+def tryptic_peptides(sequence, min_length=7, max_length=30):
+    peptides = []
+    start = 0
+    for i, residue in enumerate(sequence):
+        if residue in 'KR' and (i + 1 == len(sequence) or sequence[i + 1] != 'P'):
+            if min_length <= i + 1 - start <= max_length:
+                peptides.append((start, sequence[start:i + 1]))
+            start = i + 1
+    return peptides
+
+def annotate(rng, peptide, ptm_type):
+    residues, annotation = PTM_ANNOTATIONS[ptm_type]
+    sites = [i for i, residue in enumerate(peptide) if residue in residues]
+    if not sites:
+        return peptide
+    chosen = sorted(rng.sample(sites, min(len(sites), rng.choice((1, 1, 1, 2)))))
+    pieces, previous = [], 0
+    for site in chosen:
+        pieces.append(peptide[previous:site + 1])
+        pieces.append(f"[{annotation}]")
+        previous = site + 1
+    pieces.append(peptide[previous:])
+    return ''.join(pieces)
+
+# Draw n_peptides modified peptides from the proteome. A shared_rate fraction of them is also planted
+# into a second protein (so it maps to several proteins) and a missing_rate fraction is random
+# sequence absent from the proteome. The proteome dict is modified in place for shared peptides.
+def synthetic_peptides(uniprot_sequences, n_peptides, seed=0, shared_rate=0.1, missing_rate=0.02, ptm_mix=None):
+    rng = random.Random(f"peptides:{seed}")
+    ptm_mix = ptm_mix or DEFAULT_PTM_MIX
+    ptm_types = list(ptm_mix)
+    ptm_weights = [ptm_mix[ptm_type] for ptm_type in ptm_types]
+    protein_ids = list(uniprot_sequences)
+
+    peptides = []
+    while len(peptides) < n_peptides:
+        ptm_type = rng.choices(ptm_types, weights=ptm_weights)[0]
+        if rng.random() < missing_rate:
+            peptide = random_sequence(rng, rng.randint(8, 20))[1:] + 'K'
+            peptides.append(annotate(rng, peptide, ptm_type))
+            continue
+
+        protein_id = rng.choice(protein_ids)
+        candidates = tryptic_peptides(uniprot_sequences[protein_id]['sequence'])
+        if not candidates:
+            continue
+        _, peptide = rng.choice(candidates)
+
+        if rng.random() < shared_rate and len(protein_ids) > 1:
+            other_id = rng.choice(protein_ids)
+            if other_id != protein_id:
+                other = uniprot_sequences[other_id]['sequence']
+                position = rng.randint(1, len(other))
+                uniprot_sequences[other_id]['sequence'] = other[:position] + 'K' + peptide + other[position:]
+
+        peptides.append(annotate(rng, peptide, ptm_type))
+    return peptides
+
+def write_proteome(output_file, uniprot_sequences, line_length=60):
+    with open(output_file, 'w') as file:
+        for data in uniprot_sequences.values():
+            sequence = data['sequence']
+            file.write(f">{data['header']}\n")
+            file.write('\n'.join(sequence[i:i + line_length] for i in range(0, len(sequence), line_length)))
+            file.write('\n')
+
+def write_peptide_list(output_file, peptides):
+    with open(output_file, 'w') as file:
+        file.write('Peptide\n')
+        for peptide in peptides:
+            file.write(f"{peptide}\n")
+
+# PSM table in the layout Matrix_analysis reads (Protein ID, Peptide, Assigned Modifications), with
+# psms_per_peptide rows per peptide to mimic repeated identifications
+def write_psm_table(output_file, peptides, uniprot_sequences, seed=0, psms_per_peptide=3):
+    rng = random.Random(f"psms:{seed}")
+    protein_ids = list(uniprot_sequences)
+    with open(output_file, 'w') as file:
+        file.write('Spectrum\tPeptide\tProtein ID\tAssigned Modifications\n')
+        spectrum = 0
+        for peptide in peptides:
+            clean, modifications, i = '', [], 0
+            while i < len(peptide):
+                if peptide[i] == '[':
+                    end = peptide.index(']', i)
+                    modifications.append(f"{len(clean)}{clean[-1]}({peptide[i + 1:end]})")
+                    i = end + 1
+                else:
+                    clean += peptide[i]
+                    i += 1
+            protein_id = rng.choice(protein_ids)
+            for _ in range(rng.randint(1, psms_per_peptide)):
+                spectrum += 1
+                file.write(f"scan.{spectrum}\t{clean}\t{protein_id}\t{', '.join(modifications)}\n")
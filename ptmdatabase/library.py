@@ -0,0 +1,229 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .tools.database_tools import load_uniprot_sequences, format_fasta_sequence
+from .tools.library_index import build_library_index
+
+# PTM library build (replaces the per-PTM cells of Database_library/Original_database_generation.ipynb).
+# The UniProt proteome is loaded once, every dbPTM file (https://awi.cuhk.edu.cn/dbPTM/download.php) is
+# parsed once, and the five PTM-specific libraries plus the combined libraries are written concurrently.
+# numpy, pandas and pyarrow are imported inside the functions that parse dbPTM files, so importing the
+# module (the pages, `--help`) stays fast.
+
+# PTM type -> (site code used in headers and sequence annotations, library file name)
+LIBRARY_PTMS = {
+    'Phosphorylation': ('P', 'Phosphosite.fasta'),
+    'N-linked Glycosylation': ('nG', 'N-linked_Glycosite.fasta'),
+    'O-linked Glycosylation': ('oG', 'O-linked_Glycosite.fasta'),
+    'Acetylation': ('A', 'Acetylation.fasta'),
+    'Ubiquitination': ('U', 'Ubiquitinsite.fasta'),
+}
+
+# Combined libraries contain every proteome entry followed by the entries of the listed PTM types
+COMBINED_LIBRARIES = {
+    'Combined_database.fasta': list(LIBRARY_PTMS),
+    'Glycosylation_combined.fasta': ['O-linked Glycosylation', 'N-linked Glycosylation'],
+}
+
+# dbPTM text files are headerless TSVs: protein name, UniProt ID, site position, modification type,
+# PubMed IDs, flanking peptide. Only the UniProt ID and the position are kept.
+DBPTM_COLUMNS = ['protein_name', 'uniprot_id', 'site_position', 'modification_type', 'pubmed_ids', 'peptide_sequence']
+DBPTM_CHUNK_SIZE = 1000000
+
+# pandas read_csv engine for dbPTM files: pyarrow when it is installed
+def dbptm_engine():
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+def clean_modification_chunk(chunk, code):
+    import numpy as np
+    import pandas as pd
+    # Malformed lines (missing fields, non-numeric positions) are dropped
+    positions = pd.to_numeric(chunk['site_position'], errors='coerce')
+    valid = positions.notna() & chunk['uniprot_id'].notna()
+    return pd.DataFrame({
+        'uniprot_id': chunk['uniprot_id'][valid].astype('category').cat.remove_unused_categories(),
+        'site_position': positions[valid].astype(np.int32),
+        'mod_code': pd.Categorical.from_codes(np.zeros(int(valid.sum()), dtype=np.int8), [code]),
+    })
+
+# Columnar dbPTM parser: returns a DataFrame with uniprot_id (category), site_position (int32) and
+# mod_code (category), a few bytes per site. Large files are streamed in chunks with the C engine;
+# pyarrow reads them multithreaded in one pass when it is installed.
+def parse_modification_file(file_path, mod_type):
+    import numpy as np
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+    code = LIBRARY_PTMS[mod_type][0]
+    read_options = dict(sep='\t', header=None, names=DBPTM_COLUMNS, usecols=['uniprot_id', 'site_position'],
+                        dtype={'uniprot_id': 'category', 'site_position': str}, on_bad_lines='skip')
+    frames = []
+
+    # An empty file has no sites; a missing file (OSError) or an unreadable one fails the build
+    try:
+        if dbptm_engine() == 'pyarrow':
+            chunks = [pd.read_csv(file_path, engine='pyarrow', **read_options)]
+        else:
+            chunks = pd.read_csv(file_path, chunksize=DBPTM_CHUNK_SIZE, **read_options)
+        frames = [clean_modification_chunk(chunk, code) for chunk in chunks]
+    except pd.errors.EmptyDataError:
+        frames = []
+    except ValueError as e:
+        raise ValueError(f"Could not parse the {mod_type} dbPTM file {file_path}: {e}") from e
+
+    if not frames:
+        return pd.DataFrame({
+            'uniprot_id': pd.Categorical([]),
+            'site_position': np.array([], dtype=np.int32),
+            'mod_code': pd.Categorical([]),
+        })
+    return pd.DataFrame({
+        'uniprot_id': union_categoricals([frame['uniprot_id'] for frame in frames], sort_categories=True),
+        'site_position': np.concatenate([frame['site_position'].to_numpy() for frame in frames]),
+        'mod_code': union_categoricals([frame['mod_code'] for frame in frames]),
+    })
+
+# Group dbPTM sites by protein: returns [(uniprot_id, sorted unique site positions)] for proteins present
+# in the proteome, dropping sites outside the protein sequence
+def group_modification_sites(modifications, uniprot_sequences):
+    site_groups = []
+    sites = modifications[['uniprot_id', 'site_position']].drop_duplicates().sort_values(['uniprot_id', 'site_position'])
+    for uniprot_id, protein_sites in sites.groupby('uniprot_id', observed=True, sort=True)['site_position']:
+        if uniprot_id not in uniprot_sequences:
+            continue
+        length = len(uniprot_sequences[uniprot_id]['sequence'])
+        positions = protein_sites.to_numpy()
+        positions = positions[(positions >= 1) & (positions <= length)].tolist()
+        if positions:
+            site_groups.append((uniprot_id, positions))
+    return site_groups
+
+# Split a protein's sites into entries of at most max_sites_per_entry sites (0 = all sites in one entry)
+def split_sites(positions, max_sites_per_entry=1):
+    if max_sites_per_entry <= 0:
+        return [positions]
+    return [positions[i:i + max_sites_per_entry] for i in range(0, len(positions), max_sites_per_entry)]
+
+# Render one library entry: header sp|ID|S15P_T20P|NAME_HUMAN description, sequence annotated as S(P)...T(P),
+# built from slices of the protein sequence with a single join
+def render_modification_entry(protein_data, positions, code):
+    protein_sequence = protein_data['sequence']
+    pieces, sites = [], []
+    previous = 0
+    for position in positions:
+        pieces.append(protein_sequence[previous:position])
+        pieces.append(f"({code})")
+        sites.append(f"{protein_sequence[position - 1]}{position}{code}")
+        previous = position
+    pieces.append(protein_sequence[previous:])
+
+    original_header_parts = protein_data['header'].split(' ')
+    protein_id_part = original_header_parts[0].split('|')
+    new_header = f"{protein_id_part[0]}|{protein_id_part[1]}|{'_'.join(sites)}|{protein_id_part[2]} {' '.join(original_header_parts[1:])}"
+    return new_header, ''.join(pieces)
+
+# Entries are rendered lazily while writing, so no library is ever held in memory as a whole
+def iter_modification_entries(site_groups, uniprot_sequences, code, max_sites_per_entry=1):
+    for uniprot_id, positions in site_groups:
+        for entry_positions in split_sites(positions, max_sites_per_entry):
+            yield render_modification_entry(uniprot_sequences[uniprot_id], entry_positions, code)
+
+def count_modification_entries(site_groups, max_sites_per_entry=1):
+    return sum(len(split_sites(positions, max_sites_per_entry)) for _, positions in site_groups)
+
+def write_library_fasta(output_file, modification_entries, protein_entries=None):
+    with open(output_file, 'w') as file:
+        # Write original protein entries
+        if protein_entries is not None:
+            for data in protein_entries.values():
+                file.write(f">{data['header']}\n{format_fasta_sequence(data['sequence'])}\n")
+
+        # Write modification entries
+        for entries in modification_entries:
+            for header, sequence in entries:
+                file.write(f">{header}\n{format_fasta_sequence(sequence)}\n")
+    return output_file
+
+# Build every library for which a dbPTM file is given. dbptm_files maps PTM type -> dbPTM text file.
+# max_sites_per_entry caps how many sites of one protein share an entry (1 = one entry per site,
+# 0 = one entry per protein). With build_index, every library also gets its random-access SQLite index.
+# Returns {output file: number of modification entries}.
+def build_libraries(dbptm_files, fasta_file, output_dir, max_workers=None, max_sites_per_entry=1, build_index=False):
+    os.makedirs(output_dir, exist_ok=True)
+    unknown = set(dbptm_files) - set(LIBRARY_PTMS)
+    if unknown:
+        raise ValueError(f"Unsupported PTM types: {', '.join(sorted(unknown))}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Parse every dbPTM file once while the proteome loads
+        parse_futures = {ptm_type: executor.submit(parse_modification_file, path, ptm_type) for ptm_type, path in dbptm_files.items()}
+        uniprot_sequences = load_uniprot_sequences(fasta_file)
+        site_groups = {ptm_type: group_modification_sites(future.result(), uniprot_sequences) for ptm_type, future in parse_futures.items()}
+
+        def entries_for(ptm_type):
+            return iter_modification_entries(site_groups[ptm_type], uniprot_sequences, LIBRARY_PTMS[ptm_type][0], max_sites_per_entry)
+
+        def entry_count(ptm_types):
+            return sum(count_modification_entries(site_groups[ptm_type], max_sites_per_entry) for ptm_type in ptm_types)
+
+        write_futures = {}
+        for ptm_type in site_groups:
+            output_file = os.path.join(output_dir, LIBRARY_PTMS[ptm_type][1])
+            write_futures[output_file] = (executor.submit(write_library_fasta, output_file, [entries_for(ptm_type)]), entry_count([ptm_type]))
+        for output_name, ptm_types in COMBINED_LIBRARIES.items():
+            included = [ptm_type for ptm_type in ptm_types if ptm_type in site_groups]
+            if not included:
+                continue
+            output_file = os.path.join(output_dir, output_name)
+            entries = [entries_for(ptm_type) for ptm_type in included]
+            write_futures[output_file] = (executor.submit(write_library_fasta, output_file, entries, uniprot_sequences), entry_count(included))
+
+        summary = {}
+        index_futures = []
+        for output_file, (future, n_entries) in write_futures.items():
+            future.result()
+            summary[output_file] = n_entries
+            if build_index:
+                index_futures.append(executor.submit(build_library_index, output_file))
+        for future in index_futures:
+            future.result()
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the PTM-specific and combined FASTA libraries from dbPTM files.")
+    parser.add_argument('--fasta', required=True, help="UniProt FASTA file (e.g. uniprot_sprot.fasta).")
+    parser.add_argument('--output-dir', required=True, help="Directory for the generated libraries.")
+    parser.add_argument('--phosphorylation', help="dbPTM Phosphorylation.txt")
+    parser.add_argument('--n-glycosylation', help="dbPTM N-linked Glycosylation.txt")
+    parser.add_argument('--o-glycosylation', help="dbPTM O-linked Glycosylation.txt")
+    parser.add_argument('--acetylation', help="dbPTM Acetylation.txt")
+    parser.add_argument('--ubiquitination', help="dbPTM Ubiquitination.txt")
+    parser.add_argument('--workers', type=int, default=None, help="Number of parser/writer threads.")
+    parser.add_argument('--max-sites-per-entry', type=int, default=1,
+                        help="Maximum number of sites of one protein per entry (1 = one entry per site, 0 = one entry per protein).")
+    parser.add_argument('--index', action='store_true', help="Also build a random-access index (.index.sqlite) for every library.")
+    args = parser.parse_args(argv)
+
+    dbptm_files = {
+        'Phosphorylation': args.phosphorylation,
+        'N-linked Glycosylation': args.n_glycosylation,
+        'O-linked Glycosylation': args.o_glycosylation,
+        'Acetylation': args.acetylation,
+        'Ubiquitination': args.ubiquitination,
+    }
+    dbptm_files = {ptm_type: path for ptm_type, path in dbptm_files.items() if path}
+    if not dbptm_files:
+        parser.error("Provide at least one dbPTM file.")
+
+    start_time = time.time()
+    summary = build_libraries(dbptm_files, args.fasta, args.output_dir, args.workers, args.max_sites_per_entry, args.index)
+    for output_file, n_entries in summary.items():
+        print(f"{output_file}: {n_entries} modification entries")
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,15 @@
 import streamlit as st
-import pandas as pd
 import os
 import sys
-from Bio import SeqIO
 import time
-from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from tools.database_tools import (
-    parse_matrix_file, 
-    load_uniprot_sequences, 
-    load_ptm_sequences, 
-    generate_ptm_entries, 
-    write_fasta, 
-    write_missing_info, 
-    count_entries_in_fasta,
-    generate_ptm_entries_glyco,
-)
+from tools.generation import PTM_TYPES
+from tools.database_tools import DECOY_METHODS, DECOY_PREFIX, check_letter_codes_cover, parse_letter_codes
+from tools.executors import EXECUTOR_BACKENDS
+from tools.generation_jobs import submit_generation_job, list_jobs
+from tools.run_report import report_table
+from tools.profiling import PROFILE_MODES, DEFAULT_PROFILE_MODE
+from tools.search_space import ENZYMES, compare_search_space, generation_encoding
 
 def initialize_session_state():
     base_dir = Path(__file__).resolve().parent.parent
@@ -31,51 +24,68 @@ def initialize_session_state():
     if 'missing_info_file' not in st.session_state:
         st.session_state['missing_info_file'] = ""
 
-def process_peptide_phosphorylation(args):
-    chunk, uniprot_sequences = args
-    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
-    for peptide in chunk:
-        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Phosphorylation')
-        ptm_entries.extend(entries)
-        missing_peptides.extend(peptides)
-        inferred_protein_ids.update(inferred_ids)
-    return ptm_entries, missing_peptides, inferred_protein_ids
-
-def process_peptide_acetylation(args):
-    chunk, uniprot_sequences = args
-    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
-    for peptide in chunk:
-        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Acetylation')
-        ptm_entries.extend(entries)
-        missing_peptides.extend(peptides)
-        inferred_protein_ids.update(inferred_ids)
-    return ptm_entries, missing_peptides, inferred_protein_ids
-
-def process_peptide_ubiquitination(args):
-    chunk, uniprot_sequences = args
-    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
-    for peptide in chunk:
-        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Ubiquitination')
-        ptm_entries.extend(entries)
-        missing_peptides.extend(peptides)
-        inferred_protein_ids.update(inferred_ids)
-    return ptm_entries, missing_peptides, inferred_protein_ids
-
-
-def process_peptide_glycosylation(args):
-    chunk, uniprot_sequences, ptm_type = args
-    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
-    for peptide in chunk:
-        entries, peptides, inferred_ids = generate_ptm_entries_glyco([peptide], uniprot_sequences, ptm_type)
-        ptm_entries.extend(entries)
-        missing_peptides.extend(peptides)
-        inferred_protein_ids.update(inferred_ids)
-    return ptm_entries, missing_peptides, inferred_protein_ids
-
-def chunk_list(lst, n):
-    """Divide list lst into n chunks."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+STAGE_LABELS = {
+    'load': 'Load proteome',
+    'parse': 'Parse peptide list',
+    'match': 'Match peptides and infer proteins',
+    'write': 'Write database',
+}
+
+# Live view of a background generation job; reruns the page while the job is active
+def show_generation_job(job):
+    params = job['params']
+    st.write(f"**Job {job['job_id']}** – {os.path.basename(params['output_file'])} ({', '.join(params['modification_types']) or 'no PTM types'}) – {job['status']}")
+
+    for stage, label in STAGE_LABELS.items():
+        info = job['stages'][stage]
+        if info['total']:
+            fraction = min(info['done'] / info['total'], 1.0)
+        else:
+            fraction = 1.0 if info['finished'] else 0.0
+        text = f"{label}: {info['done']:,}/{info['total']:,}"
+        if info['throughput']:
+            text += f" ({info['throughput']:,.0f}/s)"
+        st.progress(fraction, text=text)
+
+    if job['status'] == 'done':
+        result = job['result']
+        st.write(f"Total entries in generated database: {result['total_entries']}")
+        st.write(f"Unique protein IDs in generated database: {result['unique_protein_ids']}")
+        output_stats = result['output_stats']
+        st.write(f"PTM entries: {output_stats['ptm_entries']:,} – global protein entries: {output_stats['protein_entries']:,}")
+        if output_stats.get('decoy_entries'):
+            st.write(f"Decoy entries ({output_stats['decoy_method']}): {output_stats['decoy_entries']:,}")
+        st.write(f"Database size: {output_stats['file_bytes'] / 1e6:,.1f} MB on disk ({output_stats['uncompressed_bytes'] / 1e6:,.1f} MB uncompressed)")
+        if output_stats.get('site_conflicts'):
+            st.warning(f"{output_stats['site_conflicts']:,} sites were not encoded because another modification occupies the same residue.")
+        if output_stats['sites_per_residue']:
+            st.write("Modified sites per residue:")
+            st.table([{'Residue': residue, 'Sites': count} for residue, count in output_stats['sites_per_residue'].items()])
+        st.write(f"Elapsed time: {result['elapsed_time']:.2f} seconds")
+
+        st.write(f"Unmatched peptides recorded in {result['missing_info_file']}:")
+        st.table([{'Reason': reason, 'Peptides': count} for reason, count in result['missing_counts'].items()])
+        if result.get('shared_count'):
+            st.write(f"{result['shared_count']:,} peptides shared by several proteins were written for their inferred protein and are listed in {result['shared_info_file']}.")
+        if st.button("Export Missing-Peptide Report to Excel", key=f"excel_{job['job_id']}"):
+            from tools.database_tools import convert_missing_report_to_excel
+            st.write(f"Excel report written to {convert_missing_report_to_excel(result['missing_info_file'])}")
+        st.success("FASTA database has been successfully created with protein and PTM entries.")
+
+        st.write("### Run Report")
+        st.table(report_table(result['run_report']))
+        st.caption(f"Run report saved to {result['run_report_file']}")
+
+        if result.get('profile'):
+            show_profile(result['profile'])
+    elif job['status'] == 'failed':
+        st.error(f"Database generation failed:\n\n{job['error']}")
+
+def show_profile(profile):
+    st.write(f"### Profile ({profile['mode']})")
+    st.write(f"Hottest functions by self time ({profile['samples']:,} samples, {profile['idle_samples']:,} idle samples left out):")
+    st.table(profile['top_functions'])
+    st.caption(f"Profile saved to {profile['pstats_file']} (pstats) and {profile['collapsed_file']} (collapsed stacks for flame graphs)")
 
 def main():
     st.set_page_config(
@@ -121,6 +131,14 @@ def main():
     if page == "Database Generation":
         st.header("Database Generation")
 
+        # Outside the form so the profiler choice appears as soon as profiling is turned on (form widgets
+        # only rerun the page on submit). Pool and cluster workers are not profiled; use the serial or
+        # threads backend to profile matching.
+        profile_run = st.checkbox('Profile the Next Run', value=DEFAULT_PROFILE_MODE is not None)
+        profile_mode = None
+        if profile_run:
+            profile_mode = st.radio('Profiler', list(PROFILE_MODES), index=PROFILE_MODES.index(DEFAULT_PROFILE_MODE) if DEFAULT_PROFILE_MODE in PROFILE_MODES else 0, horizontal=True)
+
         with st.form(key='database_generation_form', clear_on_submit=False):
             matrix_file = st.text_input('Peptide List (xlsx or tsv):', value=st.session_state['work_dir'])
             
@@ -129,90 +147,129 @@ def main():
 
             modification_types = st.multiselect(
                 'Select PTM Types to Process',
-                ['Phosphorylation', 'Acetylation', 'Ubiquitination', 'N-linked Glycosylation', 'O-linked Glycosylation']
+                PTM_TYPES
             )
 
             include_global_protein_entries = st.checkbox('Include Global Protein Entries', value=False)
 
+            # For databases larger than memory (e.g. SwissProt+TrEMBL): shard the FASTA on disk and match out of core
+            shard_size = st.number_input('Out-of-core Shard Size (million residues, 0 = in memory):', min_value=0, value=0, step=64)
+
+            # MSFragger letters: one entry per protein with phosphosites written as B (pS), Z (pT) and X (pY);
+            # other PTMs (acetyl K[A], ubiquityl K[U], glycans N[H5N4]...) need their own spare letters
+            site_encoding = st.radio('Site Encoding', ['Bracket annotations (S[P])', 'MSFragger letters (B/Z/X)'])
+            extra_letter_codes = st.text_input('Extra Code Letters for Other PTMs (residue[annotation]=letter, comma-separated):', value='', placeholder='K[A]=J, N[H5N4]=O')
+
+            # Site windows: keep only the peptides around each site instead of full-length protein copies
+            use_site_windows = st.checkbox('Write Site Windows Only', value=False)
+            window_cleavages = st.number_input('Cleavage Sites on Each Side of a Site:', min_value=0, max_value=10, value=2)
+            window_enzyme = st.selectbox('Enzyme for Site Windows', list(ENZYMES))
+
+            # Decoys are written next to their targets for target-decoy FDR (no separate decoy pass)
+            decoy_method = st.selectbox('Decoys', ['None'] + list(DECOY_METHODS))
+            decoy_prefix = st.text_input('Decoy Prefix:', value=DECOY_PREFIX)
+
+            # Where matching runs; cluster workers are started with `python -m ptmdatabase.tools.executors worker --port N`
+            # and the Streamlit server needs the same $PTMDATABASE_CLUSTER_KEY
+            executor = st.selectbox('Execution Backend', list(EXECUTOR_BACKENDS), index=EXECUTOR_BACKENDS.index('processes'))
+            workers = st.number_input('Workers (0 = all CPUs):', min_value=0, value=0)
+            cluster_addresses = st.text_input('Cluster Workers (host:port, comma-separated):', value='')
+
             submit_button = st.form_submit_button(label='Generate Database')
+            letter_codes = None
+            if submit_button and site_encoding.startswith('MSFragger'):
+                try:
+                    letter_codes = parse_letter_codes(extra_letter_codes)
+                    check_letter_codes_cover(modification_types, letter_codes)
+                except ValueError as e:
+                    st.error(str(e))
+                    submit_button = False
             if submit_button:
                 st.session_state['work_dir'] = matrix_file
                 output_file = new_db_dir
                 missing_info_file = os.path.dirname(output_file)
                 st.session_state['missing_info_file'] = missing_info_file
-                df = parse_matrix_file(matrix_file)
-                uniprot_sequences = load_uniprot_sequences(st.session_state['original_fasta_dir'])
-
-                peptide_list = df.iloc[:, 0].tolist()
-
-                # # Remove duplicate peptides
-                # peptide_list = list(set(peptide_list))
-
-                ptm_entries = []
-                missing_peptides = []
-                inferred_protein_ids = set()
-
-                start_time = time.time()
-                num_cpus = cpu_count()
-                chunked_peptide_list = list(chunk_list(peptide_list, max(1, len(peptide_list) // num_cpus)))      
-
-                with Pool(num_cpus) as pool:
-                    if 'Phosphorylation' in modification_types:
-                        args = [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
-                        results = list(tqdm(pool.imap(process_peptide_phosphorylation, args), total=len(chunked_peptide_list), desc="Processing Phosphorylation"))
-                        for result in results:
-                            phospho_ptm_entries, phospho_missing_peptides, phospho_inferred_protein_ids = result
-                            ptm_entries.extend(phospho_ptm_entries)
-                            missing_peptides.extend(phospho_missing_peptides)
-                            inferred_protein_ids.update(phospho_inferred_protein_ids)
-
-                    if 'Acetylation' in modification_types:
-                        args = [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
-                        results = list(tqdm(pool.imap(process_peptide_acetylation, args), total=len(chunked_peptide_list), desc="Processing Acetylation"))
-                        for result in results:
-                            acetyl_ptm_entries, acetyl_missing_peptides, acetyl_inferred_protein_ids = result
-                            ptm_entries.extend(acetyl_ptm_entries)
-                            missing_peptides.extend(acetyl_missing_peptides)
-                            inferred_protein_ids.update(acetyl_inferred_protein_ids)
-
-                    if 'Ubiquitination' in modification_types:
-                        args = [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
-                        results = list(tqdm(pool.imap(process_peptide_ubiquitination, args), total=len(chunked_peptide_list), desc="Processing Ubiquitination"))
-                        for result in results:
-                            ubiquitin_ptm_entries, ubiquitin_missing_peptides, ubiquitin_inferred_protein_ids = result
-                            ptm_entries.extend(ubiquitin_ptm_entries)
-                            missing_peptides.extend(ubiquitin_missing_peptides)
-                            inferred_protein_ids.update(ubiquitin_inferred_protein_ids)
-
-                    if 'N-linked Glycosylation' in modification_types:
-                        args = [(chunk, uniprot_sequences, 'N-linked Glycosylation') for chunk in chunked_peptide_list]
-                        results = list(tqdm(pool.imap(process_peptide_glycosylation, args), total=len(chunked_peptide_list), desc="Processing N-linked Glycosylation"))
-                        for result in results:
-                            nlinked_ptm_entries, nlinked_missing_peptides, nlinked_inferred_protein_ids = result
-                            ptm_entries.extend(nlinked_ptm_entries)
-                            missing_peptides.extend(nlinked_missing_peptides)
-                            inferred_protein_ids.update(nlinked_inferred_protein_ids)
-
-                    if 'O-linked Glycosylation' in modification_types:
-                        args = [(chunk, uniprot_sequences, 'O-linked Glycosylation') for chunk in chunked_peptide_list]
-                        results = list(tqdm(pool.imap(process_peptide_glycosylation, args), total=len(chunked_peptide_list), desc="Processing O-linked Glycosylation"))
-                        for result in results:
-                            olinked_ptm_entries, olinked_missing_peptides, olinked_inferred_protein_ids = result
-                            ptm_entries.extend(olinked_ptm_entries)
-                            missing_peptides.extend(olinked_missing_peptides)
-                            inferred_protein_ids.update(olinked_inferred_protein_ids)
-
-                write_fasta(output_file, uniprot_sequences, ptm_entries, inferred_protein_ids, include_global_protein_entries)
-                
-                total_entries, unique_protein_ids = count_entries_in_fasta(output_file)
-                st.write(f"Total entries in generated database: {total_entries}")
-                st.write(f"Unique protein IDs in generated database: {unique_protein_ids}")
-
-                elapsed_time = time.time() - start_time
-                st.write(f"Elapsed time: {elapsed_time:.2f} seconds")
-
-                st.success("FASTA database has been successfully created with protein and PTM entries.")
-                write_missing_info(missing_info_file, missing_peptides)
+                job_id = submit_generation_job(
+                    matrix_file=matrix_file,
+                    output_file=output_file,
+                    fasta_file=st.session_state['original_fasta_dir'],
+                    modification_types=modification_types,
+                    include_global_protein_entries=include_global_protein_entries,
+                    shard_residues=int(shard_size * 1000000) or None,
+                    output_mode='letters' if site_encoding.startswith('MSFragger') else 'annotated',
+                    letter_codes=letter_codes,
+                    window_cleavages=int(window_cleavages) if use_site_windows else None,
+                    enzyme=window_enzyme,
+                    decoy_method=None if decoy_method == 'None' else decoy_method,
+                    decoy_prefix=decoy_prefix,
+                    executor=executor,
+                    workers=int(workers) or None,
+                    cluster_addresses=[address.strip() for address in cluster_addresses.split(',') if address.strip()] or None,
+                    profile=profile_mode,
+                )
+                st.session_state['generation_job_id'] = job_id
+                st.info(f"Database generation queued as job {job_id}.")
+
+        # Jobs run in the background and survive page refreshes; pick one to reattach to
+        jobs = list_jobs()
+        if jobs:
+            st.subheader("Generation Jobs")
+            job_ids = [job['job_id'] for job in jobs]
+            selected = st.session_state.get('generation_job_id')
+            index = job_ids.index(selected) if selected in job_ids else 0
+            job_id = st.selectbox(
+                'Job',
+                job_ids,
+                index=index,
+                format_func=lambda job_id: next(f"{job['job_id']} – {os.path.basename(job['params']['output_file'])} ({job['status']})" for job in jobs if job['job_id'] == job_id),
+            )
+            st.session_state['generation_job_id'] = job_id
+            show_generation_job(jobs[job_ids.index(job_id)])
+
+            if any(job['status'] in ('queued', 'running') for job in jobs):
+                time.sleep(1)
+                st.rerun()
+
+    elif page == "Database Analysis":
+        st.header("Database Analysis")
+        st.write("Estimate the search space of a generated database against the reference proteome searched with variable modifications.")
+
+        with st.form(key='database_analysis_form', clear_on_submit=False):
+            generated_fasta = st.text_input('Generated Database:', value=st.session_state['new_db_dir'])
+            reference_fasta = st.text_input('Reference Proteome:', value=st.session_state['original_fasta_dir'])
+            enzyme = st.selectbox('Enzyme', list(ENZYMES))
+            missed_cleavages = st.number_input('Missed Cleavages:', min_value=0, max_value=5, value=2)
+            min_length, max_length = st.slider('Peptide Length:', min_value=4, max_value=60, value=(7, 50))
+            variable_residues = st.text_input('Variable Modification Residues (reference search):', value='STY')
+            max_variable_mods = st.number_input('Max Variable Modifications per Peptide:', min_value=0, max_value=5, value=3)
+            # Only used when the generated database has no run report next to it
+            site_encoding = st.radio('Site Encoding of the Generated Database', ['Bracket annotations (S[P])', 'MSFragger letters (B/Z/X)'])
+            analyze_button = st.form_submit_button(label='Estimate Search Space')
+
+        if analyze_button:
+            encoding = generation_encoding(generated_fasta)
+            if encoding is None:
+                encoding = ('letters' if site_encoding.startswith('MSFragger') else 'annotated', None)
+            else:
+                st.caption(f"Site encoding from the run report: {encoding[0]}")
+            with st.spinner('Digesting databases...'):
+                comparison = compare_search_space(generated_fasta, reference_fasta, enzyme, missed_cleavages, min_length, max_length,
+                                                  variable_residues, max_variable_mods, *encoding)
+            rows = []
+            for label in ('generated', 'reference'):
+                estimate = comparison[label]
+                rows.append({
+                    'Database': os.path.basename(estimate['fasta_file']),
+                    'Proteins': estimate['proteins'],
+                    'Unique Peptides': estimate['unique_peptides'],
+                    'Modified Peptides': estimate['modified_peptides'],
+                    'Search Candidates': estimate['candidates'],
+                    'Index Memory (GB)': round(estimate['index_bytes'] / 1e9, 3),
+                })
+            st.table(rows)
+            if comparison['search_space_ratio'] is not None:
+                st.write(f"Search space: {comparison['search_space_ratio']:.3f}x the reference")
+                st.write(f"Fragment index memory: {comparison['index_memory_ratio']:.3f}x the reference")
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
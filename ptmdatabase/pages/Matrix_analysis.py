@@ -1,10 +1,28 @@
+import os
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib_venn import venn2, venn3
+from pathlib import Path
+from tools.matrix_tools import (
+    aggregate_matrix_file,
+    empty_matrix_aggregate,
+    count_shared,
+    count_unique,
+    venn2_subsets,
+    venn3_subsets,
+    map_peptides_to_proteins,
+    to_protein_site_keys,
+)
+from tools.proteome_index import load_proteome_index
+from tools.profiling import PROFILE_MODES, DEFAULT_PROFILE_MODE, profile_capture
+
+# pandas, matplotlib and matplotlib_venn are imported where they are used, so the page (re)runs
+# without loading them until there is something to analyze or plot
+
+DEFAULT_FASTA = Path(__file__).resolve().parent.parent / 'Database_library' / 'uniprotkb_proteome_UP000005640_AND_revi_2024_07_23.fasta'
 
 # Function to plot bar chart
 def plot_bar_chart(data, indices, legend=False):
+    import matplotlib.pyplot as plt
+    import pandas as pd
     df = pd.DataFrame(data, index=indices)
     ax = df.plot(kind='bar', stacked=True, figsize=(10, 6))
     plt.xlabel('Database')
@@ -16,102 +34,59 @@ def plot_bar_chart(data, indices, legend=False):
         ax.get_legend().remove()
     st.pyplot(plt)
 
-# Function to plot Venn diagram for two sets
+# Function to plot Venn diagram for two sets (sorted unique ID arrays)
 def plot_venn_diagram(set1, set2, label1, label2):
+    import matplotlib.pyplot as plt
+    from matplotlib_venn import venn2
     fig, ax = plt.subplots()
-    v = venn2([set1, set2], set_labels=(label1, label2))
-    for label_id in ['10', '01', '11']:
-        if v.get_label_by_id(label_id):
-            v.get_label_by_id(label_id).set_text(len(eval(f"set1 & set2" if label_id == '11' else f"set1 - set2" if label_id == '10' else "set2 - set1")))
+    venn2(subsets=venn2_subsets(set1, set2), set_labels=(label1, label2))
     st.pyplot(fig)
 
-# Function to plot Venn diagram for three sets
+# Function to plot Venn diagram for three sets (sorted unique ID arrays)
 def plot_venn_diagram_three_sets(set1, set2, set3, label1, label2, label3):
+    import matplotlib.pyplot as plt
+    from matplotlib_venn import venn3
     fig, ax = plt.subplots()
-    v = venn3([set1, set2, set3], set_labels=(label1, label2, label3))
-    
-    # Define the labels and the corresponding sets
-    labels = {
-        '100': set1 - set2 - set3,
-        '010': set2 - set1 - set3,
-        '001': set3 - set1 - set2,
-        '110': (set1 & set2) - set3,
-        '101': (set1 & set3) - set2,
-        '011': (set2 & set3) - set1,
-        '111': set1 & set2 & set3
-    }
-    
-    # Print the contents of each intersection for debugging
-    for label_id, subset in labels.items():
-        print(f"Label {label_id}: {len(subset)} elements")
+
+    # Region sizes keyed by label ID, computed with sorted-array set operations
+    labels = venn3_subsets(set1, set2, set3)
+    v = venn3(subsets=tuple(labels[label_id] for label_id in ['100', '010', '110', '001', '101', '011', '111']), set_labels=(label1, label2, label3))
+
+    # Print the size of each intersection for debugging
+    for label_id, size in labels.items():
+        print(f"Label {label_id}: {size} elements")
     
     # Iterate over the labels to set the text
-    for label_id, subset in labels.items():
+    for label_id, size in labels.items():
         if v.get_label_by_id(label_id):
-            v.get_label_by_id(label_id).set_text(len(subset))
+            v.get_label_by_id(label_id).set_text(size)
         else:
             # Create a text label for regions that have no elements and no existing label
             label_positions = {'100': (-0.4, 0.2), '010': (0.4, 0.2), '001': (0.0, -0.4),
                                '110': (0.0, 0.4), '101': (-0.2, -0.2), '011': (0.2, -0.2), '111': (0.0, 0.0)}
             x, y = label_positions[label_id]
-            ax.text(x, y, str(len(subset)), ha='center', va='center')
+            ax.text(x, y, str(size), ha='center', va='center')
 
     st.pyplot(fig)
 
-# Load and preprocess data
-def load_and_preprocess_data(file_path):
-    df = pd.read_csv(file_path, sep='\t')
-    df.columns = df.columns.str.strip()
-    return df
-
-# Extract core protein ID
-def extract_core_protein_id(df):
-    df['Core Protein ID'] = df['Protein ID'].str.strip()
-    return df
-
-# Replace modified amino acids in the modified dataset
-def replace_modified_amino_acids(df):
-    df['Peptide'] = df['Peptide'].str.replace('B', 'S').str.replace('Z', 'T').str.replace('X', 'Y')
-    return df
-
-# Extract phosphorylation sites
-def extract_phosphorylation_sites(mod_str, is_modified=False):
-    if pd.isna(mod_str) or mod_str == '':
-        return set()
-    if is_modified:
-        mod_str = mod_str.replace('B', 'S').replace('Z', 'T').replace('X', 'Y')
-    return set(m.split('(')[0] for m in mod_str.replace(')', '').split(', ') if '79.9663' in m or '181.0160' in m or '166.9960' in m or '243.0260' in m)
-
-# Extract detailed phosphorylation site counts
-def extract_detailed_phosphorylation_sites(mod_str, is_modified=False):
-    if pd.isna(mod_str) or mod_str == '':
-        return {'S': 0, 'T': 0, 'Y': 0}
-    if is_modified:
-        mod_str = mod_str.replace('B', 'S').replace('Z', 'T').replace('X', 'Y')
-    counts = {'S': 0, 'T': 0, 'Y': 0}
-    for m in mod_str.replace(')', '').split(', '):
-        if '79.9663' in m or '181.0160' in m or '166.9960' in m or '243.0260' in m:
-            if 'S' in m:
-                counts['S'] += 1
-            elif 'T' in m:
-                counts['T'] += 1
-            elif 'Y' in m:
-                counts['Y'] += 1
-    return counts
-
 # Calculate similar and unique counts
 def calculate_counts(original_set, modified_set):
-    similar_count = len(original_set & modified_set)
-    unique_original_count = len(original_set - modified_set)
-    unique_modified_count = len(modified_set - original_set)
+    similar_count = count_shared(original_set, modified_set)
+    unique_original_count = count_unique(original_set, modified_set)
+    unique_modified_count = count_unique(modified_set, original_set)
     return similar_count, unique_original_count, unique_modified_count
 
 def calculate_counts_three_sets(set1, set2, set3):
-    similar_all = set1.intersection(set2).intersection(set3)
-    unique_set1 = set1.difference(set2).difference(set3)
-    unique_set2 = set2.difference(set1).difference(set3)
-    unique_set3 = set3.difference(set1).difference(set2)
-    return len(similar_all), len(unique_set1), len(unique_set2), len(unique_set3)
+    similar_all = count_shared(set1, set2, set3)
+    unique_set1 = count_unique(set1, set2, set3)
+    unique_set2 = count_unique(set2, set1, set3)
+    unique_set3 = count_unique(set3, set1, set2)
+    return similar_all, unique_set1, unique_set2, unique_set3
+
+# Load the proteome peptide index once per server process
+@st.cache_resource(show_spinner="Loading proteome index...")
+def get_proteome_index(fasta_file):
+    return load_proteome_index(fasta_file)
 
 # Main Streamlit UI
 st.title("Matrix Data Analysis")
@@ -120,96 +95,73 @@ original_path = st.text_input('Enter the directory for the original data matrix:
 modified_path = st.text_input('Enter the directory for the modified data matrix:', '')
 modified_path_v2 = st.text_input('Enter the directory for the modified_v2 data matrix:', '')
 
+protein_level_sites = st.checkbox('Compare phosphosites at protein level (map peptides to UniProt coordinates)', value=False)
+if protein_level_sites:
+    fasta_path = st.text_input('UniProt FASTA used for site localization:', value=st.session_state.get('original_fasta_dir', str(DEFAULT_FASTA)))
+
+profile_run = st.checkbox('Profile the analysis', value=DEFAULT_PROFILE_MODE is not None)
+if profile_run:
+    profile_mode = st.radio('Profiler', list(PROFILE_MODES), index=PROFILE_MODES.index(DEFAULT_PROFILE_MODE) if DEFAULT_PROFILE_MODE in PROFILE_MODES else 0, horizontal=True)
+
 if st.button('Analyze'):
     if original_path or modified_path or modified_path_v2:
-        original_df, modified_df, modified_df_v2 = None, None, None
-        if original_path:
-            original_df = load_and_preprocess_data(original_path)
-            original_df = extract_core_protein_id(original_df)
-        if modified_path:
-            modified_df = load_and_preprocess_data(modified_path)
-            modified_df = extract_core_protein_id(modified_df)
-            modified_df = replace_modified_amino_acids(modified_df)
-        if modified_path_v2:
-            modified_df_v2 = load_and_preprocess_data(modified_path_v2)
-            modified_df_v2 = extract_core_protein_id(modified_df_v2)
-            modified_df_v2 = replace_modified_amino_acids(modified_df_v2)
-
-        if original_df is not None:
-            original_df['Assigned Modifications'] = original_df['Assigned Modifications'].fillna('')
-        if modified_df is not None:
-            modified_df['Assigned Modifications'] = modified_df['Assigned Modifications'].fillna('')
-        if modified_df_v2 is not None:
-            modified_df_v2['Assigned Modifications'] = modified_df_v2['Assigned Modifications'].fillna('')
-
-        # Protein sets
-        original_protein_set = set(original_df['Core Protein ID']) if original_df is not None else set()
-        modified_protein_set = set(modified_df['Core Protein ID']) if modified_df is not None else set()
-        modified_protein_set_v2 = set(modified_df_v2['Core Protein ID']) if modified_df_v2 is not None else set()
+        import pandas as pd
+        # Optional profile of the aggregation and mapping, saved next to the original (or first) matrix
+        profile_prefix = os.path.join(os.path.dirname(original_path or modified_path or modified_path_v2), 'matrix_analysis')
+        with profile_capture(profile_mode if profile_run else None, profile_prefix) as profile:
+            # Each matrix is streamed in chunks into sorted unique integer arrays. The vocabularies are
+            # shared so the same protein or peptide gets the same ID in every dataset.
+            protein_vocab, peptide_vocab = {}, {}
+            preferred_proteins = {} if protein_level_sites else None
+
+            original, modified, modified_v2 = None, None, None
+            if original_path:
+                original = aggregate_matrix_file(original_path, protein_vocab, peptide_vocab, preferred_proteins=preferred_proteins)
+            if modified_path:
+                modified = aggregate_matrix_file(modified_path, protein_vocab, peptide_vocab, is_modified=True, preferred_proteins=preferred_proteins)
+            if modified_path_v2:
+                modified_v2 = aggregate_matrix_file(modified_path_v2, protein_vocab, peptide_vocab, is_modified=True, preferred_proteins=preferred_proteins)
+
+            original_aggregate = original if original is not None else empty_matrix_aggregate()
+            modified_aggregate = modified if modified is not None else empty_matrix_aggregate()
+            modified_aggregate_v2 = modified_v2 if modified_v2 is not None else empty_matrix_aggregate()
+
+            # Protein sets
+            original_protein_set = original_aggregate['proteins']
+            modified_protein_set = modified_aggregate['proteins']
+            modified_protein_set_v2 = modified_aggregate_v2['proteins']
         
-        # Peptide sets
-        original_peptide_set = set(original_df['Peptide']) if original_df is not None else set()
-        modified_peptide_set = set(modified_df['Peptide']) if modified_df is not None else set()
-        modified_peptide_set_v2 = set(modified_df_v2['Peptide']) if modified_df_v2 is not None else set()
-
-        # Phosphorylation sites
-        original_sites, modified_sites, modified_sites_v2 = {}, {}, {}
-        phospho_counts_original, phospho_counts_modified, phospho_counts_modified_v2 = {'S': 0, 'T': 0, 'Y': 0}, {'S': 0, 'T': 0, 'Y': 0}, {'S': 0, 'T': 0, 'Y': 0}
-        if original_df is not None:
-            for _, row in original_df.iterrows():
-                peptide = row['Peptide']
-                sites = extract_phosphorylation_sites(row['Assigned Modifications'])
-                counts = extract_detailed_phosphorylation_sites(row['Assigned Modifications'])
-                phospho_counts_original['S'] += counts['S']
-                phospho_counts_original['T'] += counts['T']
-                phospho_counts_original['Y'] += counts['Y']
-                if peptide in original_sites:
-                    original_sites[peptide].update(sites)
-                else:
-                    original_sites[peptide] = sites
-
-        if modified_df is not None:
-            for _, row in modified_df.iterrows():
-                peptide = row['Peptide']
-                sites = extract_phosphorylation_sites(row['Assigned Modifications'], is_modified=True)
-                counts = extract_detailed_phosphorylation_sites(row['Assigned Modifications'], is_modified=True)
-                phospho_counts_modified['S'] += counts['S']
-                phospho_counts_modified['T'] += counts['T']
-                phospho_counts_modified['Y'] += counts['Y']
-                if peptide in modified_sites:
-                    modified_sites[peptide].update(sites)
-                else:
-                    modified_sites[peptide] = sites
-
-        if modified_df_v2 is not None:
-            for _, row in modified_df_v2.iterrows():
-                peptide = row['Peptide']
-                sites = extract_phosphorylation_sites(row['Assigned Modifications'], is_modified=True)
-                counts = extract_detailed_phosphorylation_sites(row['Assigned Modifications'], is_modified=True)
-                phospho_counts_modified_v2['S'] += counts['S']
-                phospho_counts_modified_v2['T'] += counts['T']
-                phospho_counts_modified_v2['Y'] += counts['Y']
-                if peptide in modified_sites_v2:
-                    modified_sites_v2[peptide].update(sites)
-                else:
-                    modified_sites_v2[peptide] = sites
-
-        all_orig_sites = set()
-        all_mod_sites = set()
-        all_mod_sites_v2 = set()
-
-        if original_df is not None:
-            for peptide, orig_sites in original_sites.items():
-                all_orig_sites.update(f"{peptide}_{site}" for site in orig_sites)
-        if modified_df is not None:
-            for peptide, mod_sites in modified_sites.items():
-                all_mod_sites.update(f"{peptide}_{site}" for site in mod_sites)
-        if modified_df_v2 is not None:
-            for peptide, mod_sites_v2 in modified_sites_v2.items():
-                all_mod_sites_v2.update(f"{peptide}_{site}" for site in mod_sites_v2)
+            # Peptide sets
+            original_peptide_set = original_aggregate['peptides']
+            modified_peptide_set = modified_aggregate['peptides']
+            modified_peptide_set_v2 = modified_aggregate_v2['peptides']
+
+            # Phosphorylation sites as packed (peptide_id, residue, position) keys
+            all_orig_sites, phospho_counts_original = original_aggregate['sites'], original_aggregate['phospho_counts']
+            all_mod_sites, phospho_counts_modified = modified_aggregate['sites'], modified_aggregate['phospho_counts']
+            all_mod_sites_v2, phospho_counts_modified_v2 = modified_aggregate_v2['sites'], modified_aggregate_v2['phospho_counts']
+
+            # Protein-level mode: the same protein site seen on overlapping peptides collapses into one
+            # (protein, residue, position) key
+            if protein_level_sites:
+                proteome_index = get_proteome_index(fasta_path)
+                peptide_locations = map_peptides_to_proteins(peptide_vocab, proteome_index, preferred_proteins)
+
+                all_orig_sites, unmapped_orig = to_protein_site_keys(all_orig_sites, peptide_locations)
+                all_mod_sites, unmapped_mod = to_protein_site_keys(all_mod_sites, peptide_locations)
+                all_mod_sites_v2, unmapped_mod_v2 = to_protein_site_keys(all_mod_sites_v2, peptide_locations)
+                unmapped_sites = unmapped_orig + unmapped_mod + unmapped_mod_v2
+                if unmapped_sites:
+                    st.warning(f"{unmapped_sites} phosphosites belong to peptides not found in the proteome and were excluded from the site comparison.")
+
+        if profile_run:
+            st.write(f"### Profile ({profile['mode']})")
+            st.write(f"Hottest functions by self time ({profile['samples']:,} samples, {profile['idle_samples']:,} idle samples left out):")
+            st.table(profile['top_functions'])
+            st.caption(f"Profile saved to {profile['pstats_file']} (pstats) and {profile['collapsed_file']} (collapsed stacks for flame graphs)")
 
         # Plotting and visualization
-        if original_df is not None and modified_df is not None and modified_df_v2 is not None:
+        if original is not None and modified is not None and modified_v2 is not None:
             st.write("### Protein counts")
             col1, col2 = st.columns([11.9, 7.5])
             with col1:
@@ -247,25 +199,25 @@ if st.button('Analyze'):
                     '**Phospho Y**', 'Total Count', 'Similar Count', 'Unique Count'
                 ],
                 'Original': [
-                    '', len(original_protein_set), len(original_protein_set & modified_protein_set & modified_protein_set_v2), len(original_protein_set - modified_protein_set - modified_protein_set_v2),
-                    '', len(original_peptide_set), len(original_peptide_set & modified_peptide_set & modified_peptide_set_v2), len(original_peptide_set - modified_peptide_set - modified_peptide_set_v2),
-                    '', len(all_orig_sites), len(all_orig_sites & all_mod_sites & all_mod_sites_v2), len(all_orig_sites - all_mod_sites - all_mod_sites_v2),
+                    '', len(original_protein_set), count_shared(original_protein_set, modified_protein_set, modified_protein_set_v2), count_unique(original_protein_set, modified_protein_set, modified_protein_set_v2),
+                    '', len(original_peptide_set), count_shared(original_peptide_set, modified_peptide_set, modified_peptide_set_v2), count_unique(original_peptide_set, modified_peptide_set, modified_peptide_set_v2),
+                    '', len(all_orig_sites), count_shared(all_orig_sites, all_mod_sites, all_mod_sites_v2), count_unique(all_orig_sites, all_mod_sites, all_mod_sites_v2),
                     '', phospho_counts_original['S'], min(phospho_counts_original['S'], phospho_counts_modified['S'], phospho_counts_modified_v2['S']), max(phospho_counts_original['S'] - min(phospho_counts_modified['S'], phospho_counts_modified_v2['S']), 0),
                     '', phospho_counts_original['T'], min(phospho_counts_original['T'], phospho_counts_modified['T'], phospho_counts_modified_v2['T']), max(phospho_counts_original['T'] - min(phospho_counts_modified['T'], phospho_counts_modified_v2['T']), 0),
                     '', phospho_counts_original['Y'], min(phospho_counts_original['Y'], phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), max(phospho_counts_original['Y'] - min(phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), 0)
                 ],
                 'Modified v1': [
-                    '', len(modified_protein_set), len(original_protein_set & modified_protein_set & modified_protein_set_v2), len(modified_protein_set - original_protein_set - modified_protein_set_v2),
-                    '', len(modified_peptide_set), len(original_peptide_set & modified_peptide_set & modified_peptide_set_v2), len(modified_peptide_set - original_peptide_set - modified_peptide_set_v2),
-                    '', len(all_mod_sites), len(all_orig_sites & all_mod_sites & all_mod_sites_v2), len(all_mod_sites - all_orig_sites - all_mod_sites_v2),
+                    '', len(modified_protein_set), count_shared(original_protein_set, modified_protein_set, modified_protein_set_v2), count_unique(modified_protein_set, original_protein_set, modified_protein_set_v2),
+                    '', len(modified_peptide_set), count_shared(original_peptide_set, modified_peptide_set, modified_peptide_set_v2), count_unique(modified_peptide_set, original_peptide_set, modified_peptide_set_v2),
+                    '', len(all_mod_sites), count_shared(all_orig_sites, all_mod_sites, all_mod_sites_v2), count_unique(all_mod_sites, all_orig_sites, all_mod_sites_v2),
                     '', phospho_counts_modified['S'], min(phospho_counts_original['S'], phospho_counts_modified['S'], phospho_counts_modified_v2['S']), max(phospho_counts_modified['S'] - min(phospho_counts_original['S'], phospho_counts_modified_v2['S']), 0),
                     '', phospho_counts_modified['T'], min(phospho_counts_original['T'], phospho_counts_modified['T'], phospho_counts_modified_v2['T']), max(phospho_counts_modified['T'] - min(phospho_counts_original['T'], phospho_counts_modified_v2['T']), 0),
                     '', phospho_counts_modified['Y'], min(phospho_counts_original['Y'], phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), max(phospho_counts_modified['Y'] - min(phospho_counts_original['Y'], phospho_counts_modified_v2['Y']), 0)
                 ],
                 'Modified v2': [
-                    '', len(modified_protein_set_v2), len(original_protein_set & modified_protein_set & modified_protein_set_v2), len(modified_protein_set_v2 - original_protein_set - modified_protein_set),
-                    '', len(modified_peptide_set_v2), len(original_peptide_set & modified_peptide_set & modified_peptide_set_v2), len(modified_peptide_set_v2 - original_peptide_set - modified_peptide_set),
-                    '', len(all_mod_sites_v2), len(all_orig_sites & all_mod_sites & all_mod_sites_v2), len(all_mod_sites_v2 - all_orig_sites - all_mod_sites),
+                    '', len(modified_protein_set_v2), count_shared(original_protein_set, modified_protein_set, modified_protein_set_v2), count_unique(modified_protein_set_v2, original_protein_set, modified_protein_set),
+                    '', len(modified_peptide_set_v2), count_shared(original_peptide_set, modified_peptide_set, modified_peptide_set_v2), count_unique(modified_peptide_set_v2, original_peptide_set, modified_peptide_set),
+                    '', len(all_mod_sites_v2), count_shared(all_orig_sites, all_mod_sites, all_mod_sites_v2), count_unique(all_mod_sites_v2, all_orig_sites, all_mod_sites),
                     '', phospho_counts_modified_v2['S'], min(phospho_counts_original['S'], phospho_counts_modified['S'], phospho_counts_modified_v2['S']), max(phospho_counts_modified_v2['S'] - min(phospho_counts_original['S'], phospho_counts_modified['S']), 0),
                     '', phospho_counts_modified_v2['T'], min(phospho_counts_original['T'], phospho_counts_modified['T'], phospho_counts_modified_v2['T']), max(phospho_counts_modified_v2['T'] - min(phospho_counts_original['T'], phospho_counts_modified['T']), 0),
                     '', phospho_counts_modified_v2['Y'], min(phospho_counts_original['Y'], phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), max(phospho_counts_modified_v2['Y'] - min(phospho_counts_original['Y'], phospho_counts_modified['Y']), 0)
@@ -275,7 +227,7 @@ if st.button('Analyze'):
             summary_df = pd.DataFrame(summary_data)
             st.table(summary_df.astype(str))
 
-        elif original_df is not None and modified_df is not None:
+        elif original is not None and modified is not None:
             st.write("### Comparison between Original and Modified v1 Databases")
             col1, col2 = st.columns([11.9, 7.5])
             with col1:
@@ -313,17 +265,17 @@ if st.button('Analyze'):
                     '**Phospho Y**', 'Total Count', 'Similar Count', 'Unique Count'
                 ],
                 'Original': [
-                    '', len(original_protein_set), len(original_protein_set & modified_protein_set), len(original_protein_set - modified_protein_set),
-                    '', len(original_peptide_set), len(original_peptide_set & modified_peptide_set), len(original_peptide_set - modified_peptide_set),
-                    '', len(all_orig_sites), len(all_orig_sites & all_mod_sites), len(all_orig_sites - all_mod_sites),
+                    '', len(original_protein_set), count_shared(original_protein_set, modified_protein_set), count_unique(original_protein_set, modified_protein_set),
+                    '', len(original_peptide_set), count_shared(original_peptide_set, modified_peptide_set), count_unique(original_peptide_set, modified_peptide_set),
+                    '', len(all_orig_sites), count_shared(all_orig_sites, all_mod_sites), count_unique(all_orig_sites, all_mod_sites),
                     '', phospho_counts_original['S'], min(phospho_counts_original['S'], phospho_counts_modified['S']), phospho_counts_original['S'] - phospho_counts_modified['S'],
                     '', phospho_counts_original['T'], min(phospho_counts_original['T'], phospho_counts_modified['T']), phospho_counts_original['T'] - phospho_counts_modified['T'],
                     '', phospho_counts_original['Y'], min(phospho_counts_original['Y'], phospho_counts_modified['Y']), phospho_counts_original['Y'] - phospho_counts_modified['Y']
                 ],
                 'Modified v1': [
-                    '', len(modified_protein_set), len(original_protein_set & modified_protein_set), len(modified_protein_set - original_protein_set),
-                    '', len(modified_peptide_set), len(original_peptide_set & modified_peptide_set), len(modified_peptide_set - original_peptide_set),
-                    '', len(all_mod_sites), len(all_orig_sites & all_mod_sites), len(all_mod_sites - all_orig_sites),
+                    '', len(modified_protein_set), count_shared(original_protein_set, modified_protein_set), count_unique(modified_protein_set, original_protein_set),
+                    '', len(modified_peptide_set), count_shared(original_peptide_set, modified_peptide_set), count_unique(modified_peptide_set, original_peptide_set),
+                    '', len(all_mod_sites), count_shared(all_orig_sites, all_mod_sites), count_unique(all_mod_sites, all_orig_sites),
                     '', phospho_counts_modified['S'], min(phospho_counts_original['S'], phospho_counts_modified['S']), phospho_counts_modified['S'] - phospho_counts_original['S'],
                     '', phospho_counts_modified['T'], min(phospho_counts_original['T'], phospho_counts_modified['T']), phospho_counts_modified['T'] - phospho_counts_original['T'],
                     '', phospho_counts_modified['Y'], min(phospho_counts_original['Y'], phospho_counts_modified['Y']), phospho_counts_modified['Y'] - phospho_counts_original['Y']
@@ -332,7 +284,7 @@ if st.button('Analyze'):
             summary_df = pd.DataFrame(summary_data)
             st.table(summary_df.astype(str))
 
-        elif original_df is not None and modified_df_v2 is not None:
+        elif original is not None and modified_v2 is not None:
             st.write("### Comparison between Original and Modified v2 Databases")
             col1, col2 = st.columns([11.9, 7.5])
             with col1:
@@ -369,17 +321,17 @@ if st.button('Analyze'):
                     '**Phospho Y**', 'Total Count', 'Similar Count', 'Unique Count'
                 ],
                 'Original': [
-                    '', len(original_protein_set), len(original_protein_set & modified_protein_set_v2), len(original_protein_set - modified_protein_set_v2),
-                    '', len(original_peptide_set), len(original_peptide_set & modified_peptide_set_v2), len(original_peptide_set - modified_peptide_set_v2),
-                    '', len(all_orig_sites), len(all_orig_sites & all_mod_sites_v2), len(all_orig_sites - all_mod_sites_v2),
+                    '', len(original_protein_set), count_shared(original_protein_set, modified_protein_set_v2), count_unique(original_protein_set, modified_protein_set_v2),
+                    '', len(original_peptide_set), count_shared(original_peptide_set, modified_peptide_set_v2), count_unique(original_peptide_set, modified_peptide_set_v2),
+                    '', len(all_orig_sites), count_shared(all_orig_sites, all_mod_sites_v2), count_unique(all_orig_sites, all_mod_sites_v2),
                     '', phospho_counts_original['S'], min(phospho_counts_original['S'], phospho_counts_modified_v2['S']), phospho_counts_original['S'] - phospho_counts_modified_v2['S'],
                     '', phospho_counts_original['T'], min(phospho_counts_original['T'], phospho_counts_modified_v2['T']), phospho_counts_original['T'] - phospho_counts_modified_v2['T'],
                     '', phospho_counts_original['Y'], min(phospho_counts_original['Y'], phospho_counts_modified_v2['Y']), phospho_counts_original['Y'] - phospho_counts_modified_v2['Y']
                 ],
                 'Modified v2': [
-                    '', len(modified_protein_set_v2), len(original_protein_set & modified_protein_set_v2), len(modified_protein_set_v2 - original_protein_set),
-                    '', len(modified_peptide_set_v2), len(original_peptide_set & modified_peptide_set_v2), len(modified_peptide_set_v2 - original_peptide_set),
-                    '', len(all_mod_sites_v2), len(all_orig_sites & all_mod_sites_v2), len(all_mod_sites_v2 - all_orig_sites),
+                    '', len(modified_protein_set_v2), count_shared(original_protein_set, modified_protein_set_v2), count_unique(modified_protein_set_v2, original_protein_set),
+                    '', len(modified_peptide_set_v2), count_shared(original_peptide_set, modified_peptide_set_v2), count_unique(modified_peptide_set_v2, original_peptide_set),
+                    '', len(all_mod_sites_v2), count_shared(all_orig_sites, all_mod_sites_v2), count_unique(all_mod_sites_v2, all_orig_sites),
                     '', phospho_counts_modified_v2['S'], min(phospho_counts_original['S'], phospho_counts_modified_v2['S']), phospho_counts_modified_v2['S'] - phospho_counts_original['S'],
                     '', phospho_counts_modified_v2['T'], min(phospho_counts_original['T'], phospho_counts_modified_v2['T']), phospho_counts_modified_v2['T'] - phospho_counts_original['T'],
                     '', phospho_counts_modified_v2['Y'], min(phospho_counts_original['Y'], phospho_counts_modified_v2['Y']), phospho_counts_modified_v2['Y'] - phospho_counts_original['Y']
@@ -388,7 +340,7 @@ if st.button('Analyze'):
             summary_df = pd.DataFrame(summary_data)
             st.table(summary_df.astype(str))
 
-        elif modified_df is not None and modified_df_v2 is not None:
+        elif modified is not None and modified_v2 is not None:
             st.write("### Comparison between Modified v1 and Modified v2 Databases")
             col1, col2 = st.columns([11.9, 7.5])
             with col1:
@@ -426,17 +378,17 @@ if st.button('Analyze'):
                     '**Phospho Y**', 'Total Count', 'Similar Count', 'Unique Count'
                 ],
                 'Modified v1': [
-                    '', len(modified_protein_set), len(modified_protein_set & modified_protein_set_v2), len(modified_protein_set - modified_protein_set_v2),
-                    '', len(modified_peptide_set), len(modified_peptide_set & modified_peptide_set_v2), len(modified_peptide_set - modified_peptide_set_v2),
-                    '', len(all_mod_sites), len(all_mod_sites & all_mod_sites_v2), len(all_mod_sites - all_mod_sites_v2),
+                    '', len(modified_protein_set), count_shared(modified_protein_set, modified_protein_set_v2), count_unique(modified_protein_set, modified_protein_set_v2),
+                    '', len(modified_peptide_set), count_shared(modified_peptide_set, modified_peptide_set_v2), count_unique(modified_peptide_set, modified_peptide_set_v2),
+                    '', len(all_mod_sites), count_shared(all_mod_sites, all_mod_sites_v2), count_unique(all_mod_sites, all_mod_sites_v2),
                     '', phospho_counts_modified['S'], min(phospho_counts_modified['S'], phospho_counts_modified_v2['S']), phospho_counts_modified['S'] - phospho_counts_modified_v2['S'],
                     '', phospho_counts_modified['T'], min(phospho_counts_modified['T'], phospho_counts_modified_v2['T']), phospho_counts_modified['T'] - phospho_counts_modified_v2['T'],
                     '', phospho_counts_modified['Y'], min(phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), phospho_counts_modified['Y'] - phospho_counts_modified_v2['Y']
                 ],
                 'Modified v2': [
-                    '', len(modified_protein_set_v2), len(modified_protein_set & modified_protein_set_v2), len(modified_protein_set_v2 - modified_protein_set),
-                    '', len(modified_peptide_set_v2), len(modified_peptide_set & modified_peptide_set_v2), len(modified_peptide_set_v2 - modified_peptide_set),
-                    '', len(all_mod_sites_v2), len(all_mod_sites & all_mod_sites_v2), len(all_mod_sites_v2 - all_mod_sites),
+                    '', len(modified_protein_set_v2), count_shared(modified_protein_set, modified_protein_set_v2), count_unique(modified_protein_set_v2, modified_protein_set),
+                    '', len(modified_peptide_set_v2), count_shared(modified_peptide_set, modified_peptide_set_v2), count_unique(modified_peptide_set_v2, modified_peptide_set),
+                    '', len(all_mod_sites_v2), count_shared(all_mod_sites, all_mod_sites_v2), count_unique(all_mod_sites_v2, all_mod_sites),
                     '', phospho_counts_modified_v2['S'], min(phospho_counts_modified['S'], phospho_counts_modified_v2['S']), phospho_counts_modified_v2['S'] - phospho_counts_modified['S'],
                     '', phospho_counts_modified_v2['T'], min(phospho_counts_modified['T'], phospho_counts_modified_v2['T']), phospho_counts_modified_v2['T'] - phospho_counts_modified['T'],
                     '', phospho_counts_modified_v2['Y'], min(phospho_counts_modified['Y'], phospho_counts_modified_v2['Y']), phospho_counts_modified_v2['Y'] - phospho_counts_modified['Y']
@@ -2,9 +2,15 @@ import os
 import subprocess
 import argparse
 
+try:
+    from .tools.profiling import PROFILE_MODES
+except ImportError:  # run as a script from this directory
+    from tools.profiling import PROFILE_MODES
+
 def starter():
     parser = argparse.ArgumentParser(description="Start the QCMSPyCloud with a given result data folder of MSPyCloud.")
     parser.add_argument("data_folder", type=str, help="Path to the result data folder.")
+    parser.add_argument("--profile", choices=PROFILE_MODES, help="Profile generation and analysis runs by default (see tools/profiling.py).")
     
     # Removing --help since argparse already provides help functionality
     args = parser.parse_args()
@@ -13,6 +19,9 @@ def starter():
     
     # Checking if the provided data_folder is valid
     if os.path.isdir(args.data_folder):
+        # The pages read the default profiling mode from the environment of the Streamlit server
+        if args.profile:
+            os.environ['PTMDATABASE_PROFILE'] = args.profile
         subprocess.call(['streamlit', 'run', os.path.join(path, 'Home_page.py'), "--server.enableXsrfProtection", "false", args.data_folder])
     else:
         print(f"Provided data_folder path does not exist: {args.data_folder}")
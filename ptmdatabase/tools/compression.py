@@ -0,0 +1,112 @@
+import gzip
+import io
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Transparent compressed FASTA I/O chosen by file extension: '.gz' (gzip) and '.zst' (Zstandard,
+# needs the optional zstandard package). gzip output is compressed in parallel blocks: every block is
+# an independent gzip member compressed on a thread pool (zlib releases the GIL) and written in order,
+# which any gzip reader decompresses as one stream. Zstandard uses its own multi-threaded compressor.
+
+GZIP_BLOCK_SIZE = 4 * 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Permissions of files created with open(): mkstemp() creates them readable by the owner only
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def compression_for(path):
+    path = str(path)
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def compress_gzip_member(block, level):
+    return gzip.compress(block, compresslevel=level, mtime=0)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    def __init__(self, path, level=GZIP_LEVEL, threads=None, block_size=GZIP_BLOCK_SIZE):
+        self.raw = open(path, 'wb')
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self.submit_block()
+        return len(data)
+
+    def submit_block(self):
+        block = bytes(self.buffer)
+        self.buffer.clear()
+        self.pending.append(self.executor.submit(compress_gzip_member, block, self.level))
+        # Bound the number of blocks held in memory
+        while len(self.pending) > 2 * self.threads:
+            self.raw.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer:
+                self.submit_block()
+            while self.pending:
+                self.raw.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.raw.close()
+            super().close()
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("Reading or writing .zst files requires the 'zstandard' package (pip install zstandard).")
+
+# Open a FASTA file for reading ('rt') or writing ('wt'), compressed according to its extension.
+# threads sets the number of compression threads (default: all CPUs).
+def open_fasta(path, mode='rt', threads=None, level=None):
+    compression = compression_for(path)
+    if 'r' in mode:
+        if compression == 'gzip':
+            return gzip.open(path, 'rt')
+        if compression == 'zstd':
+            require_zstandard()
+            return zstandard.open(path, 'rt')
+        return open(path, 'r')
+
+    if compression == 'gzip':
+        writer = ParallelGzipWriter(path, level or GZIP_LEVEL, threads)
+        return io.TextIOWrapper(io.BufferedWriter(writer, GZIP_BLOCK_SIZE), encoding='utf-8')
+    if compression == 'zstd':
+        require_zstandard()
+        compressor = zstandard.ZstdCompressor(level=level or ZSTD_LEVEL, threads=threads or -1)
+        return zstandard.open(path, 'wt', cctx=compressor)
+    return open(path, 'w')
+
+# Unique temporary file next to path, keeping its compression extension, for output that is written
+# completely and then moved onto path with os.replace(): readers never see a partial file and a
+# failed write leaves an earlier file in place
+def temporary_file(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    extension = {'gzip': '.gz', 'zstd': '.zst'}.get(compression_for(path), '')
+    descriptor, temporary = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp' + extension, dir=directory)
+    os.close(descriptor)
+    os.chmod(temporary, 0o666 & ~UMASK)
+    return temporary
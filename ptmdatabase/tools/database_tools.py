@@ -1,13 +1,18 @@
-from Bio import SeqIO
 import os
-import pandas as pd
-import concurrent.futures
 import re
+import csv
+import random
+from bisect import bisect_right
+from collections import Counter
+from .compression import open_fasta, temporary_file
+
+# Biopython, pandas and pyarrow are imported inside the functions that use them: the matching
+# functions run in pool workers that never need them, and the pages start faster without them.
 
 # Database library: 5 original PTMs databases (Phospho, N- and O-linked Glyco, Acetylation, and Ubiquitination) were generated using 
 # 1. The PTM text file from (https://awi.cuhk.edu.cn/dbPTM/download.php).
 # 2. The uniprot database (https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/uniprot_sprot.fasta.gz). 
-# 3. While using the code in PTM_Database\ptmdatabase\Database_library\Original_database_generation.ipynb -> add the PTM information in the entry and add annotation for the PTM site in the protein sequence.
+# 3. While using ptmdatabase/library.py (python -m ptmdatabase.library, also driven from PTM_Database\ptmdatabase\Database_library\Original_database_generation.ipynb) -> add the PTM information in the entry and add annotation for the PTM site in the protein sequence.
 
 # Workflow:
 # 1. The code extract the protein ID and peptide sequence from the data file. 
@@ -16,10 +21,11 @@ import re
 # 4. After obtaining a list of the PTM sites, the code will match the protein IDs and the PTM sites to the corresponding entries in the specific original PTM database, which can be found in PTM_Database\ptmdatabase\Database_library.
 # 5. The code will then proceed to paste those entries to the generated database, which already contained the global protein entries in there.
 # 6. For the PTM sites that do not exist in the original PTM databases, the code will automatically create new entries for those PTM sites using the corresponding Global protein entries.
-# 7. All of the unmatched protein ID (Proteins that are listed in the matrix file but cannot be found in the UniProt database), peptide sequence (Peptides that are identified in the matrix file but cannot be found within the corresponding protein sequence in the UniProt database), and PTM sites (Modifications that are identified in the matrix file but cannot be found in the PTM-specific library) are recorded in the Excel list located in the same directory of the generated database. 
+# 7. All of the unmatched protein ID (Proteins that are listed in the matrix file but cannot be found in the UniProt database), peptide sequence (Peptides that are identified in the matrix file but cannot be found within the corresponding protein sequence in the UniProt database), and PTM sites (Modifications that are identified in the matrix file but cannot be found in the PTM-specific library) are recorded in the missing-peptide report (missing_peptides.tsv, with a reason code per peptide; peptides shared by several proteins are listed in shared_peptides.tsv) located in the same directory of the generated database. 
 
 
 def parse_matrix_file(file_path):
+    import pandas as pd
     if file_path.endswith('.xlsx'):
         df = pd.read_excel(file_path)
     elif file_path.endswith('.tsv'):
@@ -28,31 +34,59 @@ def parse_matrix_file(file_path):
         raise ValueError("Unsupported file format. Only .xlsx and .tsv are supported.")
     return df
 
+# Peptide lists in batches of batch_size (first column, like parse_matrix_file); .tsv files are read
+# incrementally so matching can start before the whole file is parsed
+def iter_peptide_batches(file_path, batch_size):
+    import pandas as pd
+    if file_path.endswith('.tsv'):
+        with pd.read_csv(file_path, sep='\t', chunksize=batch_size) as reader:
+            for chunk in reader:
+                yield chunk.iloc[:, 0].tolist()
+        return
+    peptide_list = parse_matrix_file(file_path).iloc[:, 0].tolist()
+    for i in range(0, len(peptide_list), batch_size):
+        yield peptide_list[i:i + batch_size]
+
 def format_fasta_sequence(sequence, line_length=60):
     return '\n'.join([sequence[i:i+line_length] for i in range(0, len(sequence), line_length)])
 
 def load_uniprot_sequences(fasta_file):
+    from Bio import SeqIO
     uniprot_sequences = {}
-    for record in SeqIO.parse(fasta_file, "fasta"):
-        protein_id = record.id.split('|')[1]
-        description = record.description
-        sequence = str(record.seq)
-        uniprot_sequences[protein_id] = {'header': description, 'sequence': sequence}
+    with open_fasta(fasta_file) as handle:
+        for record in SeqIO.parse(handle, "fasta"):
+            protein_id = record.id.split('|')[1]
+            description = record.description
+            sequence = str(record.seq)
+            uniprot_sequences[protein_id] = {'header': description, 'sequence': sequence}
     return uniprot_sequences
 
+# Loads a whole library; for lookups of a few sites use tools.library_index.load_library_index instead
 def load_ptm_sequences(fasta_file):
+    from Bio import SeqIO
     ptm_sequences = {}
-    for record in SeqIO.parse(fasta_file, "fasta"):
-        description = record.description
-        sequence = str(record.seq)
-        key = '|'.join(description.split('|')[:3]) + '|'
-        ptm_sequences[key] = {'header': description, 'sequence': sequence}
+    with open_fasta(fasta_file) as handle:
+        for record in SeqIO.parse(handle, "fasta"):
+            description = record.description
+            sequence = str(record.seq)
+            key = '|'.join(description.split('|')[:3]) + '|'
+            ptm_sequences[key] = {'header': description, 'sequence': sequence}
     return ptm_sequences
 
 # Global processing 
-def extract_modifications(peptide, ptm_type):
+# PTM type -> (modifiable residues, mass annotation pattern, site code); the code letter itself is also accepted
+MODIFICATION_RULES = {
+    'Phosphorylation': ('STY', re.compile(r'79(\.\d+)?'), 'P'),
+    'Acetylation': ('K', re.compile(r'42(\.\d+)?'), 'A'),
+    'Ubiquitination': ('K', re.compile(r'114(\.\d+)?'), 'U'),
+}
+
+# Annotations of the requested PTM on a residue it cannot modify are skipped; pass a list as
+# unsupported_sites to collect them as (residue, relative position)
+def extract_modifications(peptide, ptm_type, unsupported_sites=None):
     modifications = []
     clean_peptide = ""
+    rule = MODIFICATION_RULES.get(ptm_type)
     i = 0
     while i < len(peptide):
         if peptide[i] == '[':
@@ -61,15 +95,13 @@ def extract_modifications(peptide, ptm_type):
                 mod_annotation = peptide[i+1:end]
                 mod_residue = clean_peptide[-1]
                 relative_position = len(clean_peptide) - 1
-                if ptm_type == 'Phosphorylation' and mod_residue in "STY":
-                    if mod_annotation == 'P' or re.match(r'79(\.\d+)?', mod_annotation):
-                        modifications.append((mod_residue, f"{mod_residue}{relative_position + 1}P", relative_position))
-                elif ptm_type == 'Acetylation' and mod_residue == 'K':
-                    if mod_annotation == 'A' or re.match(r'42(\.\d+)?', mod_annotation):
-                        modifications.append((mod_residue, f"{mod_residue}{relative_position + 1}A", relative_position))
-                elif ptm_type == 'Ubiquitination' and mod_residue == 'K':
-                    if mod_annotation == 'U' or re.match(r'114(\.\d+)?', mod_annotation):
-                        modifications.append((mod_residue, f"{mod_residue}{relative_position + 1}U", relative_position))
+                if rule is not None:
+                    residues, mass_pattern, code = rule
+                    if mod_annotation == code or mass_pattern.match(mod_annotation):
+                        if mod_residue in residues:
+                            modifications.append((mod_residue, f"{mod_residue}{relative_position + 1}{code}", relative_position))
+                        elif unsupported_sites is not None:
+                            unsupported_sites.append((mod_residue, relative_position))
                 i = end + 1
             else:
                 clean_peptide += peptide[i]
@@ -79,6 +111,30 @@ def extract_modifications(peptide, ptm_type):
             i += 1
     return clean_peptide, modifications
 
+# (protein_id, start) of every protein containing the peptide, first occurrence per protein.
+# Containers with a find_all fast path (tools.proteome.Proteome) search their whole buffer at once.
+def find_peptide(uniprot_sequences, peptide_sequence, first_only=False):
+    if hasattr(uniprot_sequences, 'find_all'):
+        return uniprot_sequences.find_all(peptide_sequence, first_only)
+    hits = []
+    for protein_id, protein_data in uniprot_sequences.items():
+        peptide_start = protein_data['sequence'].find(peptide_sequence)
+        if peptide_start != -1:
+            hits.append((protein_id, peptide_start))
+            if first_only:
+                break
+    return hits
+
+# Unmatched-report reasons: the peptide is in no protein, or the PTM is annotated on a residue it
+# cannot modify; no entry is written for these. Peptides that map to several proteins still get an
+# entry for the inferred protein and are reported separately as 'ambiguous' (see write_missing_info).
+# Report rows are (peptide, ptm_type, reason, candidate proteins joined by ';').
+MISSING_REASONS = ('no_protein_hit', 'unsupported_residue')
+SHARED_REASON = 'ambiguous'
+MISSING_COLUMNS = ['Peptide Sequence', 'PTM Type', 'Reason', 'Candidate Proteins']
+MISSING_BATCH_SIZE = 100000
+EXCEL_MAX_ROWS = 1048575
+
 def generate_ptm_entries(peptide_list, uniprot_sequences, ptm_type):
     ptm_entries = []
     missing_peptides = []
@@ -89,30 +145,31 @@ def generate_ptm_entries(peptide_list, uniprot_sequences, ptm_type):
     protein_to_peptides = {}
 
     for peptide in peptide_list:
-        peptide_sequence, modifications = extract_modifications(peptide, ptm_type)
+        unsupported_sites = []
+        peptide_sequence, modifications = extract_modifications(peptide, ptm_type, unsupported_sites)
         if not modifications:  # Skip if no modifications are found
+            if unsupported_sites:
+                missing_peptides.append((peptide, ptm_type, 'unsupported_residue', ''))
             continue
 
         found_protein = False
         potential_proteins = []
 
-        for protein_id, protein_data in uniprot_sequences.items():
-            protein_sequence = protein_data['sequence']
-            peptide_start = protein_sequence.find(peptide_sequence)
+        for protein_id, peptide_start in find_peptide(uniprot_sequences, peptide_sequence):
+            found_protein = True
+            potential_proteins.append(protein_id)
 
-            if peptide_start != -1:
-                found_protein = True
-                potential_proteins.append(protein_id)
-
-                # Track which peptides are covered by this protein
-                if protein_id not in protein_to_peptides:
-                    protein_to_peptides[protein_id] = []
-                protein_to_peptides[protein_id].append(peptide_sequence)
+            # Track which peptides are covered by this protein
+            if protein_id not in protein_to_peptides:
+                protein_to_peptides[protein_id] = []
+            protein_to_peptides[protein_id].append(peptide_sequence)
 
         if found_protein:
             peptide_to_proteins[peptide_sequence] = potential_proteins
+            if len(potential_proteins) > 1:
+                missing_peptides.append((peptide, ptm_type, 'ambiguous', ';'.join(potential_proteins)))
         else:
-            missing_peptides.append(peptide)
+            missing_peptides.append((peptide, ptm_type, 'no_protein_hit', ''))
 
     # Step 2: Assign unique peptides to their corresponding proteins
     unique_peptides = {p: ps[0] for p, ps in peptide_to_proteins.items() if len(ps) == 1}
@@ -201,6 +258,29 @@ def extract_glyco_modifications(peptide):
             i += 1
     return clean_peptide, modifications
 
+# One entry per glycosite of a peptide found in protein_id at peptide_start (0-based)
+def glyco_entries(protein_id, peptide_start, modifications, uniprot_sequences, ptm_type):
+    protein_data = uniprot_sequences[protein_id]
+    protein_sequence = protein_data['sequence']
+    ptm_entries = []
+    for mod in modifications:
+        mod_residue, mod_annotation, relative_position = mod
+        # Calculate the protein-level position
+        site_position = peptide_start + relative_position + 1
+        
+        if ptm_type == 'N-linked Glycosylation':
+            mod_description = f"N{site_position}[{mod_annotation}]"
+        elif ptm_type == 'O-linked Glycosylation':
+            mod_description = f"{mod_residue}{site_position}[{mod_annotation}]"
+
+        # Update header and sequence
+        new_header = f"sp|{protein_id}|{mod_description}|{protein_data['header'].split('|', 2)[2]}"
+        modified_protein_sequence = list(protein_sequence)
+        modified_protein_sequence[site_position - 1] += f"[{mod_annotation}]"
+        modified_protein_sequence = ''.join(modified_protein_sequence)
+        ptm_entries.append((new_header, modified_protein_sequence))
+    return ptm_entries
+
 def generate_ptm_entries_glyco(peptide_list, uniprot_sequences, ptm_type):
     ptm_entries = []
     missing_peptides = []
@@ -213,86 +293,415 @@ def generate_ptm_entries_glyco(peptide_list, uniprot_sequences, ptm_type):
         if not modifications:
             continue  # Skip if there are no modifications in the peptide
 
-        for protein_id, protein_data in uniprot_sequences.items():
-            protein_sequence = protein_data['sequence']
-            peptide_start = protein_sequence.find(peptide_sequence)
-            if peptide_start != -1:
-                found_protein = True
-                inferred_protein_ids.add(protein_id)
-
-                for mod in modifications:
-                    mod_residue, mod_annotation, relative_position = mod
-                    # Calculate the protein-level position
-                    site_position = peptide_start + relative_position + 1
-                    
-                    if ptm_type == 'N-linked Glycosylation':
-                        mod_description = f"N{site_position}[{mod_annotation}]"
-                    elif ptm_type == 'O-linked Glycosylation':
-                        mod_description = f"{mod_residue}{site_position}[{mod_annotation}]"
-
-                    # Update header and sequence
-                    new_header = f"sp|{protein_id}|{mod_description}|{protein_data['header'].split('|', 2)[2]}"
-                    modified_protein_sequence = list(protein_sequence)
-                    modified_protein_sequence[site_position - 1] += f"[{mod_annotation}]"
-                    modified_protein_sequence = ''.join(modified_protein_sequence)
-                    ptm_entries.append((new_header, modified_protein_sequence))
+        # Shared peptides are assigned to their first protein and reported as ambiguous
+        hits = find_peptide(uniprot_sequences, peptide_sequence)
+        if len(hits) > 1:
+            missing_peptides.append((peptide, ptm_type, 'ambiguous', ';'.join(protein_id for protein_id, _ in hits)))
 
-                break
+        for protein_id, peptide_start in hits:
+            found_protein = True
+            inferred_protein_ids.add(protein_id)
+            ptm_entries.extend(glyco_entries(protein_id, peptide_start, modifications, uniprot_sequences, ptm_type))
+            break
 
         if not found_protein:
-            missing_peptides.append(('', peptide))
+            missing_peptides.append((peptide, ptm_type, 'no_protein_hit', ''))
 
     return ptm_entries, missing_peptides, inferred_protein_ids
 
-def write_fasta(output_file, uniprot_sequences, ptm_entries, inferred_protein_ids, include_global_protein_entries=False):
-    with open(output_file, 'w') as file:
-        written_entries = set()
-        write_count = 0
-        
+# Residue of every site annotated in a PTM entry header: 'sp|P12345|S15P_T20P|...' -> ['S', 'T']
+def header_site_residues(header):
+    parts = header.split('|')
+    if len(parts) < 4:
+        return []
+    return [site[0] for site in parts[2].split('_') if site]
+
+# Letter output mode (MSFragger): every modified site is written as a spare residue letter that the
+# search engine maps to the modified residue mass. (residue, annotation) -> letter; the defaults match
+# the B/Z/X phosphosite encoding decoded by tools.matrix_tools. Other PTMs need letters passed in
+# letter_codes, e.g. {('K', 'A'): 'J', ('N', 'H5N4'): 'O'}.
+OUTPUT_MODES = ('annotated', 'letters')
+LETTER_CODES = {('S', 'P'): 'B', ('T', 'P'): 'Z', ('Y', 'P'): 'X'}
+STANDARD_RESIDUES = set('ACDEFGHIKLMNPQRSTVWY')
+ANNOTATION_PATTERN = re.compile(r'\[([^\]]*)\]')
+
+# A letter may encode only one modified residue and must not be a standard amino acid
+def check_letter_codes(letter_codes):
+    owners = {}
+    for site, letter in letter_codes.items():
+        if len(letter) != 1 or letter in STANDARD_RESIDUES:
+            raise ValueError(f"Invalid code letter {letter!r} for {site[0]}[{site[1]}]: use a letter that is not a standard residue (B, J, O, U, X, Z).")
+        if letter in owners and owners[letter] != site:
+            other = owners[letter]
+            raise ValueError(f"Code letter {letter!r} is assigned to both {other[0]}[{other[1]}] and {site[0]}[{site[1]}].")
+        owners[letter] = site
+
+# 'K[A]=J, N[H5N4]=O' -> {('K', 'A'): 'J', ('N', 'H5N4'): 'O'} (code letters typed in the pages)
+def parse_letter_codes(text):
+    letter_codes = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        match = re.fullmatch(r'\s*([A-Z])\[([^\]]+)\]\s*=\s*(\S+)\s*', item)
+        if match is None:
+            raise ValueError(f"Invalid code letter {item.strip()!r}: write residue[annotation]=letter, e.g. K[A]=J.")
+        letter_codes[(match.group(1), match.group(2))] = match.group(3)
+    return letter_codes
+
+# Fail before a run starts when a selected PTM type has a modifiable residue without a code letter.
+# Glycan compositions are only known once peptides are read, so glycosylation is checked while writing.
+def check_letter_codes_cover(modification_types, letter_codes=None):
+    letter_codes = {**LETTER_CODES, **(letter_codes or {})}
+    check_letter_codes(letter_codes)
+    for ptm_type in modification_types:
+        if ptm_type in MODIFICATION_RULES:
+            residues, _, code = MODIFICATION_RULES[ptm_type]
+            missing = [f"{residue}[{code}]" for residue in residues if (residue, code) not in letter_codes]
+            if missing:
+                raise ValueError(f"No code letter for {', '.join(missing)} ({ptm_type}); add it to letter_codes.")
+
+# 'MS[P]EK' -> [(1, 'S', 'P')]: 0-based position in the clean sequence, residue and annotation
+def annotated_sites(sequence):
+    sites = []
+    removed = 0
+    for match in ANNOTATION_PATTERN.finditer(sequence):
+        position = match.start() - removed - 1
+        sites.append((position, sequence[match.start() - 1], match.group(1)))
+        removed += match.end() - match.start()
+    return sites
+
+# Fail on the first batch of entries with a site that has no code letter (e.g. a glycan composition
+# missing from letter_codes) instead of after the whole match
+def check_entry_letter_codes(ptm_entries, letter_codes):
+    for header, sequence in ptm_entries:
+        for _, residue, annotation in annotated_sites(sequence):
+            if (residue, annotation) not in letter_codes:
+                raise ValueError(f"No code letter for {residue}[{annotation}] ({header.split('|')[1]}); add it to letter_codes.")
+
+# Site table of a list of annotated PTM entries: {protein_id: {0-based position: (residue, annotation)}}.
+# Returns the table and the number of sites dropped because another PTM already occupies the position.
+def collect_site_table(ptm_entries, letter_codes=None):
+    site_table = {}
+    conflicts = 0
+    for header, sequence in ptm_entries:
+        protein_id = header.split('|')[1]
+        protein_sites = site_table.setdefault(protein_id, {})
+        for position, residue, annotation in annotated_sites(sequence):
+            if letter_codes is not None and (residue, annotation) not in letter_codes:
+                raise ValueError(f"No code letter for {residue}[{annotation}] ({protein_id}); add it to letter_codes.")
+            if protein_sites.setdefault(position, (residue, annotation)) != (residue, annotation):
+                conflicts += 1
+    return site_table, conflicts
+
+# Protein positions where the enzyme cuts, including both ends: [0, ..., len(sequence)]
+def cleavage_boundaries(sequence, enzyme):
+    from .search_space import ENZYMES
+    cleaved, blocking = ENZYMES[enzyme]
+    pattern = f"[{cleaved}]" + (f"(?![{blocking}])" if blocking else '')
+    boundaries = [0] + [match.end() for match in re.finditer(pattern, sequence)]
+    if boundaries[-1] != len(sequence):
+        boundaries.append(len(sequence))
+    return boundaries
+
+# (start, end) slices covering every site with window_cleavages cleavage sites on each side, i.e. every
+# peptide with up to window_cleavages missed cleavages that contains a site; overlapping windows are merged
+def site_windows(sequence, positions, window_cleavages, enzyme='trypsin'):
+    boundaries = cleavage_boundaries(sequence, enzyme)
+    windows = []
+    for position in sorted(positions):
+        i = bisect_right(boundaries, position) - 1
+        start = boundaries[max(i - window_cleavages, 0)]
+        end = boundaries[min(i + 1 + window_cleavages, len(boundaries) - 1)]
+        if windows and start < windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return [tuple(window) for window in windows]
+
+def site_description(position, residue, annotation):
+    return f"{residue}{position + 1}{annotation}" if len(annotation) == 1 else f"{residue}{position + 1}[{annotation}]"
+
+# Render a site table as one entry per protein, or one entry per site window when window_cleavages is
+# set (header gets ' WIN=start-end', 1-based and inclusive; site positions stay protein coordinates).
+# With letter_codes the sites are substituted by their code letters in a single bytearray pass,
+# otherwise they are written as bracket annotations.
+def render_site_entries(site_table, uniprot_sequences, letter_codes=None, window_cleavages=None, enzyme='trypsin'):
+    entries = []
+    for protein_id, protein_sites in site_table.items():
+        protein_data = uniprot_sequences[protein_id]
+        protein_sequence = protein_data['sequence']
+        description = protein_data['header'].split('|', 2)[2]
+        if window_cleavages is None:
+            windows = [(0, len(protein_sequence))]
+        else:
+            windows = site_windows(protein_sequence, protein_sites, window_cleavages, enzyme)
+
+        for start, end in windows:
+            positions = [position for position in sorted(protein_sites) if start <= position < end]
+            if letter_codes is not None:
+                sequence = bytearray(protein_sequence[start:end].encode('ascii'))
+                for position in positions:
+                    sequence[position - start] = ord(letter_codes[protein_sites[position]])
+                sequence = sequence.decode('ascii')
+            else:
+                pieces, last = [], start
+                for position in positions:
+                    pieces.append(protein_sequence[last:position + 1])
+                    pieces.append(f"[{protein_sites[position][1]}]")
+                    last = position + 1
+                pieces.append(protein_sequence[last:end])
+                sequence = ''.join(pieces)
+            sites = '_'.join(site_description(position, *protein_sites[position]) for position in positions)
+            header = f"sp|{protein_id}|{sites}|{description}"
+            if window_cleavages is not None:
+                header += f" WIN={start + 1}-{end}"
+            entries.append((header, sequence))
+    return entries
+
+# Target-decoy output: every written entry is followed by a decoy whose header is the target header with
+# decoy_prefix in front. Residues are handled as tokens with their annotation attached ('S[P]'), so
+# modifications move with their residue. 'reverse' reverses the whole sequence; 'pseudo-reverse'
+# reverses each tryptic peptide but keeps its C-terminal K/R in place; 'shuffle' shuffles each tryptic
+# peptide (keeping the C-terminal K/R) with a generator seeded from decoy_seed and the header, so the
+# same target always gets the same decoy.
+DECOY_METHODS = ('reverse', 'pseudo-reverse', 'shuffle')
+DECOY_PREFIX = 'rev_'
+RESIDUE_TOKEN_PATTERN = re.compile(r'[^\[](?:\[[^\]]*\])?')
+
+# Tokens split after every K/R, each with its C-terminal K/R (if any) separated out
+def tryptic_token_segments(tokens):
+    segment = []
+    for token in tokens:
+        segment.append(token)
+        if token[0] in 'KR':
+            yield segment[:-1], segment[-1:]
+            segment = []
+    if segment:
+        yield segment, []
+
+def decoy_sequence(sequence, method, rng=None):
+    tokens = RESIDUE_TOKEN_PATTERN.findall(sequence)
+    if method == 'reverse':
+        return ''.join(reversed(tokens))
+    pieces = []
+    for body, cleavage in tryptic_token_segments(tokens):
+        if method == 'pseudo-reverse':
+            body.reverse()
+        elif method == 'shuffle':
+            rng.shuffle(body)
+        else:
+            raise ValueError(f"Unsupported decoy method: {method}. Use one of {', '.join(DECOY_METHODS)}.")
+        pieces.extend(body)
+        pieces.extend(cleavage)
+    return ''.join(pieces)
+
+# Incremental FASTA writer: PTM entries are written (deduplicated) as they arrive with write(), and
+# close() adds the global protein entries and returns the statistics. Output ending in .gz or .zst is
+# compressed on compression_threads threads (see tools.compression). The file is written under a
+# temporary name and only replaces output_file when close() succeeds.
+# output_mode='letters' writes one entry per protein with its sites encoded as code letters (see
+# LETTER_CODES) instead of one bracket-annotated copy per peptide.
+# window_cleavages=N writes only the part of each protein within N enzyme cleavage sites of its sites
+# (overlapping windows merged, one entry per window) in either output mode.
+# Both modes need every site of a protein first, so their entries are held until close().
+# decoy_method writes a decoy after every entry (see DECOY_METHODS).
+class FastaWriter:
+    def __init__(self, output_file, uniprot_sequences, include_global_protein_entries=False, compression_threads=None,
+                 output_mode='annotated', letter_codes=None, window_cleavages=None, enzyme='trypsin',
+                 decoy_method=None, decoy_prefix=DECOY_PREFIX, decoy_seed=0):
+        if decoy_method is not None and decoy_method not in DECOY_METHODS:
+            raise ValueError(f"Unsupported decoy method: {decoy_method}. Use one of {', '.join(DECOY_METHODS)}.")
+        if output_mode == 'letters':
+            letter_codes = {**LETTER_CODES, **(letter_codes or {})}
+            check_letter_codes(letter_codes)
+        elif output_mode == 'annotated':
+            letter_codes = None
+        else:
+            raise ValueError(f"Unsupported output mode: {output_mode}. Use one of {', '.join(OUTPUT_MODES)}.")
+        self.output_file = output_file
+        self.uniprot_sequences = uniprot_sequences
+        self.include_global_protein_entries = include_global_protein_entries
+        self.letter_codes = letter_codes
+        self.window_cleavages = window_cleavages
+        self.enzyme = enzyme
+        self.decoy_method = decoy_method
+        self.decoy_prefix = decoy_prefix
+        self.decoy_seed = decoy_seed
+        self.held_entries = [] if output_mode == 'letters' or window_cleavages is not None else None
+        self.stats = {
+            'output_mode': output_mode,
+            'window_cleavages': window_cleavages,
+            'total_entries': 0,
+            'ptm_entries': 0,
+            'protein_entries': 0,
+            'decoy_entries': 0,
+            'decoy_method': decoy_method,
+            'unique_protein_ids': 0,
+            'sites_per_residue': {},
+            'site_conflicts': 0,
+            'uncompressed_bytes': 0,
+            'file_bytes': 0,
+        }
+        self.protein_ids = set()
+        self.sites_per_residue = Counter()
+        self.written_entries = set()
+        self.temporary_file = temporary_file(output_file)
+        self.file = open_fasta(self.temporary_file, 'wt', threads=compression_threads)
+
+    def __enter__(self):
+        return self
+
+    # Leaving the block without close() (e.g. on an error) discards the partial file
+    def __exit__(self, *exc_info):
+        self.file.close()
+        if os.path.exists(self.temporary_file):
+            os.remove(self.temporary_file)
+
+    def write_entry(self, header, sequence, kind):
+        entry = (header, sequence)
+        if entry in self.written_entries:
+            return
+        text = f">{header}\n{format_fasta_sequence(sequence)}\n"
+        self.file.write(text)
+        self.written_entries.add(entry)
+        self.stats[kind] += 1
+        self.stats['uncompressed_bytes'] += len(text)
+        self.protein_ids.add(header.split(' ', 1)[0].split('|')[1])
+        if kind == 'ptm_entries':
+            self.sites_per_residue.update(header_site_residues(header))
+        if self.decoy_method is not None:
+            rng = random.Random(f"{self.decoy_seed}:{header}") if self.decoy_method == 'shuffle' else None
+            text = f">{self.decoy_prefix}{header}\n{format_fasta_sequence(decoy_sequence(sequence, self.decoy_method, rng))}\n"
+            self.file.write(text)
+            self.stats['decoy_entries'] += 1
+            self.stats['uncompressed_bytes'] += len(text)
+
+    def write(self, ptm_entries):
+        if self.held_entries is not None:
+            if self.letter_codes is not None:
+                check_entry_letter_codes(ptm_entries, self.letter_codes)
+            self.held_entries.extend(ptm_entries)
+            return
         for header, sequence in ptm_entries:
-            formatted_sequence = format_fasta_sequence(sequence)
-            entry = (header, formatted_sequence)
-            if entry not in written_entries:
-                file.write(f">{header}\n{formatted_sequence}\n")
-                written_entries.add(entry)
-                write_count += 1
-        
-        if include_global_protein_entries:
+            self.write_entry(header, sequence, 'ptm_entries')
+
+    def close(self, inferred_protein_ids=()):
+        if self.held_entries is not None:
+            site_table, self.stats['site_conflicts'] = collect_site_table(self.held_entries, self.letter_codes)
+            self.held_entries = None
+            if self.stats['site_conflicts']:
+                print(f"{self.stats['site_conflicts']} sites were skipped because another modification occupies the same residue")
+            for header, sequence in render_site_entries(site_table, self.uniprot_sequences, self.letter_codes, self.window_cleavages, self.enzyme):
+                self.write_entry(header, sequence, 'ptm_entries')
+
+        if self.include_global_protein_entries:
             for protein_id in inferred_protein_ids:
-                if protein_id in uniprot_sequences:
-                    data = uniprot_sequences[protein_id]
-                    header = data['header']
-                    sequence = format_fasta_sequence(data['sequence'])
-                    entry = (header, sequence)
-                    if entry not in written_entries:
-                        file.write(f">{header}\n{sequence}\n")
-                        written_entries.add(entry)
-                        write_count += 1
-
-        print(f"Total unique entries written: {write_count}")
-
-def write_missing_info(output_file_dir, missing_peptides):
-    # Convert the missing peptides list into a DataFrame and remove duplicates
-    missing_peptides_df = pd.DataFrame(missing_peptides, columns=['Peptide Sequence']).drop_duplicates()
-
-    # Set the output file path with the new name
-    output_file = os.path.join(output_file_dir, 'missing_peptides.xlsx')
+                if protein_id in self.uniprot_sequences:
+                    data = self.uniprot_sequences[protein_id]
+                    self.write_entry(data['header'], data['sequence'], 'protein_entries')
+        self.file.close()
+        os.replace(self.temporary_file, self.output_file)
+
+        stats = self.stats
+        stats['total_entries'] = stats['ptm_entries'] + stats['protein_entries'] + stats['decoy_entries']
+        print(f"Total unique entries written: {stats['total_entries']}")
+        stats['unique_protein_ids'] = len(self.protein_ids)
+        stats['sites_per_residue'] = dict(sorted(self.sites_per_residue.items()))
+        stats['file_bytes'] = os.path.getsize(self.output_file)
+        return stats
+
+# Write a complete database in one call (see FastaWriter). Returns statistics collected while writing:
+# entry counts, unique (target) protein IDs, modified sites per residue and the uncompressed/on-disk sizes.
+def write_fasta(output_file, uniprot_sequences, ptm_entries, inferred_protein_ids, include_global_protein_entries=False, compression_threads=None,
+                output_mode='annotated', letter_codes=None, window_cleavages=None, enzyme='trypsin',
+                decoy_method=None, decoy_prefix=DECOY_PREFIX, decoy_seed=0):
+    with FastaWriter(output_file, uniprot_sequences, include_global_protein_entries, compression_threads,
+                     output_mode, letter_codes, window_cleavages, enzyme, decoy_method, decoy_prefix, decoy_seed) as writer:
+        writer.write(ptm_entries)
+        return writer.close(inferred_protein_ids)
+
+# Stream report rows to a TSV file, or to Parquet with file_format='parquet' (needs pyarrow)
+def write_report_rows(output_file, rows, file_format='tsv'):
+    if file_format == 'tsv':
+        with open(output_file, 'w', newline='') as file:
+            writer = csv.writer(file, delimiter='\t', lineterminator='\n')
+            writer.writerow(MISSING_COLUMNS)
+            writer.writerows(rows)
+    elif file_format == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing the missing-peptide report as Parquet requires the 'pyarrow' package.")
+        schema = pa.schema([(column, pa.string()) for column in MISSING_COLUMNS])
+        with pq.ParquetWriter(output_file, schema) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= MISSING_BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist([dict(zip(MISSING_COLUMNS, row)) for row in batch], schema))
+                    batch = []
+            writer.write_table(pa.Table.from_pylist([dict(zip(MISSING_COLUMNS, row)) for row in batch], schema))
+    else:
+        raise ValueError(f"Unsupported report format: {file_format}. Use 'tsv' or 'parquet'.")
+
+# Stream the unmatched-peptide report (rows from generate_ptm_entries / generate_ptm_entries_glyco) to
+# missing_peptides.tsv, or missing_peptides.parquet with file_format='parquet' (needs pyarrow), so it
+# lists only peptides without an entry; shared ('ambiguous') peptides go to shared_peptides.tsv/.parquet.
+# Duplicate rows are written once. Returns both report paths, the number of missing rows per reason
+# and the number of shared rows.
+def write_missing_info(output_file_dir, missing_peptides, file_format='tsv'):
+    output_file = os.path.join(output_file_dir, f'missing_peptides.{file_format}')
+    shared_file = os.path.join(output_file_dir, f'shared_peptides.{file_format}')
+    counts = dict.fromkeys(MISSING_REASONS, 0)
+    shared_count = 0
+    written_rows = set()
+
+    def unique_rows(shared):
+        nonlocal shared_count
+        for row in missing_peptides:
+            row = tuple(row)
+            if (row[2] == SHARED_REASON) != shared or row in written_rows:
+                continue
+            written_rows.add(row)
+            if shared:
+                shared_count += 1
+            else:
+                counts[row[2]] = counts.get(row[2], 0) + 1
+            yield row
 
-    # Write the missing peptides to an Excel file
-    with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
-        missing_peptides_df.to_excel(writer, sheet_name='Missing Peptides', index=False)
+    write_report_rows(output_file, unique_rows(False), file_format)
+    write_report_rows(shared_file, unique_rows(True), file_format)
 
     print(f"Missing peptides have been recorded in {output_file}")
+    return {'file': output_file, 'counts': counts, 'shared_file': shared_file, 'shared_count': shared_count}
+
+# Optional conversion of a missing-peptide report to Excel, split over sheets at Excel's row limit
+def convert_missing_report_to_excel(report_file, excel_file=None):
+    import pandas as pd
+    excel_file = excel_file or os.path.splitext(report_file)[0] + '.xlsx'
+    if report_file.endswith('.parquet'):
+        report_df = pd.read_parquet(report_file)
+    else:
+        report_df = pd.read_csv(report_file, sep='\t', dtype=str, keep_default_na=False)
+
+    with pd.ExcelWriter(excel_file, engine='xlsxwriter') as writer:
+        for i, start in enumerate(range(0, max(len(report_df), 1), EXCEL_MAX_ROWS), 1):
+            sheet_name = 'Missing Peptides' if i == 1 else f'Missing Peptides {i}'
+            report_df.iloc[start:start + EXCEL_MAX_ROWS].to_excel(writer, sheet_name=sheet_name, index=False)
+    return excel_file
 
 def count_entries_in_fasta(fasta_file):
+    from Bio import SeqIO
     entries = set()
     protein_ids = set()
-    for record in SeqIO.parse(fasta_file, "fasta"):
-        header = record.description
-        sequence = str(record.seq)
-        entries.add((header, sequence))
-        protein_id = record.id.split('|')[1]
-        protein_ids.add(protein_id)
+    with open_fasta(fasta_file) as handle:
+        for record in SeqIO.parse(handle, "fasta"):
+            header = record.description
+            sequence = str(record.seq)
+            entries.add((header, sequence))
+            protein_id = record.id.split('|')[1]
+            protein_ids.add(protein_id)
     return len(entries), len(protein_ids)
 
 
@@ -0,0 +1,284 @@
+import argparse
+import os
+import pickle
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, Pipe, Process, cpu_count
+from multiprocessing.connection import Client, Listener, wait
+
+# Executor backends for the matching work of a generation run. Every backend is a context manager
+# with an ordered, bounded imap(func, items, window): items are pulled lazily, at most `window` tasks
+# are in flight, and results come back in input order, so the caller can keep producing items (e.g.
+# parsing the next peptide batches) while the workers run.
+#   serial     in this process, one task at a time (debugging, profiling)
+#   threads    a thread pool (scales on free-threaded Python builds)
+#   processes  a multiprocessing pool on this machine
+#   cluster    worker servers reached over sockets (multiprocessing.connection), on this or other
+#              machines; start them with `python -m ptmdatabase.tools.executors worker --port N`.
+# Tasks sent to a cluster are pickled: functions by module path (every worker needs this package) and
+# a tools.proteome.Proteome by its file paths (workers need the same paths, e.g. a shared filesystem).
+#
+# Trust model: a worker unpickles every task it receives, so anyone who can connect to it and knows
+# the shared key can run arbitrary code as the worker's user. The key (PTMDATABASE_CLUSTER_KEY or
+# --authkey) is therefore required, with no built-in default; keep it secret, listen on 127.0.0.1
+# (the default) or a trusted private network only, and never expose worker ports to the internet.
+# The key authenticates connections but does not encrypt them.
+
+EXECUTOR_BACKENDS = ('serial', 'threads', 'processes', 'cluster')
+CLUSTER_KEY_VARIABLE = 'PTMDATABASE_CLUSTER_KEY'
+TASKS_PER_WORKER = 2
+
+# Shared cluster key as bytes: the given key, else $PTMDATABASE_CLUSTER_KEY; there is no default
+def cluster_authkey(authkey=None):
+    authkey = authkey or os.environ.get(CLUSTER_KEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"The cluster backend needs a shared key: set {CLUSTER_KEY_VARIABLE} or pass an authkey.")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+# Yield func(item) in order with at most `window` submitted tasks not yet yielded; submit(func, item)
+# returns an object with a result() method
+def ordered_window(submit, func, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class SerialExecutor:
+    def __init__(self, workers=None):
+        self.workers = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def imap(self, func, items, window=None):
+        for item in items:
+            yield func(item)
+
+
+class ThreadExecutor:
+    def __init__(self, workers=None):
+        self.workers = workers or cpu_count()
+        self.pool = None
+
+    def __enter__(self):
+        self.pool = ThreadPoolExecutor(self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.shutdown(cancel_futures=True)
+
+    def imap(self, func, items, window=None):
+        return ordered_window(self.pool.submit, func, items, window or self.workers * TASKS_PER_WORKER)
+
+
+class ProcessExecutor:
+    def __init__(self, workers=None):
+        self.workers = workers or cpu_count()
+        self.pool = None
+
+    # Start the pool before the caller starts any thread, so workers are never forked while a thread
+    # holds a lock
+    def __enter__(self):
+        self.pool = Pool(self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.terminate()
+        self.pool.join()
+
+    def submit(self, func, item):
+        return AsyncTask(self.pool.apply_async(func, (item,)))
+
+    def imap(self, func, items, window=None):
+        return ordered_window(self.submit, func, items, window or self.workers * TASKS_PER_WORKER)
+
+
+# multiprocessing AsyncResult with the result() method of a concurrent.futures Future
+class AsyncTask:
+    def __init__(self, async_result):
+        self.async_result = async_result
+
+    def result(self):
+        return self.async_result.get()
+
+
+class ClusterExecutor:
+    def __init__(self, addresses, authkey=None, tasks_per_worker=TASKS_PER_WORKER):
+        self.addresses = [parse_address(address) if isinstance(address, str) else tuple(address) for address in addresses]
+        if not self.addresses:
+            raise ValueError("The cluster backend needs at least one worker address (host:port).")
+        self.authkey = cluster_authkey(authkey)
+        self.tasks_per_worker = tasks_per_worker
+        self.workers = len(self.addresses)
+        self.connections = []
+
+    def __enter__(self):
+        try:
+            for address in self.addresses:
+                self.connections.append(Client(address, authkey=self.authkey))
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        for connection in self.connections:
+            try:
+                connection.send(('close',))
+                connection.close()
+            except OSError:
+                pass
+        self.connections = []
+
+    # Tasks go to whichever worker has a free slot (dynamic load balancing); results are reordered
+    def imap(self, func, items, window=None):
+        window = window or self.workers * self.tasks_per_worker
+        items = iter(items)
+        capacity = {connection: self.tasks_per_worker for connection in self.connections}
+        finished = {}
+        submitted = yielded = 0
+        exhausted = False
+        while True:
+            while not exhausted and submitted - yielded < window:
+                connection = max(capacity, key=capacity.get)
+                if capacity[connection] == 0:
+                    break
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                connection.send(('task', submitted, func, item))
+                capacity[connection] -= 1
+                submitted += 1
+
+            if yielded in finished:
+                yield finished.pop(yielded)
+                yielded += 1
+                continue
+            if exhausted and yielded == submitted:
+                return
+
+            for connection in wait([connection for connection in self.connections if capacity[connection] < self.tasks_per_worker]):
+                try:
+                    status, task_id, payload = connection.recv()
+                except EOFError:
+                    raise RuntimeError(f"Cluster worker {connection_address(self, connection)} disconnected.")
+                if status == 'error':
+                    raise payload
+                capacity[connection] += 1
+                finished[task_id] = payload
+
+def connection_address(executor, connection):
+    host, port = executor.addresses[executor.connections.index(connection)]
+    return f"{host}:{port}"
+
+def make_executor(backend='processes', workers=None, addresses=None, authkey=None):
+    if backend == 'serial':
+        return SerialExecutor()
+    if backend == 'threads':
+        return ThreadExecutor(workers)
+    if backend == 'processes':
+        return ProcessExecutor(workers)
+    if backend == 'cluster':
+        return ClusterExecutor(addresses or [], authkey)
+    raise ValueError(f"Unsupported executor backend: {backend}. Use one of {', '.join(EXECUTOR_BACKENDS)}.")
+
+# Worker side of the cluster protocol: run ('task', id, func, item) messages one at a time and answer
+# ('ok', id, result) or ('error', id, exception) until ('close',) or the client disconnects. Messages
+# are unpickled here so a task whose module cannot be imported is reported instead of killing the worker.
+def serve_connection(connection):
+    while True:
+        try:
+            data = connection.recv_bytes()
+        except EOFError:
+            return
+        try:
+            message = pickle.loads(data)
+        except Exception:
+            connection.send(('error', None, RuntimeError(f"Worker {os.getpid()} could not load a task:\n{traceback.format_exc()}")))
+            continue
+        if message[0] == 'close':
+            return
+        _, task_id, func, item = message
+        try:
+            connection.send(('ok', task_id, func(item)))
+        except Exception:
+            connection.send(('error', task_id, RuntimeError(f"Task {task_id} failed on worker {os.getpid()}:\n{traceback.format_exc()}")))
+
+def serve_worker(host='127.0.0.1', port=0, authkey=None, ready=None):
+    """Serve cluster tasks on (host, port) until the process is stopped.
+
+    Every task is unpickled and run, so a client holding the key can execute arbitrary code here.
+    The key is required (authkey or $PTMDATABASE_CLUSTER_KEY). Bind to 127.0.0.1 (the default) or
+    an interface on a trusted private network only.
+    """
+    authkey = cluster_authkey(authkey)
+    with Listener((host, port), authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        else:
+            print(f"Generation worker listening on {listener.address[0]}:{listener.address[1]}")
+        while True:
+            with listener.accept() as connection:
+                serve_connection(connection)
+
+
+# Stand-in cluster of worker servers on 127.0.0.1 (tests, benchmarks, single-host runs); without a
+# key a random one is generated, pass cluster.authkey to the executor
+class LocalCluster:
+    def __init__(self, workers=2, authkey=None):
+        self.n_workers = workers
+        self.authkey = authkey or os.urandom(16).hex()
+        self.processes = []
+        self.addresses = []
+
+    def __enter__(self):
+        for _ in range(self.n_workers):
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=serve_worker, args=('127.0.0.1', 0, self.authkey, sender), daemon=True)
+            process.start()
+            sender.close()
+            host, port = receiver.recv()
+            receiver.close()
+            self.processes.append(process)
+            self.addresses.append(f"{host}:{port}")
+        return self
+
+    def __exit__(self, *exc_info):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        self.processes = []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a generation worker server for the cluster executor backend.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker = subparsers.add_parser('worker', help="Serve matching tasks on a TCP port.")
+    worker.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: 127.0.0.1; use a trusted private network only).")
+    worker.add_argument('--port', type=int, required=True, help="Port to listen on.")
+    worker.add_argument('--authkey', help="Shared key (default: $PTMDATABASE_CLUSTER_KEY; one of them is required).")
+    args = parser.parse_args(argv)
+    if not (args.authkey or os.environ.get(CLUSTER_KEY_VARIABLE)):
+        parser.error(f"refusing to start without a shared key: set {CLUSTER_KEY_VARIABLE} or pass --authkey.")
+
+    # Tasks from the Streamlit pages reference 'tools.*' modules; make them importable as well
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    serve_worker(args.host, args.port, args.authkey)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from .database_tools import (
+    iter_peptide_batches,
+    generate_ptm_entries,
+    FastaWriter,
+    DECOY_PREFIX,
+    write_missing_info,
+    generate_ptm_entries_glyco,
+    check_letter_codes_cover,
+)
+from .executors import make_executor
+from .proteome import load_proteome
+from .sharded_proteome import load_sharded_proteome
+from .run_report import RunReport, REPORT_SUFFIX
+from .profiling import profile_capture
+
+# Stages reported to the progress callback, in execution order (they overlap in the pipeline).
+# Protein inference is done per batch by the matching workers and is part of 'match'.
+GENERATION_STAGES = ('load', 'parse', 'match', 'write')
+
+PTM_TYPES = ['Phosphorylation', 'Acetylation', 'Ubiquitination', 'N-linked Glycosylation', 'O-linked Glycosylation']
+
+def process_peptide_phosphorylation(args):
+    chunk, uniprot_sequences = args
+    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
+    for peptide in chunk:
+        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Phosphorylation')
+        ptm_entries.extend(entries)
+        missing_peptides.extend(peptides)
+        inferred_protein_ids.update(inferred_ids)
+    return ptm_entries, missing_peptides, inferred_protein_ids
+
+def process_peptide_acetylation(args):
+    chunk, uniprot_sequences = args
+    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
+    for peptide in chunk:
+        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Acetylation')
+        ptm_entries.extend(entries)
+        missing_peptides.extend(peptides)
+        inferred_protein_ids.update(inferred_ids)
+    return ptm_entries, missing_peptides, inferred_protein_ids
+
+def process_peptide_ubiquitination(args):
+    chunk, uniprot_sequences = args
+    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
+    for peptide in chunk:
+        entries, peptides, inferred_ids = generate_ptm_entries([peptide], uniprot_sequences, 'Ubiquitination')
+        ptm_entries.extend(entries)
+        missing_peptides.extend(peptides)
+        inferred_protein_ids.update(inferred_ids)
+    return ptm_entries, missing_peptides, inferred_protein_ids
+
+
+def process_peptide_glycosylation(args):
+    chunk, uniprot_sequences, ptm_type = args
+    ptm_entries, missing_peptides, inferred_protein_ids = [], [], set()
+    for peptide in chunk:
+        entries, peptides, inferred_ids = generate_ptm_entries_glyco([peptide], uniprot_sequences, ptm_type)
+        ptm_entries.extend(entries)
+        missing_peptides.extend(peptides)
+        inferred_protein_ids.update(inferred_ids)
+    return ptm_entries, missing_peptides, inferred_protein_ids
+
+def chunk_list(lst, n):
+    """Divide list lst into n chunks."""
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
+
+def build_worker_args(ptm_type, chunked_peptide_list, uniprot_sequences):
+    if ptm_type == 'Phosphorylation':
+        return process_peptide_phosphorylation, [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
+    if ptm_type == 'Acetylation':
+        return process_peptide_acetylation, [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
+    if ptm_type == 'Ubiquitination':
+        return process_peptide_ubiquitination, [(chunk, uniprot_sequences) for chunk in chunked_peptide_list]
+    if ptm_type in ('N-linked Glycosylation', 'O-linked Glycosylation'):
+        return process_peptide_glycosylation, [(chunk, uniprot_sequences, ptm_type) for chunk in chunked_peptide_list]
+    raise ValueError(f"Unsupported PTM type: {ptm_type}")
+
+def report_nothing(stage, done, total, finished=False):
+    pass
+
+# Pipelined generation: peptides are matched in batches of PEPTIDE_BATCH_SIZE; the parser thread runs
+# at most PARSE_QUEUE_SIZE batches ahead of matching, at most BATCHES_PER_WORKER batches per worker are
+# in flight, and at most WRITE_QUEUE_SIZE finished batches wait for the writer thread, so memory stays
+# bounded while the stages overlap.
+PEPTIDE_BATCH_SIZE = 2000
+PARSE_QUEUE_SIZE = 8
+BATCHES_PER_WORKER = 2
+WRITE_QUEUE_SIZE = 8
+
+def process_peptide_batch(args):
+    ptm_type, batch, uniprot_sequences = args
+    worker, worker_args = build_worker_args(ptm_type, [batch], uniprot_sequences)
+    return worker(worker_args[0])
+
+# Writer thread: write batches of entries until None arrives, reporting the entries written. After an
+# error the queue is still drained so the producer never blocks; the error is raised when the thread is joined.
+def drain_entries(writer, entry_queue, progress=report_nothing):
+    error = None
+    written = 0
+    while True:
+        entries = entry_queue.get()
+        if entries is None:
+            break
+        if error is None:
+            try:
+                writer.write(entries)
+                written += len(entries)
+                progress('write', written, written)
+            except Exception as exc:
+                error = exc
+    if error is not None:
+        raise error
+
+# Put item on item_queue unless stopping is set first (the consumer has given up); returns whether it was put
+def put_unless_stopped(item_queue, item, stopping):
+    while not stopping.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# Parser thread: put every batch, then None, on batch_queue; stops early when the pipeline is stopping
+def parse_ahead(batches, batch_queue, stopping):
+    try:
+        for batch in batches:
+            if not put_unless_stopped(batch_queue, batch, stopping):
+                return
+    finally:
+        put_unless_stopped(batch_queue, None, stopping)
+
+# Batches from the parser thread until None; a parse error is raised here once the queue is drained
+def queued_batches(batch_queue, parsing):
+    while True:
+        batch = batch_queue.get()
+        if batch is None:
+            break
+        yield batch
+    parsing.result()
+
+# Event that is set when the block exits, however it exits
+@contextmanager
+def stop_event():
+    stopping = threading.Event()
+    try:
+        yield stopping
+    finally:
+        stopping.set()
+
+# Full generation run as an overlapped pipeline: the proteome loads in one thread while the peptide
+# file is parsed in batches in another, batches are matched by the executor as soon as both are ready
+# (one pass per PTM type, in PTM_TYPES order), and finished entries stream to a writer thread while
+# later batches are still being matched. Output is identical to running the stages one after another.
+# executor selects where matching runs: 'serial', 'threads', 'processes' (default, `workers`
+# processes) or 'cluster' (worker servers at cluster_addresses sharing $PTMDATABASE_CLUSTER_KEY, see tools.executors).
+# progress(stage, done, total, finished=False) is called as each stage (GENERATION_STAGES) advances,
+# with finished=True once when the stage is complete; per-stage timings and memory are
+# recorded in a JSON run report written next to the output FASTA.
+# With shard_residues the proteome is sharded on disk and matched out of core (see tools.sharded_proteome),
+# for databases that do not fit in memory; the whole peptide list is then parsed before matching.
+# output_mode='letters' writes one entry per protein with its sites as MSFragger code letters
+# (see database_tools.LETTER_CODES; letter_codes adds or overrides letters).
+# window_cleavages=N keeps only the protein regions within N enzyme cleavage sites of the observed sites.
+# decoy_method adds a target-decoy entry after every entry (see database_tools.DECOY_METHODS).
+# profile='sampling' or 'deterministic' profiles the pipeline and writes <output>.pstats and
+# <output>.collapsed next to the output (see tools.profiling).
+def generate_database(matrix_file, output_file, fasta_file, modification_types, include_global_protein_entries=False, progress=None, shard_residues=None,
+                      output_mode='annotated', letter_codes=None, window_cleavages=None, enzyme='trypsin',
+                      decoy_method=None, decoy_prefix=DECOY_PREFIX, decoy_seed=0,
+                      executor='processes', workers=None, cluster_addresses=None, profile=None):
+    progress = progress or report_nothing
+    if output_mode == 'letters':
+        check_letter_codes_cover(modification_types, letter_codes)
+    # An earlier run's report stops describing output_file once this run starts: a run that fails
+    # leaves no report rather than one that search_space.generation_encoding would trust
+    if os.path.exists(output_file + REPORT_SUFFIX):
+        os.remove(output_file + REPORT_SUFFIX)
+    start_time = time.time()
+    report = RunReport('generate_database', {
+        'matrix_file': matrix_file,
+        'output_file': output_file,
+        'fasta_file': fasta_file,
+        'modification_types': list(modification_types),
+        'include_global_protein_entries': include_global_protein_entries,
+        'shard_residues': shard_residues,
+        'output_mode': output_mode,
+        # [residue, annotation, letter] rows: JSON has no tuple keys
+        'letter_codes': [[residue, annotation, letter] for (residue, annotation), letter in letter_codes.items()] if letter_codes else None,
+        'window_cleavages': window_cleavages,
+        'enzyme': enzyme,
+        'decoy_method': decoy_method,
+        'decoy_prefix': decoy_prefix,
+        'decoy_seed': decoy_seed,
+        'executor': executor,
+        'workers': workers,
+        'cluster_addresses': cluster_addresses,
+        'profile': profile,
+    })
+
+    selected_types = [ptm_type for ptm_type in PTM_TYPES if ptm_type in modification_types]
+    batches = []
+    counts = {'peptides': 0, 'matched': 0}
+
+    def load():
+        progress('load', 0, 1)
+        with report.stage('load_sharded_proteome' if shard_residues else 'load_proteome', overlapped=True) as record:
+            # Memory-mapped proteome: pool workers receive only its file paths and share the mapped pages
+            proteome = load_sharded_proteome(fasta_file, shard_residues) if shard_residues else load_proteome(fasta_file)
+            record['items'] = len(proteome)
+        progress('load', len(proteome), len(proteome), finished=True)
+        return proteome
+
+    def parse_batches():
+        progress('parse', 0, 1)
+        with report.stage('parse_matrix_file', overlapped=True) as record:
+            for batch in iter_peptide_batches(matrix_file, PEPTIDE_BATCH_SIZE):
+                batches.append(batch)
+                counts['peptides'] += len(batch)
+                progress('parse', counts['peptides'], counts['peptides'])
+                yield batch
+            record['items'] = counts['peptides']
+        progress('parse', counts['peptides'], counts['peptides'], finished=True)
+
+    # (ptm_type, batch) in output order; the first PTM type consumes batches as they are parsed
+    def matching_tasks(first_batches):
+        for i, ptm_type in enumerate(selected_types):
+            for batch in (first_batches if i == 0 else batches):
+                yield ptm_type, batch
+
+    ptm_entries_written = 0
+    missing_peptides = []
+    inferred_protein_ids = set()
+    entry_queue = queue.Queue(WRITE_QUEUE_SIZE)
+
+    # The executor is started before any thread (including the profiler's sampler), so pool workers are
+    # never forked while a thread holds a lock. `stopping` is set before the threads are joined, so the
+    # parser thread never waits forever on a pipeline that failed.
+    with report.stage('pipeline') as pipeline_record, make_executor(executor, workers, cluster_addresses) as pool, \
+            profile_capture(profile, output_file) as profile_record, ThreadPoolExecutor(3) as threads, stop_event() as stopping:
+        loading = threads.submit(load)
+        if shard_residues:
+            # Only the proteins hit by the peptide list are kept and handed to the workers
+            peptide_list = [peptide for batch in parse_batches() for peptide in batch]
+            sharded_proteome = loading.result()
+            with report.stage('shard_matching', items=len(peptide_list), overlapped=True) as record:
+                # Shard tasks run on the pipeline's executor (no second pool while threads are running)
+                uniprot_sequences = sharded_proteome.match(peptide_list, pool)
+                record['shards'] = len(sharded_proteome.shards)
+                record['matched_proteins'] = len(uniprot_sequences)
+            batches[:] = list(chunk_list(peptide_list, max(PEPTIDE_BATCH_SIZE, len(peptide_list) // pool.workers)))
+            tasks = matching_tasks(batches)
+        else:
+            uniprot_sequences = None
+            # Parsed in its own thread, so parsing overlaps the proteome load as well as the matching
+            batch_queue = queue.Queue(PARSE_QUEUE_SIZE)
+            parsing = threads.submit(parse_ahead, parse_batches(), batch_queue, stopping)
+            tasks = matching_tasks(queued_batches(batch_queue, parsing))
+
+        # Batch sizes of the submitted tasks, in order, so each result can be accounted for
+        submitted = deque()
+
+        def pool_tasks():
+            # Pulled by the executor as slots free up; matching starts once the proteome is loaded
+            sequences = loading.result() if uniprot_sequences is None else uniprot_sequences
+            for ptm_type, batch in tasks:
+                submitted.append(len(batch))
+                yield ptm_type, batch, sequences
+
+        results = pool.imap(process_peptide_batch, pool_tasks(), pool.workers * BATCHES_PER_WORKER)
+        if uniprot_sequences is None:
+            uniprot_sequences = loading.result()
+        writer = FastaWriter(output_file, uniprot_sequences, include_global_protein_entries,
+                             output_mode=output_mode, letter_codes=letter_codes, window_cleavages=window_cleavages, enzyme=enzyme,
+                             decoy_method=decoy_method, decoy_prefix=decoy_prefix, decoy_seed=decoy_seed)
+        with writer:
+            writing = threads.submit(drain_entries, writer, entry_queue, progress)
+            try:
+                with report.stage('peptide_matching', overlapped=True) as record:
+                    progress('match', 0, 1)
+                    for chunk_ptm_entries, chunk_missing_peptides, chunk_inferred_protein_ids in results:
+                        # Merge per-batch entries, missing peptides and inferred proteins
+                        missing_peptides.extend(chunk_missing_peptides)
+                        inferred_protein_ids.update(chunk_inferred_protein_ids)
+                        entry_queue.put(chunk_ptm_entries)
+                        ptm_entries_written += len(chunk_ptm_entries)
+                        counts['matched'] += submitted.popleft()
+                        progress('match', counts['matched'], counts['peptides'] * len(selected_types))
+                    record['items'] = counts['matched']
+                    progress('match', counts['matched'], counts['matched'], finished=True)
+            finally:
+                entry_queue.put(None)
+            writing.result()
+            with report.stage('write_fasta', items=ptm_entries_written, overlapped=True) as record:
+                output_stats = writer.close(inferred_protein_ids)
+                record['output_stats'] = output_stats
+        pipeline_record['items'] = counts['peptides']
+
+    with report.stage('write_missing_info', items=len(missing_peptides)):
+        missing_report = write_missing_info(os.path.dirname(output_file), missing_peptides)
+    progress('write', ptm_entries_written, ptm_entries_written, finished=True)
+
+    run_report_file = report.save(output_file + REPORT_SUFFIX)
+
+    return {
+        'output_file': output_file,
+        'missing_info_file': missing_report['file'],
+        'missing_counts': missing_report['counts'],
+        'shared_info_file': missing_report['shared_file'],
+        'shared_count': missing_report['shared_count'],
+        'total_entries': output_stats['total_entries'],
+        'unique_protein_ids': output_stats['unique_protein_ids'],
+        'output_stats': output_stats,
+        'elapsed_time': time.time() - start_time,
+        'run_report': report.to_dict(),
+        'run_report_file': run_report_file,
+        'profile': profile_record if profile else None,
+    }
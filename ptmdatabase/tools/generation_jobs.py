@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from .generation import GENERATION_STAGES, generate_database
+
+# Background generation jobs. Jobs live in this module for the lifetime of the server process, so a
+# page refresh or a new browser session can reattach to them by ID. A single worker thread runs the
+# queued jobs one after another; each job still parallelizes its matching over its executor backend
+# (a process pool by default, see tools.executors).
+
+class GenerationJob:
+    def __init__(self, params):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.params = params
+        self.status = 'queued'
+        self.current_stage = None
+        self.stages = {stage: {'done': 0, 'total': 0, 'started': None, 'finished': None} for stage in GENERATION_STAGES}
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    # Stages overlap, so each keeps its own clock: started on its first update, finished when the
+    # pipeline reports it complete. current_stage is the most recently updated stage.
+    def update(self, stage, done, total, finished=False):
+        now = time.time()
+        with self.lock:
+            info = self.stages[stage]
+            if info['started'] is None:
+                info['started'] = now
+            if finished:
+                info['finished'] = now
+            info['done'] = done
+            info['total'] = total
+            self.current_stage = stage
+
+    def run(self):
+        with self.lock:
+            self.status = 'running'
+            self.started_at = time.time()
+        try:
+            result = generate_database(progress=self.update, **self.params)
+        except Exception:
+            with self.lock:
+                self.status = 'failed'
+                self.error = traceback.format_exc()
+        else:
+            with self.lock:
+                self.status = 'done'
+                self.result = result
+        finally:
+            with self.lock:
+                self.finished_at = time.time()
+                # Stages cut short by a failure stop their clocks when the job ends
+                for info in self.stages.values():
+                    if info['started'] is not None and info['finished'] is None:
+                        info['finished'] = self.finished_at
+
+    # Thread-safe copy of the job state for the UI, with per-stage throughput in items/s
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            stages = {}
+            for stage, info in self.stages.items():
+                info = dict(info)
+                elapsed = ((info['finished'] or now) - info['started']) if info['started'] else 0.0
+                info['elapsed'] = elapsed
+                info['throughput'] = info['done'] / elapsed if elapsed > 0 else 0.0
+                stages[stage] = info
+            return {
+                'job_id': self.job_id,
+                'params': dict(self.params),
+                'status': self.status,
+                'current_stage': self.current_stage,
+                'stages': stages,
+                'result': self.result,
+                'error': self.error,
+                'submitted_at': self.submitted_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+jobs = {}
+job_queue = queue.Queue()
+registry_lock = threading.Lock()
+worker_thread = None
+
+def worker_loop():
+    while True:
+        job = job_queue.get()
+        try:
+            job.run()
+        finally:
+            job_queue.task_done()
+
+def ensure_worker():
+    global worker_thread
+    with registry_lock:
+        if worker_thread is None or not worker_thread.is_alive():
+            worker_thread = threading.Thread(target=worker_loop, name='generation-worker', daemon=True)
+            worker_thread.start()
+
+# Queue a generation run; params are passed to generate_database. Returns the job ID.
+def submit_generation_job(**params):
+    job = GenerationJob(params)
+    with registry_lock:
+        jobs[job.job_id] = job
+    ensure_worker()
+    job_queue.put(job)
+    return job.job_id
+
+def get_job(job_id):
+    with registry_lock:
+        job = jobs.get(job_id)
+    return job.snapshot() if job else None
+
+# Snapshots of every job, most recently submitted first
+def list_jobs():
+    with registry_lock:
+        all_jobs = list(jobs.values())
+    return [job.snapshot() for job in sorted(all_jobs, key=lambda job: job.submitted_at, reverse=True)]
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+
+# Random-access index over a PTM library FASTA (e.g. Phosphosite.fasta), stored as an SQLite sidecar.
+# Every record is indexed by accession and site with its byte offset and length in the FASTA, so a
+# single entry is read with one seek and a protein's entries with one range query, without loading
+# the library. Multi-site entries (sp|ID|S15P_T20P|...) get one row per site; proteome entries
+# (sp|ID|NAME ...) are indexed with an empty site.
+
+INDEX_SUFFIX = '.index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (accession TEXT NOT NULL, site TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS source (size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+"""
+
+def source_stamp(fasta_file):
+    stat = os.stat(fasta_file)
+    return (stat.st_size, stat.st_mtime_ns)
+
+# Accession and sites of a library header: 'sp|P12345|S15P_T20P|NAME_HUMAN ...' -> ('P12345', ['S15P', 'T20P'])
+def parse_library_header(header):
+    fields = header.split(' ', 1)[0].split('|')
+    if len(fields) < 2:
+        return fields[0], ['']
+    if len(fields) >= 4:
+        return fields[1], fields[2].split('_')
+    return fields[1], ['']
+
+# (accession, site, offset, length) for every site of every record, read in binary to keep exact offsets
+def scan_library_records(fasta_file):
+    offset = 0
+    record_start, record_header = None, None
+    with open(fasta_file, 'rb') as file:
+        for line in file:
+            if line.startswith(b'>'):
+                if record_header is not None:
+                    accession, sites = parse_library_header(record_header)
+                    for site in sites:
+                        yield accession, site, record_start, offset - record_start
+                record_start, record_header = offset, line[1:].decode().strip()
+            offset += len(line)
+    if record_header is not None:
+        accession, sites = parse_library_header(record_header)
+        for site in sites:
+            yield accession, site, record_start, offset - record_start
+
+def build_library_index(fasta_file, index_file=None):
+    index_file = index_file or fasta_file + INDEX_SUFFIX
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    connection = sqlite3.connect(index_file)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?)", scan_library_records(fasta_file))
+        connection.execute("CREATE INDEX entries_by_site ON entries (accession, site)")
+        connection.execute("INSERT INTO source VALUES (?, ?)", source_stamp(fasta_file))
+        connection.commit()
+    finally:
+        connection.close()
+    return index_file
+
+
+class LibraryIndex:
+    def __init__(self, fasta_file, index_file):
+        self.fasta_file = fasta_file
+        self.index_file = index_file
+        self.connection = sqlite3.connect(index_file, check_same_thread=False)
+        self.fasta = open(fasta_file, 'rb')
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.connection.close()
+        self.fasta.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read(self, offset, length):
+        with self.lock:
+            self.fasta.seek(offset)
+            record = self.fasta.read(length).decode()
+        lines = record.splitlines()
+        return lines[0][1:], ''.join(lines[1:])
+
+    # (header, sequence) of the entry annotating this site, e.g. entry('P12345', 'S15P'), or None
+    def entry(self, accession, site):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT offset, length FROM entries WHERE accession = ? AND site = ? LIMIT 1", (accession, site)).fetchone()
+        return self.read(*row) if row else None
+
+    # Every (header, sequence) stored for a protein, in file order; multi-site entries appear once
+    def protein_entries(self, accession, include_protein_entry=False):
+        query = "SELECT DISTINCT offset, length FROM entries WHERE accession = ?"
+        if not include_protein_entry:
+            query += " AND site != ''"
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY offset", (accession,)).fetchall()
+        return [self.read(offset, length) for offset, length in rows]
+
+    def sites(self, accession):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT site FROM entries WHERE accession = ? AND site != '' ORDER BY offset", (accession,)).fetchall()
+        return [site for site, in rows]
+
+    def __contains__(self, key):
+        accession, site = key
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM entries WHERE accession = ? AND site = ? LIMIT 1", (accession, site)).fetchone()
+        return row is not None
+
+# Open the index stored next to the library FASTA, building it when missing or stale
+def load_library_index(fasta_file, index_file=None):
+    index_file = index_file or fasta_file + INDEX_SUFFIX
+    is_current = False
+    if os.path.exists(index_file):
+        connection = sqlite3.connect(index_file)
+        try:
+            row = connection.execute("SELECT size, mtime_ns FROM source").fetchone()
+            is_current = row is not None and tuple(row) == source_stamp(fasta_file)
+        except sqlite3.DatabaseError:
+            is_current = False
+        finally:
+            connection.close()
+    if not is_current:
+        build_library_index(fasta_file, index_file)
+    return LibraryIndex(fasta_file, index_file)
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from .database_tools import (
+    extract_modifications,
+    extract_glyco_modifications,
+    find_peptide,
+    glyco_entries,
+    process_modifications,
+)
+from .generation import PTM_TYPES
+from .proteome import load_proteome
+from .proteome_index import load_mapped_proteome_index
+
+# Long-running peptide mapping service: holds the memory-mapped proteome and its k-mer peptide index
+# (tools.proteome_index) and answers "which proteins and protein-level sites does this modified peptide
+# map to?" for batches of peptides, optionally with the rendered PTM entries, over HTTP on a TCP port or
+# a Unix socket (asyncio server). Identical peptides requested concurrently are computed once, and
+# results are kept in an LRU cache.
+#
+#   POST /map     {"peptides": [...], "ptm_type": "Phosphorylation", "render": false}
+#              -> {"results": [{"peptide", "ptm_type", "mappings": [{"protein_id", "start", "sites"}],
+#                               "missing": [reason, ...], "entries": [[header, sequence], ...]}]}
+#   GET /health  -> proteome size and cache statistics
+#
+# Start it with `python -m ptmdatabase.tools.mapping_service serve --fasta uniprot.fasta --port 8765`
+# and query it with MappingClient.
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 100000
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+# The proteome with the k-mer index as its find_all fast path, so peptides are located without
+# scanning the sequence buffer; the index reads the proteome's mapped buffer (no second copy)
+class IndexedProteome(Mapping):
+    def __init__(self, proteome, index):
+        self.proteome = proteome
+        self.index = index
+
+    def __len__(self):
+        return len(self.proteome)
+
+    def __iter__(self):
+        return iter(self.proteome)
+
+    def __contains__(self, protein_id):
+        return protein_id in self.proteome
+
+    def __getitem__(self, protein_id):
+        return self.proteome[protein_id]
+
+    # Same result as Proteome.find_all: proteome order, first occurrence per protein
+    def find_all(self, peptide_sequence, first_only=False):
+        hits = []
+        for protein, start in self.index.locate([peptide_sequence])[0]:
+            protein_id = self.index.protein_ids[protein]
+            if not hits or hits[-1][0] != protein_id:
+                hits.append((protein_id, start))
+                if first_only:
+                    break
+        return hits
+
+# Mapping of one modified peptide: every protein containing it with the protein-level sites, the
+# missing-report reasons and (with render) the PTM entries the generation run would write for it
+# (generate_ptm_entries / generate_ptm_entries_glyco), all from one lookup of the peptide
+def map_peptide(peptide, ptm_type, uniprot_sequences, render=False):
+    glyco = ptm_type in ('N-linked Glycosylation', 'O-linked Glycosylation')
+    unsupported_sites = []
+    if glyco:
+        peptide_sequence, modifications = extract_glyco_modifications(peptide)
+    else:
+        peptide_sequence, modifications = extract_modifications(peptide, ptm_type, unsupported_sites)
+
+    hits = find_peptide(uniprot_sequences, peptide_sequence) if modifications else []
+    mappings = []
+    for protein_id, start in hits:
+        sites = []
+        for mod_residue, mod_annotation, relative_position in modifications:
+            site_position = start + relative_position + 1
+            sites.append(f"{mod_residue}{site_position}[{mod_annotation}]" if glyco else f"{mod_residue}{site_position}{mod_annotation[-1]}")
+        mappings.append({'protein_id': protein_id, 'start': start + 1, 'sites': sites})
+
+    missing = []
+    if not modifications and unsupported_sites:
+        missing.append('unsupported_residue')
+    elif modifications and not hits:
+        missing.append('no_protein_hit')
+    result = {
+        'peptide': peptide,
+        'ptm_type': ptm_type,
+        'mappings': mappings,
+        'missing': missing,
+    }
+    if render:
+        # A shared peptide is written for its first protein, as in a generation run of this peptide alone
+        entries = []
+        if hits:
+            protein_id, start = hits[0]
+            if glyco:
+                entries = glyco_entries(protein_id, start, modifications, uniprot_sequences, ptm_type)
+            else:
+                entries = [process_modifications(peptide_sequence, protein_id, uniprot_sequences, modifications)]
+        result['entries'] = [list(entry) for entry in entries]
+    return result
+
+
+class MappingService:
+    def __init__(self, fasta_file, cache_size=DEFAULT_CACHE_SIZE):
+        self.fasta_file = fasta_file
+        proteome = load_proteome(fasta_file)
+        self.uniprot_sequences = IndexedProteome(proteome, load_mapped_proteome_index(fasta_file, proteome))
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.stats = {'requests': 0, 'peptides': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0}
+
+    def cache_get(self, key):
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+        return result
+
+    def cache_put(self, key, result):
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def compute(self, keys):
+        return [map_peptide(peptide, ptm_type, self.uniprot_sequences, render) for ptm_type, peptide, render in keys]
+
+    # Results for a batch of keys: cache hits are answered directly, keys already being computed for
+    # another request are awaited (coalescing), and the rest are computed together in a worker thread
+    async def map_batch(self, keys):
+        loop = asyncio.get_running_loop()
+        results = {}
+        waiting = {}
+        to_compute = []
+        for key in dict.fromkeys(keys):
+            cached = self.cache_get(key)
+            if cached is not None:
+                results[key] = cached
+                self.stats['cache_hits'] += 1
+            elif key in self.in_flight:
+                waiting[key] = self.in_flight[key]
+                self.stats['coalesced'] += 1
+            else:
+                self.in_flight[key] = loop.create_future()
+                to_compute.append(key)
+
+        if to_compute:
+            try:
+                computed = await loop.run_in_executor(None, self.compute, to_compute)
+            except Exception as exc:
+                for key in to_compute:
+                    future = self.in_flight.pop(key)
+                    future.set_exception(exc)
+                    # Mark retrieved so requests that did not wait on it do not log a warning
+                    future.exception()
+                raise
+            self.stats['computed'] += len(to_compute)
+            for key, result in zip(to_compute, computed):
+                self.cache_put(key, result)
+                self.in_flight.pop(key).set_result(result)
+                results[key] = result
+
+        for key, future in waiting.items():
+            results[key] = await future
+        return [results[key] for key in keys]
+
+    async def handle_map(self, request):
+        ptm_type = request.get('ptm_type', 'Phosphorylation')
+        if ptm_type not in PTM_TYPES:
+            raise ValueError(f"Unsupported PTM type: {ptm_type}")
+        peptides = request.get('peptides')
+        if not isinstance(peptides, list) or not all(isinstance(peptide, str) for peptide in peptides):
+            raise ValueError("'peptides' must be a list of peptide strings")
+        render = bool(request.get('render', False))
+        self.stats['requests'] += 1
+        self.stats['peptides'] += len(peptides)
+        return {'results': await self.map_batch([(ptm_type, peptide, render) for peptide in peptides])}
+
+    def health(self):
+        return {
+            'fasta_file': self.fasta_file,
+            'proteins': len(self.uniprot_sequences),
+            'cache_entries': len(self.cache),
+            'cache_size': self.cache_size,
+            **self.stats,
+        }
+
+    # Minimal HTTP/1.1 with keep-alive: enough for MappingClient, curl and other HTTP clients
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': 'Request body too large'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    if method == 'GET' and path == '/health':
+                        status, payload = 200, self.health()
+                    elif method == 'POST' and path == '/map':
+                        status, payload = 200, await self.handle_map(json.loads(body or b'{}'))
+                    else:
+                        status, payload = 404, {'error': f"No route for {method} {path}"}
+                except (ValueError, KeyError, TypeError) as exc:
+                    status, payload = 400, {'error': str(exc)}
+                except Exception as exc:
+                    status, payload = 500, {'error': f"{type(exc).__name__}: {exc}"}
+                await self.respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        reason = http.client.responses.get(status, '')
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, ready=None):
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+            where = unix_socket
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            where = '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+        print(f"Mapping service for {self.fasta_file} ({len(self.uniprot_sequences)} proteins) listening on {where}")
+        if ready is not None:
+            ready(where)
+        async with server:
+            await server.serve_forever()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+# Client for the mapping service; keeps one connection open across calls
+class MappingClient:
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None, timeout=300):
+        if unix_socket:
+            self.connection = UnixHTTPConnection(unix_socket, timeout)
+        else:
+            self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        data = json.loads(response.read() or b'{}')
+        if response.status != 200:
+            raise RuntimeError(f"Mapping service error {response.status}: {data.get('error')}")
+        return data
+
+    def map(self, peptides, ptm_type='Phosphorylation', render=False):
+        return self.request('POST', '/map', {'peptides': list(peptides), 'ptm_type': ptm_type, 'render': render})['results']
+
+    def health(self):
+        return self.request('GET', '/health')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peptide-to-protein mapping service.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help="Load the proteome and serve mapping requests.")
+    serve.add_argument('--fasta', required=True, help="UniProt FASTA file.")
+    serve.add_argument('--host', default='127.0.0.1', help="Interface to listen on.")
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port to listen on.")
+    serve.add_argument('--unix-socket', help="Listen on this Unix socket instead of a TCP port.")
+    serve.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help="Number of peptide results kept in the LRU cache.")
+    query = subparsers.add_parser('query', help="Map peptides with a running service and print the JSON results.")
+    query.add_argument('peptides', nargs='+', help="Modified peptides, e.g. AAS[79.9663]KTTY.")
+    query.add_argument('--ptm-type', default='Phosphorylation', choices=PTM_TYPES)
+    query.add_argument('--render', action='store_true', help="Include the rendered PTM entries.")
+    query.add_argument('--host', default='127.0.0.1')
+    query.add_argument('--port', type=int, default=DEFAULT_PORT)
+    query.add_argument('--unix-socket')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        start = time.perf_counter()
+        service = MappingService(args.fasta, args.cache_size)
+        print(f"Proteome and peptide index loaded in {time.perf_counter() - start:.1f} s")
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        try:
+            asyncio.run(service.serve(args.host, args.port, args.unix_socket))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    with MappingClient(args.host, args.port, args.unix_socket) as client:
+        json.dump(client.map(args.peptides, args.ptm_type, args.render), sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import re
+import numpy as np
+
+# pandas is imported where files are read, so importing this module stays cheap
+
+# Phosphorylation masses reported in the 'Assigned Modifications' column
+PHOSPHO_MASSES = ('79.9663', '181.0160', '166.9960', '243.0260')
+
+# Modified databases encode phosphosites as B (pS), Z (pT) and X (pY)
+MODIFIED_RESIDUE_TABLE = str.maketrans({'B': 'S', 'Z': 'T', 'X': 'Y'})
+
+# Site keys pack (peptide_id, residue, position) into a single uint64:
+# bits 24-63 hold the peptide ID, bits 16-23 the residue letter and bits 0-15 the position in the peptide.
+PEPTIDE_SHIFT = 24
+RESIDUE_SHIFT = 16
+RESIDUE_MASK = 0xFF
+POSITION_MASK = 0xFFFF
+
+SITE_PATTERN = re.compile(r'(\d+)([A-Z])')
+
+
+def empty_id_array():
+    return np.empty(0, dtype=np.uint64)
+
+# Map values to integer IDs shared across datasets and return them as a sorted unique array
+def to_id_array(values, vocab):
+    ids = [vocab.setdefault(value, len(vocab)) for value in values]
+    return np.unique(np.asarray(ids, dtype=np.uint64))
+
+def encode_site_keys(peptide_ids, residues, positions):
+    peptide_ids = np.asarray(peptide_ids, dtype=np.uint64)
+    residues = np.asarray(residues, dtype=np.uint64)
+    positions = np.asarray(positions, dtype=np.uint64)
+    return (peptide_ids << np.uint64(PEPTIDE_SHIFT)) | (residues << np.uint64(RESIDUE_SHIFT)) | positions
+
+def decode_site_keys(keys):
+    keys = np.asarray(keys, dtype=np.uint64)
+    peptide_ids = keys >> np.uint64(PEPTIDE_SHIFT)
+    residues = (keys >> np.uint64(RESIDUE_SHIFT)) & np.uint64(RESIDUE_MASK)
+    positions = keys & np.uint64(POSITION_MASK)
+    return peptide_ids, residues, positions
+
+# Extract phosphosites of every PSM as packed site keys, plus the S/T/Y counts over all PSMs
+def extract_site_keys(df, peptide_vocab, is_modified=False):
+    import pandas as pd
+    counts = {'S': 0, 'T': 0, 'Y': 0}
+    peptide_ids, residues, positions = [], [], []
+    for peptide, mod_str in zip(df['Peptide'], df['Assigned Modifications']):
+        if pd.isna(mod_str) or mod_str == '':
+            continue
+        if is_modified:
+            mod_str = mod_str.translate(MODIFIED_RESIDUE_TABLE)
+        for m in mod_str.replace(')', '').split(', '):
+            if not any(mass in m for mass in PHOSPHO_MASSES):
+                continue
+            match = SITE_PATTERN.match(m)
+            if not match:
+                continue
+            residue = match.group(2)
+            if residue in counts:
+                counts[residue] += 1
+            peptide_ids.append(peptide_vocab.setdefault(peptide, len(peptide_vocab)))
+            residues.append(ord(residue))
+            positions.append(int(match.group(1)))
+
+    if not peptide_ids:
+        return empty_id_array(), counts
+    return np.unique(encode_site_keys(peptide_ids, residues, positions)), counts
+
+# Set operations on sorted unique arrays
+def count_shared(*arrays):
+    shared = arrays[0]
+    for other in arrays[1:]:
+        shared = np.intersect1d(shared, other, assume_unique=True)
+    return len(shared)
+
+def count_unique(array, *others):
+    unique = array
+    for other in others:
+        unique = np.setdiff1d(unique, other, assume_unique=True)
+    return len(unique)
+
+# Region sizes in the (10, 01, 11) order expected by venn2(subsets=...)
+def venn2_subsets(set1, set2):
+    shared = count_shared(set1, set2)
+    return (len(set1) - shared, len(set2) - shared, shared)
+
+# Region sizes keyed by matplotlib_venn's venn3 label IDs
+def venn3_subsets(set1, set2, set3):
+    in2 = np.isin(set1, set2, assume_unique=True)
+    in3 = np.isin(set1, set3, assume_unique=True)
+    in1_of_2 = np.isin(set2, set1, assume_unique=True)
+    in3_of_2 = np.isin(set2, set3, assume_unique=True)
+    in1_of_3 = np.isin(set3, set1, assume_unique=True)
+    in2_of_3 = np.isin(set3, set2, assume_unique=True)
+    return {
+        '100': int(np.sum(~in2 & ~in3)),
+        '010': int(np.sum(~in1_of_2 & ~in3_of_2)),
+        '110': int(np.sum(in2 & ~in3)),
+        '001': int(np.sum(~in1_of_3 & ~in2_of_3)),
+        '101': int(np.sum(~in2 & in3)),
+        '011': int(np.sum(~in1_of_2 & in3_of_2)),
+        '111': int(np.sum(in2 & in3)),
+    }
+
+# Protein-level site keys pack (protein_index, residue, position): bits 32-63 hold the protein index,
+# bits 24-31 the residue letter and bits 0-23 the 1-based position in the protein.
+PROTEIN_SHIFT = 32
+PROTEIN_RESIDUE_SHIFT = 24
+
+def encode_protein_site_keys(protein_indices, residues, positions):
+    protein_indices = np.asarray(protein_indices, dtype=np.uint64)
+    residues = np.asarray(residues, dtype=np.uint64)
+    positions = np.asarray(positions, dtype=np.uint64)
+    return (protein_indices << np.uint64(PROTEIN_SHIFT)) | (residues << np.uint64(PROTEIN_RESIDUE_SHIFT)) | positions
+
+# Remember the protein each peptide was assigned to in the matrix (first occurrence wins)
+def collect_preferred_proteins(df, preferred_proteins):
+    for peptide, protein_id in zip(df['Peptide'], df['Core Protein ID']):
+        preferred_proteins.setdefault(peptide, protein_id)
+    return preferred_proteins
+
+# Locate every peptide of the vocabulary in the proteome index. Peptides found in several proteins
+# are placed on the protein assigned in the matrix when possible, otherwise on the first hit.
+def map_peptides_to_proteins(peptide_vocab, proteome_index, preferred_proteins=None):
+    peptides = [None] * len(peptide_vocab)
+    for peptide, peptide_id in peptide_vocab.items():
+        peptides[peptide_id] = peptide
+
+    protein_indices = np.full(len(peptides), -1, dtype=np.int64)
+    starts = np.zeros(len(peptides), dtype=np.int64)
+    for peptide_id, (peptide, hits) in enumerate(zip(peptides, proteome_index.locate(peptides))):
+        if not hits:
+            continue
+        protein_index, start = hits[0]
+        preferred = proteome_index.protein_index(preferred_proteins.get(peptide)) if preferred_proteins else None
+        for hit in hits:
+            if hit[0] == preferred:
+                protein_index, start = hit
+                break
+        protein_indices[peptide_id] = protein_index
+        starts[peptide_id] = start
+    return protein_indices, starts
+
+# Convert peptide-relative site keys to protein-level keys; returns the keys and the number of unmapped sites
+def to_protein_site_keys(site_keys, peptide_locations):
+    protein_indices, starts = peptide_locations
+    peptide_ids, residues, positions = decode_site_keys(site_keys)
+    peptide_ids = peptide_ids.astype(np.int64)
+    site_proteins = protein_indices[peptide_ids]
+    mapped = site_proteins >= 0
+    keys = encode_protein_site_keys(
+        site_proteins[mapped],
+        residues[mapped],
+        starts[peptide_ids[mapped]] + positions[mapped].astype(np.int64),
+    )
+    return np.unique(keys), int(np.count_nonzero(~mapped))
+
+# Streaming aggregation: the matrix is read in chunks and only the compact per-dataset structures
+# (sorted ID arrays, S/T/Y counts and the shared vocabularies) are kept, so peak memory depends on
+# the number of unique proteins, peptides and sites rather than on the PSM row count.
+MATRIX_COLUMNS = ('Protein ID', 'Peptide', 'Assigned Modifications')
+DEFAULT_CHUNK_SIZE = 100000
+
+def empty_matrix_aggregate():
+    return {
+        'proteins': empty_id_array(),
+        'peptides': empty_id_array(),
+        'sites': empty_id_array(),
+        'phospho_counts': {'S': 0, 'T': 0, 'Y': 0},
+    }
+
+def aggregate_matrix_file(file_path, protein_vocab, peptide_vocab, is_modified=False, preferred_proteins=None, chunksize=DEFAULT_CHUNK_SIZE):
+    import pandas as pd
+    aggregate = empty_matrix_aggregate()
+    # Read as text: a chunk whose values are all empty would otherwise be float and break the .str calls
+    reader = pd.read_csv(file_path, sep='\t', usecols=lambda column: column.strip() in MATRIX_COLUMNS, dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        chunk.columns = chunk.columns.str.strip()
+        chunk['Core Protein ID'] = chunk['Protein ID'].str.strip()
+        if is_modified:
+            chunk['Peptide'] = chunk['Peptide'].str.translate(MODIFIED_RESIDUE_TABLE)
+        chunk['Assigned Modifications'] = chunk['Assigned Modifications'].fillna('')
+
+        aggregate['proteins'] = np.union1d(aggregate['proteins'], to_id_array(chunk['Core Protein ID'], protein_vocab))
+        aggregate['peptides'] = np.union1d(aggregate['peptides'], to_id_array(chunk['Peptide'], peptide_vocab))
+        sites, counts = extract_site_keys(chunk, peptide_vocab, is_modified)
+        aggregate['sites'] = np.union1d(aggregate['sites'], sites)
+        for residue, count in counts.items():
+            aggregate['phospho_counts'][residue] += count
+        if preferred_proteins is not None:
+            collect_preferred_proteins(chunk, preferred_proteins)
+    return aggregate
@@ -0,0 +1,169 @@
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Opt-in profiling of pipeline runs. A capture writes two files next to the run's output:
+#   <prefix>.pstats     function statistics, readable with pstats / snakeviz
+#   <prefix>.collapsed  collapsed stacks ("thread;outer;inner count"), the input of flamegraph.pl,
+#                       speedscope and inferno
+# Modes:
+#   sampling       a background thread samples the stacks of every thread of the process every
+#                  SAMPLE_INTERVAL seconds; low overhead, and the .pstats times are estimated from
+#                  the samples (call counts are sample counts)
+#   deterministic  cProfile on the calling thread (exact call counts and times, higher overhead),
+#                  plus the stack sampler for the collapsed stacks of all threads
+# Samples of threads blocked in a wait (idle pool threads, a writer waiting for entries) are counted
+# but left out, so the hot functions are the ones doing work.
+# Work running in other processes (pool or cluster workers) is not captured; profile generation with
+# the serial or threads executor to see the matching itself.
+
+PROFILE_MODES = ('sampling', 'deterministic')
+PSTATS_SUFFIX = '.pstats'
+COLLAPSED_SUFFIX = '.collapsed'
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+
+# (file name, function) of the innermost Python frame of a blocked thread; the last two wait in a C
+# queue get (multiprocessing pool task handler, concurrent.futures worker thread)
+IDLE_FUNCTIONS = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('connection.py', '_recv'),
+    ('connection.py', '_poll'),
+    ('socket.py', 'accept'),
+    ('pool.py', '_handle_tasks'),
+    ('thread.py', '_worker'),
+}
+
+# Default mode for the pages, set by `starter.py <data_folder> --profile MODE`
+DEFAULT_PROFILE_MODE = os.environ.get('PTMDATABASE_PROFILE') or None
+
+# pstats key of a code object: (file, first line, function name)
+def code_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+def frame_label(key):
+    filename, line, name = key
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ':')
+
+
+class StackSampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.weights = Counter()
+        self.idle_samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    # Every tick records the stack of each thread (root first) weighted by the wall time since the
+    # previous tick, so the estimated times stay right when the sampler is delayed by the GIL
+    def run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FUNCTIONS:
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(code_key(frame.f_code))
+                    frame = frame.f_back
+                stack = (names.get(thread_id, str(thread_id)),) + tuple(reversed(stack))
+                self.stacks[stack] += 1
+                self.weights[stack] += elapsed
+
+    def write_collapsed(self, collapsed_file):
+        with open(collapsed_file, 'w') as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(';'.join([stack[0].replace(';', ':')] + [frame_label(key) for key in stack[1:]]) + f" {count}\n")
+        return collapsed_file
+
+    # Sampled stacks in the marshalled format of cProfile dumps:
+    # {function: (calls, primitive calls, self time, cumulative time, {caller: calls})}
+    def to_stats(self):
+        counts, own_time, total_time = Counter(), Counter(), Counter()
+        callers = defaultdict(Counter)
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            weight = self.weights[stack]
+            own_time[frames[-1]] += weight
+            for key in set(frames):
+                counts[key] += count
+                total_time[key] += weight
+            for caller, callee in set(zip(frames, frames[1:])):
+                callers[callee][caller] += count
+        return {key: (counts[key], counts[key], own_time[key], total_time[key], dict(callers[key])) for key in counts}
+
+
+# Hottest functions by self time, as rows for st.table / DataFrame display
+def top_functions(stats, limit=TOP_FUNCTIONS, sampled=False):
+    rows = []
+    for key, (_, calls, own, total, _) in sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]:
+        filename, line, name = key
+        rows.append({
+            'Function': name,
+            'Location': f"{filename}:{line}" if line else filename,
+            'Samples' if sampled else 'Calls': calls,
+            'Self time (s)': round(own, 4),
+            'Total time (s)': round(total, 4),
+        })
+    return rows
+
+# Profile the block when mode is set; on exit the .pstats and .collapsed files are written next to
+# output_prefix and the yielded record is filled with their paths and the top functions
+@contextmanager
+def profile_capture(mode, output_prefix, interval=SAMPLE_INTERVAL):
+    record = {'mode': mode}
+    if not mode:
+        yield record
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unsupported profile mode: {mode}. Use one of {', '.join(PROFILE_MODES)}.")
+
+    profiler = cProfile.Profile() if mode == 'deterministic' else None
+    start = time.perf_counter()
+    with StackSampler(interval) as sampler:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+    record['wall_time_s'] = time.perf_counter() - start
+    record['samples'] = sum(sampler.stacks.values())
+    record['idle_samples'] = sampler.idle_samples
+    record['pstats_file'] = output_prefix + PSTATS_SUFFIX
+    record['collapsed_file'] = sampler.write_collapsed(output_prefix + COLLAPSED_SUFFIX)
+    if profiler is not None:
+        profiler.dump_stats(record['pstats_file'])
+    else:
+        with open(record['pstats_file'], 'wb') as file:
+            marshal.dump(sampler.to_stats(), file)
+    record['top_functions'] = top_functions(pstats.Stats(record['pstats_file']), sampled=profiler is None)
@@ -0,0 +1,165 @@
+import mmap
+import os
+from collections.abc import Mapping
+import numpy as np
+from .compression import open_fasta, temporary_file
+
+# Proteome container backed by one contiguous sequence buffer: every protein sequence is written to a
+# sidecar file (separated by '\n') that is memory-mapped read-only, and protein IDs, header bytes and
+# int64 offsets are kept in a small .npz next to it. It behaves like the uniprot_sequences dict
+# ({protein_id: {'header': ..., 'sequence': ...}}, built lazily on access), exposes zero-copy memoryview
+# slices, and pickles as its file paths so pool workers map the same pages instead of copying them.
+
+SEQUENCE_SUFFIX = '.proteome.seq'
+META_SUFFIX = '.proteome.npz'
+SEPARATOR = b'\n'
+
+# Buffers already mapped in this process, shared by every Proteome opened on the same files
+OPEN_PROTEOMES = {}
+
+def source_stamp(fasta_file):
+    stat = os.stat(fasta_file)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def map_file(sequence_file):
+    with open(sequence_file, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Proteome(Mapping):
+    def __init__(self, sequence_file, meta_file):
+        self.sequence_file = sequence_file
+        self.meta_file = meta_file
+        key = (os.path.abspath(sequence_file), os.path.abspath(meta_file))
+        if key not in OPEN_PROTEOMES:
+            with np.load(meta_file, allow_pickle=False) as data:
+                protein_ids = data['protein_ids'].tolist()
+                OPEN_PROTEOMES[key] = {
+                    'buffer': map_file(sequence_file),
+                    'protein_ids': protein_ids,
+                    'lookup': {protein_id: i for i, protein_id in enumerate(protein_ids)},
+                    'starts': data['starts'],
+                    'ends': data['ends'],
+                    'header_blob': data['header_blob'].tobytes(),
+                    'header_offsets': data['header_offsets'],
+                }
+        state = OPEN_PROTEOMES[key]
+        self.buffer = state['buffer']
+        self.protein_ids = state['protein_ids']
+        self.lookup = state['lookup']
+        self.starts = state['starts']
+        self.ends = state['ends']
+        self.header_blob = state['header_blob']
+        self.header_offsets = state['header_offsets']
+
+    # Only the paths travel to worker processes; they reopen (and share) the mapping
+    def __getstate__(self):
+        return {'sequence_file': self.sequence_file, 'meta_file': self.meta_file}
+
+    def __setstate__(self, state):
+        self.__init__(state['sequence_file'], state['meta_file'])
+
+    def __len__(self):
+        return len(self.protein_ids)
+
+    def __iter__(self):
+        return iter(self.protein_ids)
+
+    def __contains__(self, protein_id):
+        return protein_id in self.lookup
+
+    def __getitem__(self, protein_id):
+        i = self.lookup[protein_id]
+        return {'header': self.header_at(i), 'sequence': bytes(self.sequence_at(i)).decode('ascii')}
+
+    def protein_index(self, protein_id):
+        return self.lookup[protein_id]
+
+    def header_at(self, i):
+        return self.header_blob[self.header_offsets[i]:self.header_offsets[i + 1]].decode()
+
+    def sequence_at(self, i):
+        return memoryview(self.buffer)[self.starts[i]:self.ends[i]]
+
+    def sequence_view(self, protein_id):
+        return self.sequence_at(self.lookup[protein_id])
+
+    # (protein_id, start) for every protein containing the peptide, in proteome order and with the first
+    # occurrence per protein (the same result as str.find over each sequence), found with one pass of
+    # mmap.find over the whole buffer. first_only stops at the first protein.
+    def find_all(self, peptide_sequence, first_only=False):
+        needle = peptide_sequence.encode('ascii') if isinstance(peptide_sequence, str) else peptide_sequence
+        hits = []
+        if not needle or SEPARATOR in needle:
+            return hits
+        position = self.buffer.find(needle)
+        while position != -1:
+            i = int(np.searchsorted(self.starts, position, side='right')) - 1
+            hits.append((self.protein_ids[i], position - int(self.starts[i])))
+            if first_only:
+                break
+            # Continue after this protein: only the first occurrence per protein is reported
+            position = self.buffer.find(needle, int(self.ends[i]) + len(SEPARATOR))
+        return hits
+
+
+# (protein_id, header bytes, sequence bytes) for every record of a UniProt FASTA, one at a time
+def read_proteome_records(fasta_file):
+    from Bio import SeqIO
+    with open_fasta(fasta_file) as handle:
+        for record in SeqIO.parse(handle, "fasta"):
+            yield record.id.split('|')[1], record.description.encode(), str(record.seq).encode('ascii')
+
+# Write the sequence buffer and metadata sidecars for a stream of records. Files are written under
+# unique temporary names and moved into place, so existing mappings stay valid and processes building
+# the same sidecars at once do not write into each other's files.
+def write_proteome(records, sequence_file, meta_file, stamp=()):
+    protein_ids, headers, starts, ends = [], [], [], []
+    offset = 0
+    temporary_sequence_file = temporary_file(sequence_file)
+    with open(temporary_sequence_file, 'wb') as file:
+        for protein_id, header, sequence in records:
+            protein_ids.append(protein_id)
+            headers.append(header)
+            starts.append(offset)
+            ends.append(offset + len(sequence))
+            file.write(sequence + SEPARATOR)
+            offset += len(sequence) + len(SEPARATOR)
+
+    header_offsets = np.zeros(len(headers) + 1, dtype=np.int64)
+    header_offsets[1:] = np.cumsum([len(header) for header in headers])
+    temporary_meta_file = temporary_file(meta_file)
+    with open(temporary_meta_file, 'wb') as file:
+        np.savez(
+            file,
+            protein_ids=np.array(protein_ids, dtype=str),
+            starts=np.array(starts, dtype=np.int64),
+            ends=np.array(ends, dtype=np.int64),
+            header_blob=np.frombuffer(b''.join(headers), dtype=np.uint8),
+            header_offsets=header_offsets,
+            source_stamp=np.asarray(stamp, dtype=np.int64),
+        )
+    os.replace(temporary_sequence_file, sequence_file)
+    os.replace(temporary_meta_file, meta_file)
+
+def build_proteome(fasta_file, sequence_file, meta_file):
+    write_proteome(read_proteome_records(fasta_file), sequence_file, meta_file, source_stamp(fasta_file))
+
+# Unmap a proteome's buffer in this process; Proteome objects opened on it before stay usable
+def release_proteome(sequence_file, meta_file):
+    OPEN_PROTEOMES.pop((os.path.abspath(sequence_file), os.path.abspath(meta_file)), None)
+
+# Open the proteome stored next to the FASTA file, building the sidecars when missing or stale
+def load_proteome(fasta_file, sequence_file=None, meta_file=None):
+    sequence_file = sequence_file or fasta_file + SEQUENCE_SUFFIX
+    meta_file = meta_file or fasta_file + META_SUFFIX
+    is_current = False
+    if os.path.exists(sequence_file) and os.path.exists(meta_file):
+        with np.load(meta_file, allow_pickle=False) as data:
+            is_current = tuple(data['source_stamp'].tolist()) == source_stamp(fasta_file)
+    if not is_current:
+        release_proteome(sequence_file, meta_file)
+        build_proteome(fasta_file, sequence_file, meta_file)
+    return Proteome(sequence_file, meta_file)
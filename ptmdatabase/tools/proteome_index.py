@@ -0,0 +1,179 @@
+import os
+import numpy as np
+from .compression import temporary_file
+from .database_tools import load_uniprot_sequences
+
+# Peptide index over a whole proteome: every protein sequence is concatenated into one byte buffer
+# (separated by '\n') and the start offset of every k-mer is stored sorted by its 5-bit packed code.
+# A peptide is located by a binary search on its first k residues followed by a direct comparison
+# at each candidate offset, so a lookup never scans the proteome.
+
+KMER_LENGTH = 6
+BITS_PER_RESIDUE = 5
+SEPARATOR = b'\n'
+INDEX_SUFFIX = '.pepindex.npz'
+KMERS_SUFFIX = '.proteome.kmers.npz'
+
+# Residue letters A-Z map to codes 1-26; everything else (separators, '*', lowercase) maps to 0
+RESIDUE_CODES = np.zeros(256, dtype=np.uint32)
+RESIDUE_CODES[np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype=np.uint8)] = np.arange(1, 27, dtype=np.uint32)
+
+
+def encode_kmer(kmer):
+    code = 0
+    for residue in kmer:
+        residue_code = int(RESIDUE_CODES[residue])
+        if residue_code == 0:
+            return None
+        code = (code << BITS_PER_RESIDUE) | residue_code
+    return code
+
+
+# Sorted k-mer codes and their start offsets for a '\n'-separated sequence buffer (bytes or mmap)
+def build_kmer_index(sequence):
+    residues = RESIDUE_CODES[np.frombuffer(sequence, dtype=np.uint8)]
+    n_kmers = max(len(residues) - KMER_LENGTH + 1, 0)
+    codes = np.zeros(n_kmers, dtype=np.uint32)
+    for offset in range(KMER_LENGTH):
+        codes = (codes << np.uint32(BITS_PER_RESIDUE)) | residues[offset:offset + n_kmers]
+
+    # Drop k-mers that cross a protein boundary
+    invalid = np.concatenate(([0], np.cumsum(residues == 0, dtype=np.int64)))
+    valid = (invalid[KMER_LENGTH:] - invalid[:n_kmers]) == 0
+    positions = np.flatnonzero(valid).astype(np.int64)
+    codes = codes[valid]
+
+    order = np.argsort(codes, kind='stable')
+    return codes[order], positions[order]
+
+
+class ProteomeIndex:
+    def __init__(self, protein_ids, sequence, starts, kmer_codes, kmer_positions):
+        self.protein_ids = list(protein_ids)
+        self.sequence = sequence
+        self.starts = starts
+        self.kmer_codes = kmer_codes
+        self.kmer_positions = kmer_positions
+        self.protein_lookup = {protein_id: i for i, protein_id in enumerate(self.protein_ids)}
+
+    @classmethod
+    def from_sequences(cls, uniprot_sequences):
+        protein_ids = list(uniprot_sequences)
+        sequences = [uniprot_sequences[protein_id]['sequence'].encode('ascii') for protein_id in protein_ids]
+        lengths = np.fromiter((len(seq) + len(SEPARATOR) for seq in sequences), dtype=np.int64, count=len(sequences))
+        starts = np.zeros(len(sequences), dtype=np.int64)
+        if len(sequences) > 1:
+            starts[1:] = np.cumsum(lengths[:-1])
+        sequence = SEPARATOR.join(sequences) + SEPARATOR
+        return cls(protein_ids, sequence, starts, *build_kmer_index(sequence))
+
+    @classmethod
+    def load(cls, index_file):
+        with np.load(index_file, allow_pickle=False) as data:
+            return cls(
+                data['protein_ids'].tolist(),
+                data['sequence'].tobytes(),
+                data['starts'],
+                data['kmer_codes'],
+                data['kmer_positions'],
+            )
+
+    def save(self, index_file, source_stamp=()):
+        temporary_index_file = temporary_file(index_file)
+        with open(temporary_index_file, 'wb') as file:
+            np.savez(
+                file,
+                protein_ids=np.array(self.protein_ids, dtype=str),
+                sequence=np.frombuffer(self.sequence, dtype=np.uint8),
+                starts=self.starts,
+                kmer_codes=self.kmer_codes,
+                kmer_positions=self.kmer_positions,
+                source_stamp=np.asarray(source_stamp, dtype=np.int64),
+            )
+        os.replace(temporary_index_file, index_file)
+
+    def protein_index(self, protein_id):
+        return self.protein_lookup.get(protein_id)
+
+    def protein_at(self, position):
+        return int(np.searchsorted(self.starts, position, side='right')) - 1
+
+    def scan(self, peptide):
+        hits = []
+        position = self.sequence.find(peptide)
+        while position != -1:
+            hits.append(position)
+            position = self.sequence.find(peptide, position + 1)
+        return hits
+
+    def locate(self, peptides):
+        """Return, for every peptide, the list of (protein index, 0-based start) where it occurs."""
+        encoded = [peptide.encode('ascii') for peptide in peptides]
+        prefix_codes = [encode_kmer(peptide[:KMER_LENGTH]) if len(peptide) >= KMER_LENGTH else None for peptide in encoded]
+        searchable = [i for i, code in enumerate(prefix_codes) if code is not None]
+        # Queries in the index dtype: a Python int list would make searchsorted cast the whole index
+        queries = np.asarray([prefix_codes[i] for i in searchable], dtype=self.kmer_codes.dtype)
+        lows = np.searchsorted(self.kmer_codes, queries, side='left')
+        highs = np.searchsorted(self.kmer_codes, queries, side='right')
+        bounds = dict(zip(searchable, zip(lows.tolist(), highs.tolist())))
+
+        results = []
+        for i, peptide in enumerate(encoded):
+            if i in bounds:
+                low, high = bounds[i]
+                candidates = self.kmer_positions[low:high].tolist()
+                positions = sorted(p for p in candidates if self.sequence[p:p + len(peptide)] == peptide)
+            elif peptide:
+                # Peptides shorter than the k-mer (or with non-letter residues) fall back to a buffer scan
+                positions = self.scan(peptide)
+            else:
+                positions = []
+
+            hits = []
+            for position in positions:
+                protein = self.protein_at(position)
+                hits.append((protein, position - int(self.starts[protein])))
+            results.append(hits)
+        return results
+
+
+def source_stamp(fasta_file):
+    stat = os.stat(fasta_file)
+    return (stat.st_size, stat.st_mtime_ns, KMER_LENGTH)
+
+# Load the prebuilt index stored next to the FASTA file, building (and caching) it when missing or stale
+def load_proteome_index(fasta_file, index_file=None):
+    index_file = index_file or fasta_file + INDEX_SUFFIX
+    stamp = source_stamp(fasta_file)
+    if os.path.exists(index_file):
+        with np.load(index_file, allow_pickle=False) as data:
+            is_current = tuple(data['source_stamp'].tolist()) == stamp
+        if is_current:
+            return ProteomeIndex.load(index_file)
+
+    index = ProteomeIndex.from_sequences(load_uniprot_sequences(fasta_file))
+    try:
+        index.save(index_file, stamp)
+    except OSError as e:
+        print(f"Could not cache the proteome index at {index_file}: {e}")
+    return index
+
+# Index over the memory-mapped proteome of fasta_file (tools.proteome.load_proteome): lookups read the
+# mapped sequence buffer instead of a copy of it, and only the k-mer arrays are cached next to the FASTA
+def load_mapped_proteome_index(fasta_file, proteome, kmers_file=None):
+    kmers_file = kmers_file or fasta_file + KMERS_SUFFIX
+    stamp = source_stamp(fasta_file)
+    if os.path.exists(kmers_file):
+        with np.load(kmers_file, allow_pickle=False) as data:
+            if tuple(data['source_stamp'].tolist()) == stamp:
+                return ProteomeIndex(proteome.protein_ids, proteome.buffer, proteome.starts, data['kmer_codes'], data['kmer_positions'])
+
+    kmer_codes, kmer_positions = build_kmer_index(proteome.buffer)
+    try:
+        temporary_kmers_file = temporary_file(kmers_file)
+        with open(temporary_kmers_file, 'wb') as file:
+            np.savez(file, kmer_codes=kmer_codes, kmer_positions=kmer_positions, source_stamp=np.asarray(stamp, dtype=np.int64))
+        os.replace(temporary_kmers_file, kmers_file)
+    except OSError as e:
+        print(f"Could not cache the proteome index at {kmers_file}: {e}")
+    return ProteomeIndex(proteome.protein_ids, proteome.buffer, proteome.starts, kmer_codes, kmer_positions)
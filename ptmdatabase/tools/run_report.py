@@ -0,0 +1,109 @@
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Structured per-stage instrumentation for pipeline runs: wall time, CPU time (including reaped
+# worker processes), peak RSS high-water marks, items processed and throughput. The report is
+# written as JSON next to the run's output.
+
+REPORT_SUFFIX = '.run_report.json'
+
+def peak_rss_mb():
+    """Return the peak RSS of this process and of its reaped children, in MB (None if unavailable)."""
+    if resource is not None:
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        return own, children
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024), None
+    return None, None
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class RunReport:
+    def __init__(self, name, parameters=None):
+        self.name = name
+        self.parameters = parameters or {}
+        self.stages = []
+        self.started_at = time.time()
+
+    # Time a stage; set record['items'] inside the block to report throughput. Overlapped stages run
+    # concurrently inside another stage (pipelined runs): they are reported but not added to the totals,
+    # and their CPU time is that of the whole process while they ran.
+    @contextmanager
+    def stage(self, name, items=None, overlapped=False):
+        record = {'stage': name, 'items': items, 'overlapped': overlapped}
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+        try:
+            yield record
+        finally:
+            record['wall_time_s'] = time.perf_counter() - wall_start
+            record['cpu_time_s'] = cpu_seconds() - cpu_start
+            record['peak_rss_mb'], record['peak_rss_children_mb'] = peak_rss_mb()
+            if record['items'] is not None and record['wall_time_s'] > 0:
+                record['items_per_s'] = record['items'] / record['wall_time_s']
+            else:
+                record['items_per_s'] = None
+            self.stages.append(record)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'total_wall_time_s': sum(stage['wall_time_s'] for stage in self.stages if not stage.get('overlapped')),
+            'total_cpu_time_s': sum(stage['cpu_time_s'] for stage in self.stages if not stage.get('overlapped')),
+            'host': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+            },
+            'parameters': self.parameters,
+            'stages': self.stages,
+        }
+
+    def save(self, report_file):
+        with open(report_file, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+        return report_file
+
+# Report saved next to an output file, or None when there is none
+def load_report(output_file):
+    report_file = output_file + REPORT_SUFFIX
+    if not os.path.exists(report_file):
+        return None
+    with open(report_file) as file:
+        return json.load(file)
+
+# Rows for st.table / DataFrame display
+def report_table(report):
+    rows = []
+    for stage in report['stages']:
+        rows.append({
+            'Stage': f"  {stage['stage']} (overlapped)" if stage.get('overlapped') else stage['stage'],
+            'Wall time (s)': round(stage['wall_time_s'], 3),
+            'CPU time (s)': round(stage['cpu_time_s'], 3),
+            'Peak RSS (MB)': round(stage['peak_rss_mb'], 1) if stage['peak_rss_mb'] is not None else None,
+            'Items': stage['items'],
+            'Items/s': round(stage['items_per_s'], 1) if stage['items_per_s'] is not None else None,
+        })
+    return rows
@@ -0,0 +1,258 @@
+import math
+import numpy as np
+from .compression import open_fasta
+from .database_tools import LETTER_CODES
+from .run_report import load_report
+
+# Search-space estimator: digests FASTA databases in silico and counts the peptide candidates a search
+# engine would index, so a generated PTM database can be compared with a reference proteome searched
+# with variable modifications without running the search. Everything is vectorized over one byte array
+# per block of records: annotations (S[P], N[H5N4], S(P)) are stripped into a per-residue modified flag,
+# cleavage sites come from boolean masks, and peptides are identified by 64-bit polynomial prefix
+# hashes of (residue, modified) codes. Databases are read in blocks of whole records (see
+# read_record_blocks).
+
+# Enzyme -> (cleaved residues, residues blocking cleavage when they follow the site)
+ENZYMES = {
+    'trypsin': ('KR', 'P'),
+    'trypsin/p': ('KR', ''),
+    'lys-c': ('K', ''),
+    'arg-c': ('R', 'P'),
+    'glu-c': ('E', 'P'),
+    'chymotrypsin': ('FWYL', 'P'),
+}
+
+# Fragment ions (b and y) per residue bond, and bytes per indexed fragment in a fragment-ion index
+IONS_PER_BOND = 2
+FRAGMENT_BYTES = 8
+
+HASH_BASE = np.uint64(0x100000001B3)
+SEPARATOR = 0
+
+def byte_mask(values, characters):
+    mask = np.zeros(256, dtype=bool)
+    mask[list(characters.encode())] = True
+    return mask[values]
+
+# Sort-based unique (np.unique's hash-based path is several times slower on millions of uint64 values)
+def sorted_unique(values):
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+# FASTA text in blocks of about block_size characters that end at a record boundary. Peptides never
+# cross a record, so each block is digested on its own and memory is bounded by the block size (plus
+# the unique peptides kept across blocks) instead of several copies of the whole database.
+SEQUENCE_BLOCK_SIZE = 32 * 1024 * 1024
+
+def read_record_blocks(fasta_file, block_size=SEQUENCE_BLOCK_SIZE):
+    remainder = ''
+    with open_fasta(fasta_file) as file:
+        while True:
+            text = file.read(block_size)
+            if not text:
+                break
+            text = remainder + text
+            cut = text.rfind('\n>')
+            if cut == -1:
+                remainder = text
+                continue
+            remainder = text[cut + 1:]
+            yield text[:cut + 1]
+    if remainder:
+        yield remainder
+
+# Sequence bytes of every record of a block, with header lines replaced by a single separator (0)
+def sequence_stream(text):
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    if len(data) == 0:
+        return data
+    newlines = np.flatnonzero(data == ord('\n'))
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(data)]))
+    keep_lines = line_starts < len(data)
+    line_starts, line_ends = line_starts[keep_lines], line_ends[keep_lines]
+    is_header = data[line_starts] == ord('>')
+
+    header_chars = np.repeat(is_header, line_ends - line_starts + 1)[:len(data)]
+    keep = ~header_chars & ~byte_mask(data, '\n\r \t')
+    keep[line_starts[is_header]] = True
+    stream = data[keep].copy()
+    stream[np.cumsum(keep)[line_starts[is_header]] - 1] = SEPARATOR
+    return stream
+
+# Residues and per-residue modified flags: bracketed annotations mark the residue before them, and
+# modified_letters (e.g. 'BZX' for letter-encoded databases) are modified residues themselves
+def parse_annotations(stream, modified_letters=''):
+    opens = byte_mask(stream, '[(')
+    closes = byte_mask(stream, '])')
+    depth = np.cumsum(opens, dtype=np.int64) - np.cumsum(closes, dtype=np.int64)
+    inside = (depth > 0) | closes
+    residue_positions = np.flatnonzero(~inside)
+    residues = stream[residue_positions]
+
+    modified = np.zeros(len(residues), dtype=bool)
+    annotated = np.searchsorted(residue_positions, np.flatnonzero(opens)) - 1
+    modified[annotated[annotated >= 0]] = True
+    if modified_letters:
+        modified |= byte_mask(residues, modified_letters)
+    modified[residues == SEPARATOR] = False
+    return residues, modified
+
+# Start/end (exclusive) of every peptide with up to missed_cleavages missed sites and a length in range
+def digest(residues, enzyme='trypsin', missed_cleavages=2, min_length=7, max_length=50):
+    cleaved, blocking = ENZYMES[enzyme]
+    separators = residues == SEPARATOR
+    following = np.concatenate((residues[1:], [SEPARATOR]))
+    blocked = byte_mask(following, blocking) if blocking else np.zeros(len(residues), dtype=bool)
+    cut_after = byte_mask(residues, cleaved) & ~blocked
+
+    # Fragments between cleavage sites, never crossing a protein separator
+    boundaries = sorted_unique(np.concatenate((np.flatnonzero(cut_after | separators) + 1, np.flatnonzero(separators), [0, len(residues)])))
+    starts, ends = boundaries[:-1], boundaries[1:]
+    real = ~separators[starts]
+    starts, ends = starts[real], ends[real]
+    proteins = np.cumsum(separators)[starts]
+
+    peptide_starts, peptide_ends = [], []
+    for missed in range(missed_cleavages + 1):
+        if missed >= len(starts):
+            break
+        first, last = starts[:len(starts) - missed], ends[missed:]
+        same_protein = proteins[:len(proteins) - missed] == proteins[missed:]
+        lengths = last - first
+        valid = same_protein & (lengths >= min_length) & (lengths <= max_length)
+        peptide_starts.append(first[valid])
+        peptide_ends.append(last[valid])
+    if not peptide_starts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(peptide_starts), np.concatenate(peptide_ends)
+
+# Polynomial hash of every peptide from prefix sums: hash(a, b) = (P[b] - P[a]) * base^-a (mod 2^64)
+def peptide_hashes(codes, starts, ends):
+    n = len(codes)
+    powers = np.full(n + 1, HASH_BASE, dtype=np.uint64)
+    powers[0] = 1
+    powers = np.cumprod(powers, dtype=np.uint64)
+    inverse = np.full(n + 1, pow(int(HASH_BASE), -1, 2 ** 64), dtype=np.uint64)
+    inverse[0] = 1
+    inverse = np.cumprod(inverse, dtype=np.uint64)
+
+    prefix = np.zeros(n + 1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        np.cumsum(codes.astype(np.uint64) * powers[:n], dtype=np.uint64, out=prefix[1:])
+        hashes = (prefix[ends] - prefix[starts]) * inverse[starts]
+        hashes ^= (ends - starts).astype(np.uint64) << np.uint64(56)
+    return hashes
+
+# sum_{j <= max_mods} C(n, j) for every n: the modification forms of a peptide with n modifiable sites
+def variable_forms_table(max_sites, max_variable_mods):
+    return np.array([sum(math.comb(n, j) for j in range(min(n, max_variable_mods) + 1)) for n in range(max_sites + 1)], dtype=np.int64)
+
+# Unique peptides of one block: counts, plus for every unique (annotated) peptide its hash, length,
+# modified flag and number of free variable sites, and the hashes of the plain sequences
+def block_peptides(stream, enzyme, missed_cleavages, min_length, max_length, variable_residues, modified_letters):
+    residues, modified = parse_annotations(stream, modified_letters)
+    starts, ends = digest(residues, enzyme, missed_cleavages, min_length, max_length)
+
+    # Peptide identity includes fixed (annotated) modifications; plain sequences ignore them
+    plain_codes = residues.astype(np.uint64)
+    annotated_codes = plain_codes | (modified.astype(np.uint64) << np.uint64(8))
+    hashes = peptide_hashes(annotated_codes, starts, ends)
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    unique = np.concatenate(([True], hashes[1:] != hashes[:-1])) if len(hashes) else np.zeros(0, dtype=bool)
+    first = order[unique]
+    unique_starts, unique_ends = starts[first], ends[first]
+
+    modified_prefix = np.concatenate(([0], np.cumsum(modified, dtype=np.int64)))
+    site_prefix = np.concatenate(([0], np.cumsum(byte_mask(residues, variable_residues) & ~modified, dtype=np.int64)))
+    return {
+        'proteins': int(np.count_nonzero(residues == SEPARATOR)),
+        'residues': int(np.count_nonzero(residues != SEPARATOR)),
+        'digested_peptides': len(starts),
+        'hashes': hashes[unique],
+        'lengths': unique_ends - unique_starts,
+        'modified': (modified_prefix[unique_ends] - modified_prefix[unique_starts]) > 0,
+        'sites': site_prefix[unique_ends] - site_prefix[unique_starts],
+        'sequence_hashes': sorted_unique(peptide_hashes(plain_codes, starts, ends)),
+    }
+
+# Per-peptide arrays of several blocks as one, keeping the first copy of every peptide
+def merge_peptides(blocks):
+    merged = {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+    order = np.argsort(merged['hashes'], kind='stable')
+    hashes = merged['hashes'][order]
+    first = order[np.concatenate(([True], hashes[1:] != hashes[:-1]))] if len(hashes) else order
+    return {key: values[first] for key, values in merged.items()}
+
+def estimate_search_space(fasta_file, enzyme='trypsin', missed_cleavages=2, min_length=7, max_length=50,
+                          variable_residues='', max_variable_mods=3, modified_letters='', block_size=SEQUENCE_BLOCK_SIZE):
+    counts = {'proteins': 0, 'residues': 0, 'digested_peptides': 0}
+    blocks = [{'hashes': np.zeros(0, dtype=np.uint64), 'lengths': np.zeros(0, dtype=np.int64),
+               'modified': np.zeros(0, dtype=bool), 'sites': np.zeros(0, dtype=np.int64)}]
+    sequence_hashes = [np.zeros(0, dtype=np.uint64)]
+    for text in read_record_blocks(fasta_file, block_size):
+        block = block_peptides(sequence_stream(text), enzyme, missed_cleavages, min_length, max_length, variable_residues, modified_letters)
+        for key in counts:
+            counts[key] += block[key]
+        sequence_hashes.append(block.pop('sequence_hashes'))
+        blocks.append({key: block[key] for key in blocks[0]})
+        # Deduplicate once the new blocks outgrow the merged peptides (each peptide is re-sorted a
+        # logarithmic number of times)
+        if sum(len(block['hashes']) for block in blocks[1:]) >= len(blocks[0]['hashes']):
+            blocks = [merge_peptides(blocks)]
+            sequence_hashes = [sorted_unique(np.concatenate(sequence_hashes))]
+    peptides = merge_peptides(blocks)
+    sequence_hashes = sorted_unique(np.concatenate(sequence_hashes))
+
+    # Variable modifications multiply every unique peptide by its number of modification forms
+    if variable_residues and max_variable_mods > 0:
+        forms = variable_forms_table(max_length, max_variable_mods)[peptides['sites']]
+    else:
+        forms = np.ones(len(peptides['hashes']), dtype=np.int64)
+    fragments = int(np.sum(forms * IONS_PER_BOND * np.maximum(peptides['lengths'] - 1, 0)))
+
+    return {
+        'fasta_file': fasta_file,
+        'proteins': counts['proteins'],
+        'residues': counts['residues'],
+        'digested_peptides': counts['digested_peptides'],
+        'unique_peptides': len(peptides['hashes']),
+        'unique_sequences': len(sequence_hashes),
+        'modified_peptides': int(np.count_nonzero(peptides['modified'])),
+        'candidates': int(forms.sum()),
+        'fragments': fragments,
+        'index_bytes': fragments * FRAGMENT_BYTES,
+    }
+
+# Code letters of a letter-encoded database: the defaults of database_tools.LETTER_CODES plus letter_codes
+def code_letters(letter_codes=None):
+    return ''.join(sorted(set({**LETTER_CODES, **(letter_codes or {})}.values())))
+
+# (output_mode, letter_codes) of a generated database, from the run report written next to it; None
+# when there is no report (the database was not written by generate_database)
+def generation_encoding(generated_fasta):
+    report = load_report(generated_fasta)
+    if report is None:
+        return None
+    parameters = report['parameters']
+    letter_codes = {(residue, annotation): letter for residue, annotation, letter in parameters.get('letter_codes') or []}
+    return parameters.get('output_mode', 'annotated'), letter_codes
+
+# Generated database (modifications fixed in the sequence) versus the reference proteome searched with
+# variable modifications on variable_residues. Ratios below 1 mean a smaller search space / index.
+# Code letters count as modified residues only for databases written with output_mode='letters' (with
+# that run's letter_codes); elsewhere B, Z and X are ordinary UniProt residues.
+def compare_search_space(generated_fasta, reference_fasta, enzyme='trypsin', missed_cleavages=2, min_length=7, max_length=50,
+                         variable_residues='STY', max_variable_mods=3, output_mode='annotated', letter_codes=None):
+    modified_letters = code_letters(letter_codes) if output_mode == 'letters' else ''
+    generated = estimate_search_space(generated_fasta, enzyme, missed_cleavages, min_length, max_length, modified_letters=modified_letters)
+    reference = estimate_search_space(reference_fasta, enzyme, missed_cleavages, min_length, max_length, variable_residues, max_variable_mods)
+    return {
+        'generated': generated,
+        'reference': reference,
+        'search_space_ratio': generated['candidates'] / reference['candidates'] if reference['candidates'] else None,
+        'index_memory_ratio': generated['index_bytes'] / reference['index_bytes'] if reference['index_bytes'] else None,
+    }
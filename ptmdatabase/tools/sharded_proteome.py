@@ -0,0 +1,157 @@
+import json
+import os
+import re
+from collections.abc import Mapping
+import numpy as np
+from .proteome import Proteome, read_proteome_records, write_proteome, release_proteome, source_stamp
+from .compression import temporary_file
+from .proteome_index import ProteomeIndex, build_kmer_index
+
+# Out-of-core proteome for databases larger than RAM (SwissProt+TrEMBL, multi-species). The FASTA is
+# split on disk into shards of about shard_residues residues, each stored like tools.proteome
+# (mapped sequence buffer + .npz metadata) with a k-mer index of its buffer (see tools.proteome_index),
+# so a peptide is located by binary search instead of a scan of the shard. Shards are matched as
+# executor tasks (one per shard), and only the records of proteins that were hit are kept, so memory
+# is bounded by the shards in flight plus the matched proteins rather than by the whole database.
+
+SHARD_SUFFIX = '.shards'
+MANIFEST_FILE = 'manifest.json'
+DEFAULT_SHARD_RESIDUES = 256 * 1024 * 1024
+ANNOTATION_PATTERN = re.compile(r'\[[^\]]*\]')
+
+def clean_peptide_sequence(peptide):
+    return ANNOTATION_PATTERN.sub('', peptide)
+
+def shard_files(shard_dir, i):
+    return os.path.join(shard_dir, f"shard_{i:05d}.seq"), os.path.join(shard_dir, f"shard_{i:05d}.npz"), os.path.join(shard_dir, f"shard_{i:05d}.kmers.npz")
+
+# K-mer index of a written shard; offsets fit in uint32 for shards under 4G residues
+def write_shard_index(sequence_file, meta_file, index_file):
+    proteome = Proteome(sequence_file, meta_file)
+    kmer_codes, kmer_positions = build_kmer_index(proteome.buffer)
+    if len(proteome.buffer) < 2 ** 32:
+        kmer_positions = kmer_positions.astype(np.uint32)
+    temporary_index_file = temporary_file(index_file)
+    with open(temporary_index_file, 'wb') as file:
+        np.savez(file, kmer_codes=kmer_codes, kmer_positions=kmer_positions)
+    os.replace(temporary_index_file, index_file)
+
+# Stream the FASTA into shards; only the records of the shard being filled are held in memory
+def build_sharded_proteome(fasta_file, shard_dir, shard_residues=DEFAULT_SHARD_RESIDUES):
+    os.makedirs(shard_dir, exist_ok=True)
+    stamp = source_stamp(fasta_file)
+    shards = []
+    records, residues = [], 0
+
+    def flush():
+        sequence_file, meta_file, index_file = shard_files(shard_dir, len(shards))
+        release_proteome(sequence_file, meta_file)
+        write_proteome(records, sequence_file, meta_file, stamp)
+        write_shard_index(sequence_file, meta_file, index_file)
+        release_proteome(sequence_file, meta_file)
+        shards.append({'sequence_file': os.path.basename(sequence_file), 'meta_file': os.path.basename(meta_file),
+                       'index_file': os.path.basename(index_file), 'proteins': len(records)})
+
+    for record in read_proteome_records(fasta_file):
+        records.append(record)
+        residues += len(record[2])
+        if residues >= shard_residues:
+            flush()
+            records, residues = [], 0
+    if records or not shards:
+        flush()
+
+    manifest = {'source_stamp': list(stamp), 'shard_residues': shard_residues, 'shards': shards}
+    manifest_file = os.path.join(shard_dir, MANIFEST_FILE)
+    temporary_manifest_file = temporary_file(manifest_file)
+    with open(temporary_manifest_file, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary_manifest_file, manifest_file)
+    return manifest
+
+# Hits of a batch of clean peptides in one shard: {peptide: [(protein_id, start)]} with the first
+# occurrence per protein in proteome order (as Proteome.find_all), plus the records of the hit
+# proteins, read from the shard before it is released
+def match_shard(args):
+    sequence_file, meta_file, index_file, peptides = args
+    proteome = Proteome(sequence_file, meta_file)
+    with np.load(index_file, allow_pickle=False) as data:
+        index = ProteomeIndex(proteome.protein_ids, proteome.buffer, proteome.starts, data['kmer_codes'], data['kmer_positions'])
+    hits, sequences = {}, {}
+    for peptide, locations in zip(peptides, index.locate(peptides)):
+        first_starts = {}
+        for protein, start in locations:
+            first_starts.setdefault(protein, start)
+        if first_starts:
+            hits[peptide] = [(proteome.protein_ids[protein], start) for protein, start in first_starts.items()]
+            for protein_id, _ in hits[peptide]:
+                if protein_id not in sequences:
+                    sequences[protein_id] = proteome[protein_id]
+    del index
+    release_proteome(sequence_file, meta_file)
+    return hits, sequences
+
+
+class ShardedProteome:
+    def __init__(self, shard_dir, manifest):
+        self.shard_dir = shard_dir
+        self.manifest = manifest
+        self.shards = [tuple(os.path.join(shard_dir, shard[key]) for key in ('sequence_file', 'meta_file', 'index_file')) for shard in manifest['shards']]
+
+    def __len__(self):
+        return sum(shard['proteins'] for shard in self.manifest['shards'])
+
+    # Match peptides (annotated or clean) against every shard and merge the hits in shard order, so
+    # each peptide keeps the protein order of the original FASTA. One task per shard goes to `executor`
+    # (a running tools.executors backend, at most one shard per worker in flight), or the shards are
+    # matched in this process. Returns a MatchedProteome usable as uniprot_sequences.
+    def match(self, peptides, executor=None):
+        peptides = sorted({clean_peptide_sequence(peptide) for peptide in peptides})
+        tasks = [(sequence_file, meta_file, index_file, peptides) for sequence_file, meta_file, index_file in self.shards]
+        shard_results = executor.imap(match_shard, tasks, executor.workers) if executor is not None else map(match_shard, tasks)
+        hits, sequences = {}, {}
+        for shard_hits, shard_sequences in shard_results:
+            merge_hits(hits, sequences, shard_hits, shard_sequences)
+        return MatchedProteome(sequences, hits)
+
+def merge_hits(hits, sequences, shard_hits, shard_sequences):
+    for peptide, peptide_hits in shard_hits.items():
+        hits.setdefault(peptide, []).extend(peptide_hits)
+    sequences.update(shard_sequences)
+
+
+# The proteins a peptide batch actually hit, with the precomputed hits as its find_all fast path.
+# Behaves like uniprot_sequences for generate_ptm_entries, generate_ptm_entries_glyco and write_fasta.
+class MatchedProteome(Mapping):
+    def __init__(self, sequences, hits):
+        self.sequences = sequences
+        self.hits = hits
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def __iter__(self):
+        return iter(self.sequences)
+
+    def __getitem__(self, protein_id):
+        return self.sequences[protein_id]
+
+    def find_all(self, peptide_sequence, first_only=False):
+        peptide_hits = self.hits.get(peptide_sequence, [])
+        return peptide_hits[:1] if first_only else list(peptide_hits)
+
+# Open the shards stored next to the FASTA file, (re)building them when missing, stale, built with
+# a different shard size or without k-mer indexes
+def load_sharded_proteome(fasta_file, shard_residues=DEFAULT_SHARD_RESIDUES, shard_dir=None):
+    shard_dir = shard_dir or fasta_file + SHARD_SUFFIX
+    manifest_file = os.path.join(shard_dir, MANIFEST_FILE)
+    manifest = None
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as file:
+            manifest = json.load(file)
+        if (tuple(manifest['source_stamp']) != source_stamp(fasta_file) or manifest['shard_residues'] != shard_residues
+                or not all('index_file' in shard for shard in manifest['shards'])):
+            manifest = None
+    if manifest is None:
+        manifest = build_sharded_proteome(fasta_file, shard_dir, shard_residues)
+    return ShardedProteome(shard_dir, manifest)
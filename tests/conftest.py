@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The tests import ptmdatabase and benchmarks from the repository root, like `python -m benchmarks.run`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_proteome, synthetic_peptides, write_proteome, write_peptide_list  # noqa: E402
+
+# Small synthetic inputs shared by the generation tests: a proteome with shared and missing peptides
+# of every PTM type
+@pytest.fixture(scope='session')
+def synthetic_inputs(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('synthetic')
+    uniprot_sequences = synthetic_proteome(300, seed=1)
+    peptides = synthetic_peptides(uniprot_sequences, 400, seed=1)
+    fasta_file = str(data_dir / 'proteome.fasta')
+    matrix_file = str(data_dir / 'peptides.tsv')
+    write_proteome(fasta_file, uniprot_sequences)
+    write_peptide_list(matrix_file, peptides)
+    return {'fasta_file': fasta_file, 'matrix_file': matrix_file, 'uniprot_sequences': uniprot_sequences}
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from ptmdatabase.tools.database_tools import RESIDUE_TOKEN_PATTERN, decoy_sequence
+
+SEQUENCES = [
+    'MS[P]EKLLT[P]YRPAGK[A]EEN[H5N4F1]GTR',
+    'MPEPTIDEK',
+    'KRKR',
+    'MAS[P]T[P]Y[P]',
+    '',
+]
+
+def tokens(sequence):
+    return RESIDUE_TOKEN_PATTERN.findall(sequence)
+
+@pytest.mark.parametrize('sequence', SEQUENCES)
+@pytest.mark.parametrize('method', ['reverse', 'pseudo-reverse'])
+def test_reversing_twice_gives_the_target(sequence, method):
+    assert decoy_sequence(decoy_sequence(sequence, method), method) == sequence
+
+@pytest.mark.parametrize('sequence', SEQUENCES)
+@pytest.mark.parametrize('method', ['reverse', 'pseudo-reverse', 'shuffle'])
+def test_decoys_keep_residues_with_their_modifications(sequence, method):
+    decoy = decoy_sequence(sequence, method, random.Random(0))
+    assert sorted(tokens(decoy)) == sorted(tokens(sequence))
+
+@pytest.mark.parametrize('sequence', SEQUENCES)
+@pytest.mark.parametrize('method', ['pseudo-reverse', 'shuffle'])
+def test_tryptic_decoys_keep_cleavage_sites(sequence, method):
+    decoy = decoy_sequence(sequence, method, random.Random(0))
+    target_tokens, decoy_tokens = tokens(sequence), tokens(decoy)
+    assert [i for i, token in enumerate(target_tokens) if token[0] in 'KR'] == [i for i, token in enumerate(decoy_tokens) if token[0] in 'KR']
+
+def test_shuffle_is_reproducible():
+    sequence = SEQUENCES[0]
+    assert decoy_sequence(sequence, 'shuffle', random.Random('0:header')) == decoy_sequence(sequence, 'shuffle', random.Random('0:header'))
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match='Unsupported decoy method'):
+        decoy_sequence('MPEPTIDEK', 'scramble')
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from ptmdatabase.tools.database_tools import ANNOTATION_PATTERN, LETTER_CODES, annotated_sites, collect_site_table
+from ptmdatabase.tools.executors import CLUSTER_KEY_VARIABLE, LocalCluster
+from ptmdatabase.tools.generation import PTM_TYPES, generate_database
+from ptmdatabase.tools.run_report import load_report
+from ptmdatabase.tools.search_space import generation_encoding
+
+def generate(inputs, output_file, modification_types=PTM_TYPES, **options):
+    options.setdefault('executor', 'serial')
+    return generate_database(inputs['matrix_file'], str(output_file), inputs['fasta_file'], modification_types, **options)
+
+@pytest.fixture(scope='module')
+def serial_database(synthetic_inputs, tmp_path_factory):
+    output_file = tmp_path_factory.mktemp('serial') / 'database.fasta'
+    result = generate(synthetic_inputs, output_file)
+    return output_file.read_text(), result
+
+@pytest.mark.parametrize('executor', ['threads', 'processes'])
+def test_executor_backends_write_the_same_database(synthetic_inputs, serial_database, tmp_path, executor):
+    output_file = tmp_path / 'database.fasta'
+    result = generate(synthetic_inputs, output_file, executor=executor, workers=2)
+    assert output_file.read_text() == serial_database[0]
+    assert result['missing_counts'] == serial_database[1]['missing_counts']
+    assert result['shared_count'] == serial_database[1]['shared_count']
+
+def test_cluster_backend_writes_the_same_database(synthetic_inputs, serial_database, tmp_path, monkeypatch):
+    output_file = tmp_path / 'database.fasta'
+    with LocalCluster(2) as cluster:
+        monkeypatch.setenv(CLUSTER_KEY_VARIABLE, cluster.authkey)
+        generate(synthetic_inputs, output_file, executor='cluster', cluster_addresses=cluster.addresses)
+    assert output_file.read_text() == serial_database[0]
+
+def test_sharded_matching_writes_the_same_database(synthetic_inputs, serial_database, tmp_path):
+    output_file = tmp_path / 'database.fasta'
+    generate(synthetic_inputs, output_file, executor='threads', workers=2, shard_residues=40000)
+    assert output_file.read_text() == serial_database[0]
+
+def test_shared_peptides_are_not_reported_missing(serial_database, tmp_path):
+    _, result = serial_database
+    assert 'ambiguous' not in result['missing_counts']
+    assert result['shared_count'] > 0
+    with open(result['shared_info_file']) as file:
+        assert all(line.split('\t')[2] == 'ambiguous' for line in list(file)[1:])
+
+def read_fasta(text):
+    entries = []
+    for record in text.split('>')[1:]:
+        header, _, sequence = record.partition('\n')
+        entries.append((header, sequence.replace('\n', '')))
+    return entries
+
+# Every site of the annotated database appears as its code letter in the letter-encoded database, and
+# decoding the letters gives back the same site table
+def test_letter_encoding_round_trip(synthetic_inputs, serial_database, tmp_path):
+    letter_codes = {('K', 'A'): 'J', ('K', 'U'): 'O'}
+    modification_types = ['Phosphorylation', 'Acetylation', 'Ubiquitination']
+    annotated_file, letters_file = tmp_path / 'annotated.fasta', tmp_path / 'letters.fasta'
+    generate(synthetic_inputs, annotated_file, modification_types)
+    generate(synthetic_inputs, letters_file, modification_types, output_mode='letters', letter_codes=letter_codes)
+
+    codes = {**LETTER_CODES, **letter_codes}
+    site_table, _ = collect_site_table(read_fasta(annotated_file.read_text()), codes)
+    decode = {letter: site for site, letter in codes.items()}
+    uniprot_sequences = synthetic_inputs['uniprot_sequences']
+    decoded = {}
+    for header, sequence in read_fasta(letters_file.read_text()):
+        protein_id = header.split('|')[1]
+        original = uniprot_sequences[protein_id]['sequence']
+        assert len(sequence) == len(original)
+        sites = {position: decode[letter] for position, letter in enumerate(sequence) if letter != original[position]}
+        assert all(original[position] == residue for position, (residue, _) in sites.items())
+        decoded[protein_id] = sites
+    assert decoded == {protein_id: sites for protein_id, sites in site_table.items() if sites}
+    assert {residue for sites in decoded.values() for residue, _ in sites.values()} == set('STYK')
+    assert generation_encoding(str(letters_file)) == ('letters', letter_codes)
+
+# Site windows are exact slices of their protein (WIN=start-end) holding the sites of the header
+def test_site_windows_are_protein_slices(synthetic_inputs, tmp_path):
+    output_file = tmp_path / 'windows.fasta'
+    generate(synthetic_inputs, output_file, ['Phosphorylation'], window_cleavages=1)
+    uniprot_sequences = synthetic_inputs['uniprot_sequences']
+    entries = read_fasta(output_file.read_text())
+    assert entries
+    for header, sequence in entries:
+        protein_id = header.split('|')[1]
+        start, end = (int(value) for value in header.rsplit(' WIN=', 1)[1].split('-'))
+        window = uniprot_sequences[protein_id]['sequence'][start - 1:end]
+        assert ANNOTATION_PATTERN.sub('', sequence) == window
+        sites = header.split('|')[2].split('_')
+        assert [f"{residue}{start + position}P" for position, residue, _ in annotated_sites(sequence)] == sites
+
+def test_failed_run_keeps_the_previous_database(synthetic_inputs, tmp_path):
+    output_file = tmp_path / 'database.fasta'
+    generate(synthetic_inputs, output_file, ['Phosphorylation'])
+    previous = output_file.read_text()
+    # Glycan compositions without a code letter fail the letter-encoded run
+    with pytest.raises(ValueError, match='No code letter'):
+        generate(synthetic_inputs, output_file, ['N-linked Glycosylation'], output_mode='letters')
+    assert output_file.read_text() == previous
+    assert load_report(str(output_file)) is None
+    assert sorted(os.listdir(tmp_path)) == ['database.fasta', 'missing_peptides.tsv', 'shared_peptides.tsv']
+
+def test_decoys_follow_their_targets(synthetic_inputs, serial_database, tmp_path):
+    output_file = tmp_path / 'decoys.fasta'
+    generate(synthetic_inputs, output_file, decoy_method='pseudo-reverse')
+    entries = read_fasta(output_file.read_text())
+    targets, decoys = entries[0::2], entries[1::2]
+    assert targets == read_fasta(serial_database[0])
+    for (target_header, target), (decoy_header, decoy) in zip(targets, decoys):
+        assert decoy_header == 'rev_' + target_header
+        assert sorted(decoy) == sorted(target)
+
+def test_compressed_output_matches(synthetic_inputs, serial_database, tmp_path):
+    import gzip
+    output_file = tmp_path / 'database.fasta.gz'
+    generate(synthetic_inputs, output_file)
+    with gzip.open(output_file, 'rt') as file:
+        assert file.read() == serial_database[0]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ptmdatabase.tools.matrix_tools import aggregate_matrix_file, count_shared, count_unique, venn2_subsets, venn3_subsets
+
+# Sorted unique ID arrays drawn from overlapping ranges, as the matrix aggregation produces them
+def id_arrays(seed, n_arrays=3):
+    rng = np.random.default_rng(seed)
+    return [np.unique(rng.integers(offset, offset + 400, size=300).astype(np.uint64)) for offset in rng.integers(0, 200, size=n_arrays)]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_counts_match_set_operations(seed):
+    arrays = id_arrays(seed)
+    sets = [set(array.tolist()) for array in arrays]
+    assert count_shared(*arrays) == len(sets[0] & sets[1] & sets[2])
+    assert count_shared(arrays[0], arrays[1]) == len(sets[0] & sets[1])
+    assert count_unique(arrays[0], arrays[1], arrays[2]) == len(sets[0] - sets[1] - sets[2])
+    assert count_unique(arrays[2], arrays[0]) == len(sets[2] - sets[0])
+
+@pytest.mark.parametrize('seed', range(5))
+def test_venn2_subsets_match_set_operations(seed):
+    set1, set2 = id_arrays(seed, 2)
+    a, b = set(set1.tolist()), set(set2.tolist())
+    assert venn2_subsets(set1, set2) == (len(a - b), len(b - a), len(a & b))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_venn3_subsets_match_set_operations(seed):
+    arrays = id_arrays(seed)
+    a, b, c = (set(array.tolist()) for array in arrays)
+    assert venn3_subsets(*arrays) == {
+        '100': len(a - b - c),
+        '010': len(b - a - c),
+        '110': len((a & b) - c),
+        '001': len(c - a - b),
+        '101': len((a & c) - b),
+        '011': len((b & c) - a),
+        '111': len(a & b & c),
+    }
+
+def test_empty_arrays():
+    empty = np.zeros(0, dtype=np.uint64)
+    other = np.array([1, 2], dtype=np.uint64)
+    assert count_shared(empty, other) == 0
+    assert venn2_subsets(empty, other) == (0, 2, 0)
+    assert sum(venn3_subsets(empty, empty, other).values()) == 2
+
+def test_aggregation_does_not_depend_on_chunk_size(tmp_path):
+    matrix_file = tmp_path / 'psm.tsv'
+    matrix_file.write_text(
+        "Protein ID\tPeptide\tAssigned Modifications\n"
+        "\t\t\n\t\t\n"
+        "P1 \tASPEK\t2S(79.9663)\n"
+        "P2\tLLTYK\t3T(79.9663), 4Y(79.9663)\n"
+        "P1\tASPEK\t\n"
+    )
+    results = []
+    for chunksize in (1, 2, 100):
+        aggregate = aggregate_matrix_file(str(matrix_file), {}, {}, chunksize=chunksize)
+        results.append((len(aggregate['proteins']), len(aggregate['peptides']), len(aggregate['sites']), aggregate['phospho_counts']))
+    assert results[0] == results[1] == results[2]
+    assert results[0][3] == {'S': 1, 'T': 1, 'Y': 1}
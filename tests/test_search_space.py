@@ -0,0 +1,25 @@
+import pytest
+
+from ptmdatabase.tools.search_space import estimate_search_space
+
+def write_fasta(path, entries):
+    with open(path, 'w') as file:
+        for header, sequence in entries:
+            file.write(f">{header}\n")
+            file.write('\n'.join(sequence[i:i + 60] for i in range(0, len(sequence), 60)) + '\n')
+    return str(path)
+
+# Reading the database in record blocks gives the same estimate as reading it whole
+@pytest.mark.parametrize('block_size', [1, 500, 10000])
+def test_estimate_does_not_depend_on_block_size(synthetic_inputs, block_size):
+    fasta_file = synthetic_inputs['fasta_file']
+    options = dict(enzyme='trypsin', missed_cleavages=2, min_length=7, max_length=50, variable_residues='STY')
+    assert estimate_search_space(fasta_file, block_size=block_size, **options) == estimate_search_space(fasta_file, block_size=10 ** 9, **options)
+
+def test_annotations_and_code_letters_count_as_modified(tmp_path):
+    annotated = write_fasta(tmp_path / 'annotated.fasta', [('sp|P1|S3P|A', 'MAS[P]LLDEKAPGLLK'), ('sp|P2||B', 'MAXLLDEKAPGLLK')])
+    letters = write_fasta(tmp_path / 'letters.fasta', [('sp|P1|S3P|A', 'MABLLDEKAPGLLK'), ('sp|P2||B', 'MAXLLDEKAPGLLK')])
+    options = dict(missed_cleavages=0, min_length=5)
+    assert estimate_search_space(annotated, **options)['modified_peptides'] == 1
+    assert estimate_search_space(letters, modified_letters='BZX', **options)['modified_peptides'] == 2
+    assert estimate_search_space(letters, **options)['modified_peptides'] == 0